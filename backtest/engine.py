@@ -1,32 +1,38 @@
 import asyncio
 import os
 import sys
+import time
 import pandas as pd
 from datetime import datetime, timedelta, timezone
 from loguru import logger
 
-from src.orchestrator import Orchestrator
+from src.orchestrator import Orchestrator, STRATEGY_MAP
 from .session import BacktestSession
+from .signals import PrecomputedSignals
+from .store import HistoryStore, dt_to_ms, ms_to_dt
 import src.utils.telegram_notify as tg
 
 tg.send_telegram_message = lambda message: None
 logger.remove()
 logger.add(sys.stdout, format="<green>{time:HH:mm:ss}</green> | <level>{message}</level>", level="INFO")
 
-async def run_backtest(params=None):
+async def run_backtest(params=None, db_path="data/backtest_results.db", batch_signals=False):
+    """
+    Годовой прогон на истории. True — симуляция дошла до конца без сбоя.
+    batch_signals: сигналы считаются заранее по всей истории (generate_signals),
+    а не вызовом check_signal на каждом скане.
+    """
     history_path = "data/history"
-    test_db_path = "data/backtest_results.db"
+    test_db_path = db_path
     
     if not os.path.exists(history_path):
         logger.error(f"Папка {history_path} не найдена!")
         return
 
     # 1. ПОИСК ФАЙЛОВ
-    all_files = os.listdir(history_path)
+    store = HistoryStore(history_path)
     # Ищем все тикеры, у которых есть ОБА таймфрейма (15 и 60)
-    t15 = {f.split('_')[0] for f in all_files if f.endswith('_15.csv')}
-    t60 = {f.split('_')[0] for f in all_files if f.endswith('_60.csv')}
-    tickers = sorted(list(t15.intersection(t60)))
+    tickers = store.find_tickers(["15", "60"])
     
     if not tickers:
         logger.error(f"Не найдено парных файлов (15 и 60 мин) в {history_path}!")
@@ -37,36 +43,27 @@ async def run_backtest(params=None):
     history = {}
     history_starts = []
     history_ends = []
+    load_start = time.perf_counter()
 
-    # 2. ЗАГРУЗКА
+    # 2. ЗАГРУЗКА (из колоночного кэша, CSV парсится только при изменении)
     for t in tickers:
         for tf in ["15", "60"]:
-            path = f"{history_path}/{t}_{tf}.csv"
             try:
-                df = pd.read_csv(path)
-                
-                # Авто-определение колонки времени
-                time_col = 'time_ms' if 'time_ms' in df.columns else 'time'
-                
-                if time_col == 'time_ms':
-                    # Заменяем utc=True на .dt.tz_localize(None)
-                    df['time'] = pd.to_datetime(df['time_ms'], unit='ms').dt.tz_localize(None)
-                else:
-                    df['time'] = pd.to_datetime(df['time']).dt.tz_localize(None)
-
-                df = df.sort_values('time').reset_index(drop=True)
+                series = store.load(t, tf)
                 
                 # Проверка на пустой файл
-                if df.empty:
+                if series is None:
                     continue
 
-                history[f"{t}_{tf}"] = df
+                history[f"{t}_{tf}"] = series
                 
                 if tf == "15":
-                    history_starts.append(df['time'].min())
-                    history_ends.append(df['time'].max())
+                    history_starts.append(series.start)
+                    history_ends.append(series.end)
             except Exception as e:
-                logger.error(f"Ошибка чтения {path}: {e}")
+                logger.error(f"Ошибка чтения {history_path}/{t}_{tf}.csv: {e}")
+
+    logger.info(f"📦 История загружена за {time.perf_counter() - load_start:.2f} с")
 
     if not history_starts:
         logger.error("Нет валидных дат в файлах истории!")
@@ -103,39 +100,41 @@ async def run_backtest(params=None):
     bot.db.reset_database()
     bot.ws = session_mock 
 
-    # Прогрев индексов
-    for key in history:
-        idx = history[key]['time'].searchsorted(sim_start, side='left')
-        setattr(session_mock, f"_idx_{key}", idx)
+    if batch_signals:
+        bot.signal_source = PrecomputedSignals(session_mock, STRATEGY_MAP, bot.timeframes, params).build(tickers)
 
-    logger.info("🚀 Симуляция запущена...")
-    current_time = sim_start
+    # 5. СОБЫТИЙНЫЕ ЧАСЫ: шаги только там, где что-то может измениться
+    events = session_mock.build_timeline(sim_start, sim_end, scan_minutes=15)
+    start_ms = dt_to_ms(sim_start)
+    total_minutes = int((sim_end - sim_start).total_seconds() // 60) + 1
+
+    logger.info(f"🚀 Симуляция запущена... ({len(events)} событий вместо {total_minutes} минутных шагов)")
     last_print_date = None
     start_perf = datetime.now()
 
     try:
-        while current_time <= sim_end:
+        pos = 0
+        while pos < len(events):
+            event_ms = int(events[pos])
+
+            # Выход по TTL случается между свечами: на первой минуте сетки после дедлайна
+            deadline = bot.next_ttl_deadline()
+            ttl_ms = start_ms + ((dt_to_ms(deadline) - start_ms) // 60_000 + 1) * 60_000 if deadline else None
+            if ttl_ms is not None and ttl_ms < event_ms:
+                event_ms = ttl_ms
+            else:
+                session_mock.seek(pos)
+                pos += 1
+
+            current_time = ms_to_dt(event_ms)
             session_mock.sim_time = current_time
             bot.set_sim_time(current_time)
-            
-            # Быстрое обновление индексов
-            for t in tickers:
-                for tf in ["15", "60"]:
-                    key = f"{t}_{tf}"
-                    if key in history:
-                        df = history[key]
-                        curr_idx = getattr(session_mock, f"_idx_{key}")
-                        while curr_idx < len(df) and df.iloc[curr_idx]['time'] <= current_time:
-                            curr_idx += 1
-                        setattr(session_mock, f"_idx_{key}", curr_idx)
 
             bot.update_open_trades_ws()
 
             if current_time.minute % 15 == 0:
                 await bot.run_parallel_scan()
             
-            current_time += timedelta(minutes=1)
-            
             if current_time.date() != last_print_date:
                 elapsed = datetime.now() - start_perf
                 logger.info(f"📈 {current_time.date()} | Сделок: {bot.db.get_active_trades_count('live')} | Затрачено: {str(elapsed).split('.')[0]}")
@@ -143,8 +142,12 @@ async def run_backtest(params=None):
 
     except Exception as e:
         logger.exception(f"💥 Сбой: {e}")
+        bot.db.flush() # Сделки до сбоя тоже пригодятся для разбора
+        return False
 
+    bot.db.flush()
     logger.success(f"🏁 ТЕСТ ЗАВЕРШЕН!")
+    return True
 
 if __name__ == "__main__":
     asyncio.run(run_backtest())
\ No newline at end of file
@@ -1,54 +1,120 @@
-import pandas as pd
+import numpy as np
 from datetime import datetime, timezone
 
+from src.strategies.window import KlineWindow
+from .store import dt_to_ms
+
 class BacktestSession:
     def __init__(self, history_dict):
         """
-        history_dict: { 'BTCUSDT_15': DataFrame, ... }
+        history_dict: { 'BTCUSDT_15': HistorySeries, ... }
         """
         self.history = history_dict
         self.sim_time = None
+        self._bar_idx = None
+        self._pos = 0
+
+    def build_timeline(self, start, end, scan_minutes=15):
+        """
+        Событийные часы симуляции: минуты, в которые что-то может измениться.
+        Это старт, плановые сканы и начало новой свечи любой серии (сдвиг индекса).
+        Сетка та же, что у старого поминутного цикла (start + N минут), поэтому
+        хронология симуляции не меняется. Индексы свечей на каждое событие
+        считаются заранее одним searchsorted по int64-меткам.
+        """
+        step = 60_000
+        start_ms, end_ms = dt_to_ms(start), dt_to_ms(end)
+        # Сканы: минуты сетки, у которых minute % scan_minutes == 0
+        first_scan = start_ms + ((-(start_ms // step)) % scan_minutes) * step
+        parts = [np.array([start_ms], dtype=np.int64), np.arange(first_scan, end_ms + 1, scan_minutes * step, dtype=np.int64)]
+        for series in self.history.values():
+            times = series.time_ms[(series.time_ms > start_ms) & (series.time_ms <= end_ms)]
+            # Свеча попадает в индекс на первой минуте сетки, не раньше ее открытия
+            parts.append(start_ms + -((start_ms - times) // step) * step)
+        events = np.unique(np.concatenate(parts))
+        events = events[events <= end_ms]
+
+        self._bar_idx = {key: np.searchsorted(series.time_ms, events, side='right') for key, series in self.history.items()}
+        self._pos = 0
+        return events
+
+    def seek(self, pos):
+        """Переключает индексы свечей на событие pos из build_timeline"""
+        self._pos = pos
+
+    def _index(self, key, series):
+        # Индексы заранее посчитаны в build_timeline для мгновенного доступа
+        # Если таймлайна нет (например, при ручном запуске), ищем индекс
+        if self._bar_idx is not None:
+            return int(self._bar_idx[key][self._pos])
+        return int(np.searchsorted(series.time_ms, dt_to_ms(self.sim_time), side='left'))
+
+    def bar_index(self, symbol, interval):
+        """Число свечей серии, доступных на текущий момент (None — серии нет)"""
+        key = f"{symbol}_{interval}"
+        series = self.history.get(key)
+        return None if series is None else self._index(key, series)
+
+    def get_history(self, symbol, interval):
+        """Вся серия целиком в виде KlineWindow — для пакетного расчета сигналов"""
+        series = self.history.get(f"{symbol}_{interval}")
+        if series is None:
+            return KlineWindow.from_klines([])
+        return KlineWindow(series.time_ms, series.open, series.high, series.low, series.close, series.volume)
+
+    def get_window(self, symbol, interval, limit):
+        """
+        Последние limit свечей до текущего момента в виде KlineWindow:
+        read-only срезы предзагруженных колонок, без копирования и без list/DataFrame.
+        """
+        key = f"{symbol}_{interval}"
+        series = self.history.get(key)
+        if series is None:
+            return KlineWindow.from_klines([])
+
+        idx = self._index(key, series)
+        start = max(0, idx - int(limit))
+        return KlineWindow(
+            series.time_ms[start:idx], series.open[start:idx], series.high[start:idx],
+            series.low[start:idx], series.close[start:idx], series.volume[start:idx]
+        )
 
     def get_kline(self, category, symbol, interval, limit, **kwargs):
         key = f"{symbol}_{interval}"
-        df = self.history.get(key)
-        if df is None: 
+        series = self.history.get(key)
+        if series is None:
             return {'retCode': 0, 'result': {'list': []}}
-        
-        # Индекс теперь передается из engine.py для мгновенного доступа
-        # Если индекса нет (например, при первом запуске), ищем его
-        idx = getattr(self, f"_idx_{key}", None)
-        if idx is None:
-            idx = df['time'].searchsorted(self.sim_time, side='left')
-        
+
+        idx = self._index(key, series)
+        start = max(0, idx - int(limit))
+
         # Срез данных (limit свечей до текущего момента)
-        subset = df.iloc[max(0, idx - int(limit)):idx]
-        
-        if subset.empty:
+        if idx <= start:
             return {'retCode': 0, 'result': {'list': []}}
 
         # Возвращаем список в формате Bybit (от новых к старым)
         # Колонки: time_ms, open, high, low, close, volume, turnover
-        res = subset[['time_ms', 'open', 'high', 'low', 'close', 'volume', 'turnover']].values.tolist()
-        return {'retCode': 0, 'result': {'list': res[::-1]}}
+        rows = np.column_stack([
+            series.time_ms[start:idx], series.open[start:idx], series.high[start:idx],
+            series.low[start:idx], series.close[start:idx], series.volume[start:idx], series.turnover[start:idx]
+        ])
+        return {'retCode': 0, 'result': {'list': rows[::-1].tolist()}}
 
     def get_last_price(self, ticker):
         """Цена последней закрытой 15м свечи"""
         key = f"{ticker}_15"
-        df = self.history.get(key)
-        if df is not None:
-            idx = getattr(self, f"_idx_{key}", None)
-            if idx is None:
-                idx = df['time'].searchsorted(self.sim_time, side='left')
+        series = self.history.get(key)
+        if series is not None:
+            idx = self._index(key, series)
             if idx > 0:
-                return float(df.iloc[idx-1]['close'])
+                return float(series.close[idx-1])
         return None
 
     def get_tickers(self, category, symbol=None):
         if symbol:
             price = self.get_last_price(symbol)
             return {'result': {'list': [{'symbol': symbol, 'lastPrice': str(price or 0), 'turnover24h': '50000000'}]}}
-        
+
         unique_symbols = list(set([k.split('_')[0] for k in self.history.keys()]))
         return {'result': {'list': [{'symbol': s, 'lastPrice': '1.0', 'turnover24h': '50000000'} for s in unique_symbols]}}
 
@@ -57,7 +123,7 @@ class BacktestSession:
             'retCode': 0,
             'result': {
                 'list': [{
-                    'totalEquity': '1000', 
+                    'totalEquity': '1000',
                     'availableToWithdraw': '1000',
                     'coin': [{'coin': 'USDT', 'availableToWithdraw': '1000', 'equity': '1000'}]
                 }]
@@ -71,4 +137,4 @@ class BacktestSession:
             'priceFilter': {'tickSize': '0.01'}
         }]}}
     def set_leverage(self, **kwargs): return {'retCode': 0}
-    def get_positions(self, **kwargs): return {'retCode': 0, 'result': {'list': []}}
\ No newline at end of file
+    def get_positions(self, **kwargs): return {'retCode': 0, 'result': {'list': []}}
@@ -0,0 +1,57 @@
+import time
+import numpy as np
+from loguru import logger
+
+class PrecomputedSignals:
+    """
+    Сигналы всех стратегий, посчитанные заранее по всей истории (generate_signals).
+    Во время симуляции сигнал — это просто чтение массивов по индексу текущей
+    свечи, без пересчета индикаторов на каждом скане.
+    """
+    def __init__(self, session, strategy_map, timeframes, params=None):
+        self.session = session
+        self.strategy_map = strategy_map
+        self.timeframes = timeframes
+        self.params = params or {}
+        self.signals = {}
+
+    def build(self, tickers):
+        start = time.perf_counter()
+        for ticker in tickers:
+            for tf in self.timeframes:
+                df = self.session.get_history(ticker, tf)
+                if df.empty:
+                    continue
+
+                htf_trend = None
+                for name, StratClass in self.strategy_map.items():
+                    try:
+                        strat = StratClass(self.session, ticker, tf, None, is_backtest=True, params=self.params)
+                        # Тренд старшего ТФ один на все стратегии тикера
+                        if htf_trend is None:
+                            df_htf, lag_ms = strat._regime.history(self.session, ticker, strat.htf_interval())
+                            htf_trend = strat.batch_htf_trend(df_htf, df['time_ms'], lag_ms)
+                        self.signals[(ticker, tf, name)] = strat.generate_signals(df, htf_trend)
+                    except Exception as e:
+                        logger.error(f"Ошибка расчета сигналов {name}_{tf} для {ticker}: {e}")
+
+        total = sum(int(np.count_nonzero(s['side'])) for s in self.signals.values())
+        logger.info(f"🧮 Сигналы посчитаны за {time.perf_counter() - start:.2f} с ({total} сигналов)")
+        return self
+
+    def get_signal(self, ticker, tf, name):
+        """Сигнал на последней закрытой свече в том же формате, что у check_signal"""
+        arrays = self.signals.get((ticker, tf, name))
+        if arrays is None:
+            return None
+
+        idx = self.session.bar_index(ticker, tf)
+        if not idx or not arrays['side'][idx-1]:
+            return None
+
+        i = idx - 1
+        return {
+            'ticker': ticker, 'signal': 'long' if arrays['side'][i] == 1 else 'short',
+            'entry': float(arrays['entry'][i]), 'sl': float(arrays['sl'][i]), 'tp': float(arrays['tp'][i]),
+            'atr': float(arrays['atr'][i]), 'strategy': f'{name}_{tf}'
+        }
@@ -0,0 +1,147 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from loguru import logger
+
+COLUMNS = ['time_ms', 'open', 'high', 'low', 'close', 'volume', 'turnover']
+CACHE_DIR = ".cache"
+MANIFEST_FILE = "manifest.json"
+CACHE_VERSION = 1
+
+EPOCH = datetime(1970, 1, 1)
+MS = timedelta(milliseconds=1)
+
+
+def ms_to_dt(ms):
+    """Метка в мс (UTC) -> наивный datetime, как в остальном бэктесте"""
+    return EPOCH + timedelta(milliseconds=int(ms))
+
+
+def dt_to_ms(dt):
+    """Наивный datetime (UTC) -> метка в мс"""
+    return (dt.replace(tzinfo=None) - EPOCH) // MS
+
+
+class HistorySeries:
+    """Одна история (тикер + таймфрейм) в виде колонок NumPy поверх memmap"""
+    __slots__ = ('key', 'time_ms', 'open', 'high', 'low', 'close', 'volume', 'turnover')
+
+    def __init__(self, key, columns):
+        self.key = key
+        for col in COLUMNS:
+            setattr(self, col, columns[col])
+
+    def __len__(self):
+        return len(self.time_ms)
+
+    @property
+    def start(self):
+        return ms_to_dt(self.time_ms[0])
+
+    @property
+    def end(self):
+        return ms_to_dt(self.time_ms[-1])
+
+
+class HistoryStore:
+    """
+    Бинарный колоночный кэш истории.
+    CSV парсится один раз: каждая колонка сохраняется в .npy, а в manifest.json
+    пишутся размер/mtime исходника и границы по времени. Дальше файлы
+    открываются через memory mapping, а при изменении CSV кэш пересобирается сам.
+    """
+
+    def __init__(self, history_path="data/history"):
+        self.history_path = history_path
+        self.cache_path = os.path.join(history_path, CACHE_DIR)
+        self.manifest = self._read_manifest()
+
+    def _read_manifest(self):
+        try:
+            with open(os.path.join(self.cache_path, MANIFEST_FILE), encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get('version') == CACHE_VERSION:
+                return manifest
+        except (OSError, ValueError):
+            pass
+        return {'version': CACHE_VERSION, 'series': {}}
+
+    def _write_manifest(self):
+        os.makedirs(self.cache_path, exist_ok=True)
+        path = os.path.join(self.cache_path, MANIFEST_FILE)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(tmp, path)
+
+    def find_tickers(self, timeframes=("15", "60")):
+        """Тикеры, у которых есть CSV на все запрошенные таймфреймы"""
+        all_files = os.listdir(self.history_path)
+        found = [{f.split('_')[0] for f in all_files if f.endswith(f'_{tf}.csv')} for tf in timeframes]
+        return sorted(set.intersection(*found)) if found else []
+
+    def load(self, ticker, interval):
+        """HistorySeries для тикера/таймфрейма или None, если истории нет или она пуста"""
+        key = f"{ticker}_{interval}"
+        src = os.path.join(self.history_path, f"{key}.csv")
+        if not os.path.exists(src):
+            return None
+
+        if not self._is_fresh(key, src):
+            self._build(key, src)
+
+        entry = self.manifest['series'][key]
+        if not entry['rows']:
+            return None
+        series_dir = os.path.join(self.cache_path, key)
+        columns = {col: np.load(os.path.join(series_dir, f"{col}.npy"), mmap_mode='r') for col in COLUMNS}
+        return HistorySeries(key, columns)
+
+    def _is_fresh(self, key, src):
+        entry = self.manifest['series'].get(key)
+        if not entry:
+            return False
+        st = os.stat(src)
+        if entry['size'] != st.st_size or entry['mtime_ns'] != st.st_mtime_ns:
+            return False
+        series_dir = os.path.join(self.cache_path, key)
+        return all(os.path.exists(os.path.join(series_dir, f"{col}.npy")) for col in COLUMNS)
+
+    def _build(self, key, src):
+        """Разовая конвертация CSV -> колонки .npy"""
+        st = os.stat(src)
+        df = pd.read_csv(src)
+
+        # Авто-определение колонки времени
+        if 'time_ms' in df.columns:
+            time_ms = df['time_ms'].to_numpy(dtype=np.int64)
+        else:
+            times = pd.to_datetime(df['time']).dt.tz_localize(None)
+            time_ms = times.to_numpy().astype('datetime64[ms]').astype(np.int64)
+
+        order = np.argsort(time_ms, kind='stable')
+        columns = {'time_ms': time_ms[order]}
+        for col in COLUMNS[1:]:
+            columns[col] = df[col].to_numpy(dtype=np.float64)[order]
+
+        series_dir = os.path.join(self.cache_path, key)
+        os.makedirs(series_dir, exist_ok=True)
+        for col, values in columns.items():
+            path = os.path.join(series_dir, f"{col}.npy")
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, np.ascontiguousarray(values))
+            os.replace(tmp, path)
+
+        rows = len(time_ms)
+        self.manifest['series'][key] = {
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'rows': rows,
+            'start_ms': int(columns['time_ms'][0]) if rows else None,
+            'end_ms': int(columns['time_ms'][-1]) if rows else None,
+        }
+        self._write_manifest()
+        logger.info(f"🗜️ Кэш истории обновлен: {key} ({rows} свечей)")
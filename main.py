@@ -1,13 +1,14 @@
 import asyncio
 import os
-import time
 import sys
+import time
 from dotenv import load_dotenv
-from pybit.unified_trading import HTTP
 from loguru import logger
 
 from src.orchestrator import Orchestrator
 from src.ws_manager import WSManager 
+from src.rest_client import BybitRestClient
+from src.universe import TickerUniverse
 
 # 1. КОНФИГУРАЦИЯ v9_GoldenRatio
 LIVE_PARAMS = {
@@ -23,6 +24,9 @@ LIVE_PARAMS = {
     'fakeout_tp': 2.5
 }
 
+# Расчет стратегий: 0 — в потоках главного процесса, N — в пуле из N процессов
+EVAL_WORKERS = 0
+
 load_dotenv()
 API_KEY = os.getenv('BYBIT_API_KEY')
 API_SECRET = os.getenv('BYBIT_API_SECRET')
@@ -31,41 +35,63 @@ USE_TESTNET = os.getenv('USE_TESTNET', 'False') == 'True'
 logger.remove() 
 logger.add("data/bot_runtime.log", rotation="50 MB", retention="10 days", level="INFO", encoding="utf-8", format="{time:YYYY-MM-DD HH:mm:ss} | {level} | {message}")
 
-async def monitoring_task(bot):
+async def monitoring_task(bot, full_pass_sec=10):
+    # Пересечения уровней от тиков — сразу, полный проход (TTL, цены через HTTP) — раз в full_pass_sec
+    last_pass = 0.0
     while True:
-        try: await asyncio.to_thread(bot.update_open_trades_ws)
-        except Exception as e: logger.error(f"Ошибка в мониторинге: {e}")
-        await asyncio.sleep(10)
+        try:
+            await bot.wait_ticks(timeout=max(0.0, full_pass_sec - (time.monotonic() - last_pass)))
+            await asyncio.to_thread(bot.process_ticks)
+            if time.monotonic() - last_pass >= full_pass_sec:
+                await asyncio.to_thread(bot.update_open_trades_ws)
+                last_pass = time.monotonic()
+            await bot.apply_reselect()
+        except Exception as e:
+            logger.error(f"Ошибка в мониторинге: {e}")
+            await asyncio.sleep(1)
 
-async def scanning_task(bot, ws_manager):
+async def scanning_task(bot, ws_manager, universe):
     scan_interval = 60 
+    version = universe.version
     while True:
         try:
             await bot.run_parallel_scan()
-            if int(time.time()) % 3600 < scan_interval:
-                new_tickers = await asyncio.to_thread(bot.get_market_tickers)
-                ws_manager.subscribe_tickers(new_tickers)
+            # Подписки меняются только вместе с составом вселенной
+            if universe.version != version:
+                version = universe.version
+                ws_manager.subscribe_tickers(universe.watch())
+                ws_manager.subscribe_klines(universe.symbols(), bot.kline_intervals())
         except Exception as e: logger.error(f"Ошибка в сканировании: {e}")
         await asyncio.sleep(scan_interval)
 
 async def main():
     print("🚀 СИСТЕМА ЗАПУЩЕНА. Логи: data/bot_runtime.log")
+    # Один асинхронный REST-клиент (пул соединений + лимиты Bybit) на весь бот
+    client = BybitRestClient(API_KEY, API_SECRET, testnet=USE_TESTNET, recv_window=10000)
     try:
-        session = HTTP(testnet=USE_TESTNET, api_key=API_KEY, api_secret=API_SECRET, recv_window=10000)
-        res = session.get_tickers(category="linear")
-        current_tickers = [t['symbol'] for t in res['result']['list'] if t['symbol'].endswith('USDT') and float(t['turnover24h']) > 20_000_000]
+        await client.start()
+        # Orchestrator работает в потоках (asyncio.to_thread) — ему синхронный фасад клиента
+        session = client.sync()
+        res = await client.get_tickers(category="linear")
+        # Вселенная тикеров: один REST-снимок, дальше обороты из потока тикеров
+        universe = TickerUniverse()
+        universe.seed(res['result']['list'])
+        current_tickers = universe.symbols()
         
-        ws_manager = WSManager(API_KEY, API_SECRET, USE_TESTNET)
-        ws_manager.subscribe_tickers(current_tickers)
+        ws_manager = WSManager(API_KEY, API_SECRET, USE_TESTNET, universe=universe)
+        ws_manager.subscribe_tickers(universe.watch())
         await asyncio.sleep(5)
 
         bot = Orchestrator(
             session=session, ticker_list=current_tickers, db_path="data/trade_bot.db", 
-            is_backtest=False, params=LIVE_PARAMS
+            is_backtest=False, params=LIVE_PARAMS, rest_client=client, eval_workers=EVAL_WORKERS
         )
-        bot.ws = ws_manager
-        await asyncio.gather(monitoring_task(bot), scanning_task(bot, ws_manager))
+        await asyncio.to_thread(bot.attach_ws, ws_manager) # Снимок позиций — синхронным REST
+        ws_manager.subscribe_klines(current_tickers, bot.kline_intervals())
+        try: await asyncio.gather(monitoring_task(bot), scanning_task(bot, ws_manager, universe))
+        finally: bot.shutdown()
     except Exception as e: logger.critical(f"💥 СБОЙ: {e}")
+    finally: await client.close()
 
 if __name__ == "__main__":
     if sys.platform == 'win32': asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
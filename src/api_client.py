@@ -1,58 +1,112 @@
-def get_symbol_info(self, symbol):
-        """Получает точность цены и количества для символа"""
-        try:
-            res = self.session.get_instruments_info(category="linear", symbol=symbol)
-            info = res['result']['list'][0]
-            return {
-                'qty_step': float(info['lotSizeFilter']['qtyStep']),
-                'price_step': float(info['priceFilter']['tickSize']),
-                'min_qty': float(info['lotSizeFilter']['minOrderQty'])
-            }
-        except Exception as e:
-            logger.error(f"Ошибка получения инфо символа {symbol}: {e}")
-            return None
+import threading
+import time
+from loguru import logger
+
+LEVERAGE_NOT_MODIFIED = 110043 # Bybit: такое плечо уже стоит
+
+def wallet_snapshot(account):
+    """Счет UNIFIED (из REST get_wallet_balance или топика wallet) -> {'equity', 'available'}"""
+    equity = float(account.get('totalEquity') or 0)
+    available = 0.0
+    for c in account.get('coin', []):
+        if c.get('coin') == 'USDT':
+            available = float(c.get('availableToWithdraw', 0) or 0)
+            break
+    return {'equity': equity, 'available': available}
 
-def set_leverage(self, symbol, leverage):
-        """Устанавливает плечо на Bybit"""
+
+class InstrumentCache:
+    """
+    Метаданные инструментов (шаг цены, шаг и минимум объема) одним запросом
+    get_instruments_info(category="linear") с периодическим обновлением, и
+    плечо, уже выставленное по каждому символу. Плечо ставится перед первым
+    ордером по символу, дальше ордер — один REST-запрос. После неудачи
+    символ не пробуется повторно retry_sec секунд.
+    """
+    def __init__(self, session, refresh_sec=3600, retry_sec=600):
+        self.session = session
+        self.refresh_sec = refresh_sec
+        self.retry_sec = retry_sec
+        self.updated = 0
+        self._info = {}
+        self._leverage = {}
+        self._failed = {} # символ -> время, раньше которого set_leverage не повторяем
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Полный справочник linear (постранично, до 1000 символов за запрос)"""
         try:
-            self.session.set_leverage(
-                category="linear",
-                symbol=symbol,
-                buyLeverage=str(leverage),
-                sellLeverage=str(leverage)
-            )
+            info, cursor = {}, None
+            while True:
+                params = {'category': "linear", 'limit': 1000}
+                if cursor: params['cursor'] = cursor
+                res = self.session.get_instruments_info(**params)
+                result = res.get('result', {})
+                for item in result.get('list', []):
+                    info[item['symbol']] = self._parse(item)
+                cursor = result.get('nextPageCursor')
+                if not cursor: break
+            if info:
+                with self._lock:
+                    self._info, self.updated = info, time.time()
+                logger.info(f"📚 Справочник инструментов обновлен: {len(info)} символов")
+            return len(info)
         except Exception as e:
-            # Если плечо уже стоит такое же, Bybit вернет ошибку, это нормально
-            passdef get_symbol_info(self, symbol):
-        """Получает точность цены и количества для символа"""
+            logger.error(f"Ошибка загрузки справочника инструментов: {e}")
+            return 0
+
+    @staticmethod
+    def _parse(item):
+        return {
+            'qty_step': float(item['lotSizeFilter']['qtyStep']),
+            'price_step': float(item['priceFilter']['tickSize']),
+            'min_qty': float(item['lotSizeFilter']['minOrderQty'])
+        }
+
+    def get_symbol_info(self, symbol):
+        """Точность цены и количества для символа"""
+        if time.time() - self.updated > self.refresh_sec:
+            self.refresh()
+        with self._lock:
+            info = self._info.get(symbol)
+        if info is not None:
+            return info
+
+        # Новый листинг между обновлениями — запрос только по нему
         try:
             res = self.session.get_instruments_info(category="linear", symbol=symbol)
-            info = res['result']['list'][0]
-            return {
-                'qty_step': float(info['lotSizeFilter']['qtyStep']),
-                'price_step': float(info['priceFilter']['tickSize']),
-                'min_qty': float(info['lotSizeFilter']['minOrderQty'])
-            }
+            info = self._parse(res['result']['list'][0])
+            with self._lock:
+                self._info[symbol] = info
+            return info
         except Exception as e:
             logger.error(f"Ошибка получения инфо символа {symbol}: {e}")
             return None
 
-def set_leverage(self, symbol, leverage):
-        """Устанавливает плечо на Bybit"""
+    def set_leverage(self, symbol, leverage):
+        """Устанавливает плечо на Bybit, если оно еще не выставлено этим процессом"""
+        with self._lock:
+            if self._leverage.get(symbol) == leverage:
+                return True
+            if time.time() < self._failed.get(symbol, 0):
+                return False
         try:
-            self.session.set_leverage(
-                category="linear",
-                symbol=symbol,
-                buyLeverage=str(leverage),
-                sellLeverage=str(leverage)
-            )
+            res = self.session.set_leverage(category="linear", symbol=symbol, buyLeverage=str(leverage), sellLeverage=str(leverage))
+            ok = res.get('retCode') in (0, LEVERAGE_NOT_MODIFIED)
         except Exception as e:
-            # Если плечо уже стоит такое же, Bybit вернет ошибку, это нормально
-            pass
-
-def get_real_balance(self):
-    try:
-        res = self.session.get_wallet_balance(accountType="UNIFIED", coin="USDT")
-        return float(res['result']['list'][0]['totalEquity'])
-    except:
-        return 100.0 # Запасной вариант
\ No newline at end of file
+            # pybit бросает исключение и на "leverage not modified" — это нормально
+            ok = str(LEVERAGE_NOT_MODIFIED) in str(e)
+        with self._lock:
+            if ok:
+                self._leverage[symbol] = leverage
+                self._failed.pop(symbol, None)
+            else:
+                self._failed[symbol] = time.time() + self.retry_sec
+        if not ok: logger.warning(f"⚠️ Плечо {leverage}x для {symbol} не установлено, повтор через {self.retry_sec} с")
+        return ok
+
+    def prepare(self):
+        """Прогрев перед сканом: справочник, если устарел (плечо — только перед ордером)"""
+        if time.time() - self.updated > self.refresh_sec:
+            return self.refresh()
+        return 0
@@ -1,10 +1,18 @@
 import os
+import bisect
+import atexit
+import threading
+from abc import ABC, abstractmethod
 from datetime import datetime, timedelta, timezone
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, desc, func, Index
+from sqlalchemy import create_engine, event, Column, Integer, String, Float, DateTime, Boolean, desc, func, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from loguru import logger
 
+from .trade_book import OpenTradeBook
+from .sql_writer import SqlWriter
+from .strategy_stats import RollingStats
+
 Base = declarative_base()
 
 class Trade(Base):
@@ -33,126 +41,490 @@ class BotSettings(Base):
     value_date = Column(DateTime)
 
 Index('idx_strategy_closed', Trade.strategy_name, Trade.status, Trade.closed_at)
+# Гейтинг скана (недавние закрытия), кулдаун тикера и live-статистика
+Index('idx_status_closed', Trade.status, Trade.closed_at)
+Index('idx_ticker_strategy_closed', Trade.ticker, Trade.strategy_name, Trade.status, Trade.closed_at)
+Index('idx_type_closed', Trade.trade_type, Trade.status, Trade.closed_at)
 
-class DatabaseManager:
-    def __init__(self, db_path="data/trade_bot.db"):
-        os.makedirs(os.path.dirname(db_path), exist_ok=True)
-        self.engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False}, echo=False)
-        Base.metadata.create_all(self.engine)
-        self.Session = sessionmaker(bind=self.engine)
-        self.Trade = Trade
+COOLDOWN_LOSS = timedelta(hours=4) # Пауза тикера после убыточного закрытия
+COOLDOWN_WIN = timedelta(hours=1)  # ... и после прибыльного
+RECENT_MINUTES = 15                # Окно has_recent_trade в скане
 
-    def _get_now(self, current_time=None):
-        dt = current_time if current_time else datetime.now(timezone.utc)
-        return dt.replace(tzinfo=None) if hasattr(dt, 'tzinfo') and dt.tzinfo else dt
+def _naive(dt=None):
+    dt = dt if dt else datetime.now(timezone.utc)
+    return dt.replace(tzinfo=None) if hasattr(dt, 'tzinfo') and dt.tzinfo else dt
 
-    def get_last_reset_time(self):
-        session = self.Session()
-        try:
-            setting = session.query(BotSettings).filter(BotSettings.key == 'last_cycle_reset').first()
-            return setting.value_date if setting else None
-        finally: session.close()
 
-    def save_reset_time(self, reset_time):
-        session = self.Session()
+class TradeLedger(ABC):
+    """
+    Хранилище сделок за DatabaseManager. SqlLedger пишет каждую операцию в SQLite
+    (живой бот), MemoryLedger держит сделки в памяти и сбрасывает их в файл
+    один раз в конце прогона (бэктест).
+    """
+    @abstractmethod
+    def add_trade(self, ticker, strategy, trade_type, side, entry, sl, tp, atr_at_entry=None, amount=0.0, current_time=None): pass
+    @abstractmethod
+    def close_trade(self, trade_id, exit_price, pnl, current_time=None): pass
+    @abstractmethod
+    def set_breakeven(self, trade_id, stop_loss): pass
+    @abstractmethod
+    def get_open_trades(self): pass
+    @abstractmethod
+    def get_open_trade_times(self): pass
+    @abstractmethod
+    def has_open_trade(self, ticker, strategy_name=None, trade_type='paper'): pass
+    @abstractmethod
+    def has_recent_trade(self, ticker, strategy_name, minutes=15): pass
+    @abstractmethod
+    def get_active_trades_count(self, trade_type='paper'): pass
+    @abstractmethod
+    def get_active_count_by_strategy(self, strategy_name, trade_type='paper'): pass
+    @abstractmethod
+    def is_ticker_in_cooldown(self, ticker, current_time=None): pass
+    @abstractmethod
+    def get_live_daily_pnl(self, since_time): pass
+    @abstractmethod
+    def get_detailed_stats(self, strategy_name, hours=24, current_time=None): pass
+    @abstractmethod
+    def check_consecutive_live_losses(self, limit=5, since_time=None): pass
+
+    def reset(self): pass
+    def flush(self): pass
+
+    @abstractmethod
+    def scan_gate(self, current_time=None): pass
+
+    def triggered(self, ticker, price):
+        """Открытые сделки тикера, которые может затронуть цена (надмножество допустимо)"""
+        return [t for t in self.get_open_trades() if t.ticker == ticker]
+
+    def summarize(self, trades):
+        """Сводка по закрытым сделкам (порядок важен для суммы float, как в SQL)"""
+        if not trades: return {'pnl': 0, 'pf': 0, 'wr': 0, 'count': 0}
+        wins = [t.pnl_usd for t in trades if t.pnl_usd > 0]
+        losses = [abs(t.pnl_usd) for t in trades if t.pnl_usd < 0]
+        pf = (sum(wins) / sum(losses)) if sum(losses) > 0 else (10.0 if sum(wins) > 0 else 0.0)
+        return {'pnl': round(sum(t.pnl_usd for t in trades), 2), 'pf': round(pf, 2), 'wr': round((len(wins) / len(trades)) * 100, 1), 'count': len(trades)}
+
+
+class SqlLedger(TradeLedger):
+    """
+    Журнал живого бота. Открытые сделки — в OpenTradeBook: запись сначала
+    меняет книгу, затем уходит в SqlWriter (фоновые пачки коммитов), поэтому
+    вызывающий поток не ждет диск. Чтение закрытых сделок из SQLite идет
+    через _session(): она дожидается отложенных записей (read-your-writes).
+    """
+    def __init__(self, session_factory, writer):
+        self.Session = session_factory
+        self.writer = writer
+        self.book = OpenTradeBook()
+        self.stats = RollingStats()
+        self._id_lock = threading.Lock()
+        self._gate = None # Снимок текущего скана: закрытия во время скана дописываются в него
+        self.reset()
+
+    def reset(self):
+        session = self._session()
         try:
-            rt = reset_time.replace(tzinfo=None) if hasattr(reset_time, 'tzinfo') and reset_time.tzinfo else reset_time
-            setting = session.query(BotSettings).filter(BotSettings.key == 'last_cycle_reset').first()
-            if not setting:
-                session.add(BotSettings(key='last_cycle_reset', value_date=rt))
-            else:
-                setting.value_date = rt
-            session.commit()
+            self.book.load([TradeRecord.from_row(t) for t in session.query(Trade).filter(Trade.status == 'open').all()])
+            # id выдаются в памяти: сделка известна до того, как ее строка попадет в базу
+            self._next_id = (session.query(func.max(Trade.id)).scalar() or 0) + 1
+            since = datetime.now(timezone.utc).replace(tzinfo=None) - self.stats.retention
+            self.stats.load(session.query(Trade.strategy_name, Trade.closed_at, Trade.pnl_usd).filter(
+                Trade.status == 'closed', Trade.closed_at >= since).order_by(Trade.closed_at, Trade.id).all(), since)
         finally: session.close()
 
+    def _session(self):
+        """Сессия для чтения: сначала в базу дописываются отложенные записи"""
+        self.writer.wait()
+        return self.Session()
+
+    def flush(self):
+        self.writer.wait()
+
     def add_trade(self, ticker, strategy, trade_type, side, entry, sl, tp, atr_at_entry=None, amount=0.0, current_time=None):
-        session = self.Session()
-        try:
-            new_trade = Trade(
-                ticker=ticker, strategy_name=strategy, trade_type=trade_type,
-                side=side, entry_price=entry, stop_loss=sl, take_profit=tp,
-                atr_at_entry=atr_at_entry, amount_usd=amount, status='open',
-                created_at=self._get_now(current_time)
-            )
-            session.add(new_trade)
-            session.commit()
-            return new_trade.id
-        finally: session.close()
+        with self._id_lock:
+            trade_id, self._next_id = self._next_id, self._next_id + 1
+        trade = TradeRecord(trade_id, ticker, strategy, trade_type, side, _float(entry), _float(sl), _float(tp),
+                            _float(atr_at_entry), _float(amount), _naive(current_time))
+        self.book.add(trade)
+        row = trade.as_row()
+        self.writer.submit(lambda session: session.add(Trade(**row)))
+        return trade_id
+
+    def close_trade(self, trade_id, exit_price, pnl, current_time=None):
+        # Статус меняет книга под блокировкой: из двух потоков, закрывающих одну сделку, успеет только один
+        trade = self.book.remove(trade_id)
+        if trade is None: return False
+        values = {'exit_price': _float(exit_price), 'pnl_usd': _float(pnl), 'status': 'closed', 'closed_at': _naive(current_time)}
+        for name, value in values.items(): setattr(trade, name, value)
+        self.stats.add(trade.strategy_name, values['closed_at'], values['pnl_usd'])
+        gate = self._gate
+        if gate is not None: gate.record_close(trade)
+        self.writer.submit(lambda session: session.query(Trade).filter(Trade.id == trade_id).update(values))
+        return True
+
+    def set_breakeven(self, trade_id, stop_loss):
+        self.book.set_breakeven(trade_id, _float(stop_loss))
+        self.writer.submit(lambda session: session.query(Trade).filter(Trade.id == trade_id).update({'stop_loss': stop_loss, 'is_breakeven': True}))
+
+    # --- Открытые сделки: из книги в памяти ---
+    def get_open_trades(self):
+        return self.book.open_trades()
+
+    def get_open_trade_times(self):
+        return [(t.strategy_name, t.created_at) for t in self.book.open_trades()]
 
     def has_open_trade(self, ticker, strategy_name=None, trade_type='paper'):
-        session = self.Session()
-        try:
-            query = session.query(Trade).filter(Trade.ticker == ticker, Trade.trade_type == trade_type, Trade.status == 'open')
-            if strategy_name: query = query.filter(Trade.strategy_name == strategy_name)
-            return query.first() is not None
-        finally: session.close()
+        return self.book.has_open(ticker, strategy_name, trade_type)
+
+    def triggered(self, ticker, price):
+        return self.book.triggered(ticker, price)
 
     def has_recent_trade(self, ticker, strategy_name, minutes=15):
-        session = self.Session()
+        if self.book.has_open(ticker, strategy_name, None): return True
+        session = self._session()
         try:
-            exists = session.query(Trade).filter(Trade.ticker == ticker, Trade.strategy_name == strategy_name, Trade.status == 'open').first()
-            if exists: return True
             since = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(minutes=minutes)
             recent = session.query(Trade).filter(Trade.ticker == ticker, Trade.strategy_name == strategy_name, Trade.status == 'closed', Trade.closed_at >= since).first()
             return recent is not None
         finally: session.close()
 
-    def get_active_trades_count(self, trade_type='paper'):
-        session = self.Session()
-        try: return session.query(Trade).filter(Trade.trade_type == trade_type, Trade.status == 'open').count()
+    def scan_gate(self, current_time=None):
+        """
+        Одним запросом — закрытия за максимальное окно кулдауна: последнее закрытие
+        тикера старше окна кулдауна не дает, старше RECENT_MINUTES — не "недавнее"
+        """
+        wall = datetime.now(timezone.utc).replace(tzinfo=None)
+        since = min(_naive(current_time) - max(COOLDOWN_LOSS, COOLDOWN_WIN), wall - timedelta(minutes=RECENT_MINUTES))
+        # Открытая на момент снимка и закрытая во время скана сделка — тоже "недавняя"
+        opened = {(t.ticker, t.strategy_name) for t in self.book.open_trades()}
+        gate = ScanGate({}, {}, lambda t, s: (t, s) in opened or self.book.has_open(t, s, None))
+        # Снимок становится текущим до запроса: закрытие между запросом и возвратом не теряется
+        self._gate = gate
+        session = self._session()
+        try:
+            rows = session.query(Trade.ticker, Trade.strategy_name, Trade.closed_at, Trade.pnl_usd).filter(
+                Trade.status == 'closed', Trade.closed_at >= since).order_by(desc(Trade.closed_at), Trade.id).all()
         finally: session.close()
+        # Уже записанные close_trade закрытия новее строк из базы и остаются
+        for row in rows:
+            gate.last_closed.setdefault(row.ticker, row)
+            gate.last_closed_at.setdefault((row.ticker, row.strategy_name), row.closed_at)
+        return gate
+
+    def get_active_trades_count(self, trade_type='paper'):
+        return self.book.count(trade_type)
 
     def get_active_count_by_strategy(self, strategy_name, trade_type='paper'):
-        session = self.Session()
-        try: return session.query(Trade).filter(Trade.strategy_name == strategy_name, Trade.trade_type == trade_type, Trade.status == 'open').count()
-        finally: session.close()
+        return self.book.count(trade_type, strategy_name)
 
     def is_ticker_in_cooldown(self, ticker, current_time=None):
-        session = self.Session()
-        now = self._get_now(current_time)
+        session = self._session()
+        now = _naive(current_time)
         try:
             last = session.query(Trade).filter(Trade.ticker == ticker, Trade.status == 'closed').order_by(desc(Trade.closed_at)).first()
             if not last or not last.closed_at: return False
-            cooldown = timedelta(hours=4) if last.pnl_usd < 0 else timedelta(hours=1)
+            cooldown = COOLDOWN_LOSS if last.pnl_usd < 0 else COOLDOWN_WIN
             return (now - last.closed_at.replace(tzinfo=None)) < cooldown
         finally: session.close()
 
     def get_live_daily_pnl(self, since_time):
-        session = self.Session()
+        session = self._session()
         try:
-            st = since_time.replace(tzinfo=None) if hasattr(since_time, 'tzinfo') and since_time.tzinfo else since_time
-            res = session.query(func.sum(Trade.pnl_usd)).filter(Trade.trade_type == 'live', Trade.status == 'closed', Trade.closed_at >= st).scalar()
+            res = session.query(func.sum(Trade.pnl_usd)).filter(Trade.trade_type == 'live', Trade.status == 'closed', Trade.closed_at >= _naive(since_time)).scalar()
             return float(res) if res is not None else 0.0
         finally: session.close()
 
-    def close_trade(self, trade_id, exit_price, pnl, current_time=None):
-        session = self.Session()
-        try:
-            trade = session.query(Trade).filter(Trade.id == trade_id).first()
-            if trade:
-                trade.exit_price, trade.pnl_usd, trade.status = exit_price, pnl, 'closed'
-                trade.closed_at = self._get_now(current_time)
-                session.commit()
-        finally: session.close()
-
     def get_detailed_stats(self, strategy_name, hours=24, current_time=None):
-        session = self.Session()
-        now = self._get_now(current_time)
-        since = now - timedelta(hours=hours)
+        since = _naive(current_time) - timedelta(hours=hours)
+        # Окна отбора стратегий (12/24/48 ч) — из корзин в памяти, длиннее хранимого — из базы
+        if self.stats.covers(since): return self.stats.summary(strategy_name, since)
+        session = self._session()
         try:
             trades = session.query(Trade).filter(Trade.strategy_name == strategy_name, Trade.status == 'closed', Trade.closed_at >= since).all()
-            if not trades: return {'pnl': 0, 'pf': 0, 'wr': 0, 'count': 0}
-            wins = [t.pnl_usd for t in trades if t.pnl_usd > 0]
-            losses = [abs(t.pnl_usd) for t in trades if t.pnl_usd < 0]
-            pf = (sum(wins) / sum(losses)) if sum(losses) > 0 else (10.0 if sum(wins) > 0 else 0.0)
-            return {'pnl': round(sum(t.pnl_usd for t in trades), 2), 'pf': round(pf, 2), 'wr': round((len(wins) / len(trades)) * 100, 1), 'count': len(trades)}
+            return self.summarize(trades)
         finally: session.close()
 
     def check_consecutive_live_losses(self, limit=5, since_time=None):
-        session = self.Session()
+        session = self._session()
         try:
             query = session.query(Trade).filter(Trade.trade_type == 'live', Trade.status == 'closed')
             if since_time: query = query.filter(Trade.closed_at >= since_time.replace(tzinfo=None))
             last_trades = query.order_by(desc(Trade.closed_at)).limit(limit).all()
             return len(last_trades) >= limit and all(t.pnl_usd < 0 for t in last_trades)
-        finally: session.close()
\ No newline at end of file
+        finally: session.close()
+
+
+class ScanGate:
+    """
+    Состояние для отбора тикеров и стратегий в скане: последнее закрытие по
+    тикеру, последнее закрытие по (тикер, стратегия) и открытые сделки. Те же
+    ответы, что is_ticker_in_cooldown / has_recent_trade, без запросов к базе.
+    """
+    def __init__(self, last_closed, last_closed_at, has_open):
+        self.last_closed = last_closed       # тикер -> последняя закрытая (closed_at, pnl_usd)
+        self.last_closed_at = last_closed_at # (тикер, стратегия) -> время последнего закрытия
+        self.has_open = has_open             # (тикер, стратегия) -> есть ли открытая сделка
+
+    def in_cooldown(self, ticker, current_time=None):
+        last = self.last_closed.get(ticker)
+        if not last or not last.closed_at: return False
+        cooldown = COOLDOWN_LOSS if last.pnl_usd < 0 else COOLDOWN_WIN
+        return (_naive(current_time) - last.closed_at) < cooldown
+
+    def has_recent_trade(self, ticker, strategy_name, minutes=RECENT_MINUTES):
+        if self.has_open(ticker, strategy_name): return True
+        # Как и в has_recent_trade журналов, окно отсчитывается от настенных часов
+        since = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(minutes=minutes)
+        last = self.last_closed_at.get((ticker, strategy_name))
+        return last is not None and last >= since
+
+    def record_close(self, trade):
+        """Закрытие во время скана: кулдаун и "недавняя" сделка видны без нового снимка"""
+        last = self.last_closed.get(trade.ticker)
+        if last is None or trade.closed_at >= last.closed_at: self.last_closed[trade.ticker] = trade
+        key = (trade.ticker, trade.strategy_name)
+        self.last_closed_at[key] = max(self.last_closed_at.get(key, trade.closed_at), trade.closed_at)
+
+
+class TradeRecord:
+    """Сделка в памяти: те же поля, что у Trade, без ORM"""
+    __slots__ = ('id', 'ticker', 'strategy_name', 'trade_type', 'side', 'entry_price', 'exit_price',
+                 'stop_loss', 'take_profit', 'atr_at_entry', 'is_breakeven', 'leverage', 'amount_usd',
+                 'pnl_usd', 'status', 'created_at', 'closed_at')
+
+    def __init__(self, id, ticker, strategy_name, trade_type, side, entry_price, stop_loss, take_profit, atr_at_entry, amount_usd, created_at):
+        self.id, self.ticker, self.strategy_name, self.trade_type, self.side = id, ticker, strategy_name, trade_type, side
+        self.entry_price, self.stop_loss, self.take_profit = entry_price, stop_loss, take_profit
+        self.atr_at_entry, self.amount_usd, self.created_at = atr_at_entry, amount_usd, created_at
+        self.exit_price, self.closed_at = None, None
+        self.is_breakeven, self.leverage, self.pnl_usd, self.status = False, 3, 0.0, 'open'
+
+    @classmethod
+    def from_row(cls, trade):
+        record = cls.__new__(cls)
+        for name in cls.__slots__: setattr(record, name, getattr(trade, name))
+        return record
+
+    def as_row(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def _float(value):
+    # SQLite возвращает REAL как float: приводим numpy-числа сразу при записи
+    return None if value is None else float(value)
+
+
+class MemoryLedger(TradeLedger):
+    """
+    Журнал сделок бэктеста в памяти. Открытые сделки индексированы по тикеру,
+    счетчики открытых — по типу и стратегии, закрытые лежат в списках в том
+    порядке, в каком их вернул бы SQLite, поэтому ответы совпадают с SqlLedger.
+    """
+    def __init__(self, session_factory):
+        self.Session = session_factory
+        self.reset()
+
+    def reset(self):
+        self.trades = []                # Все сделки, id = позиция + 1
+        self._open = {}                 # id -> сделка (в порядке id)
+        self._open_by_ticker = {}       # тикер -> [открытые сделки]
+        self._open_count = {}           # тип / (стратегия, тип) -> число открытых
+        self._last_closed = {}          # тикер -> последняя закрытая (для кулдауна)
+        self._last_closed_at = {}       # (тикер, стратегия) -> время последнего закрытия
+        self._closed_by_strategy = {}   # стратегия -> закрытые по (closed_at, id)
+        self._closed_live = []          # закрытые live по id
+
+    def _count(self, key, delta):
+        self._open_count[key] = self._open_count.get(key, 0) + delta
+
+    def add_trade(self, ticker, strategy, trade_type, side, entry, sl, tp, atr_at_entry=None, amount=0.0, current_time=None):
+        trade = TradeRecord(len(self.trades) + 1, ticker, strategy, trade_type, side, _float(entry), _float(sl), _float(tp),
+                            _float(atr_at_entry), _float(amount), _naive(current_time))
+        self.trades.append(trade)
+        self._open[trade.id] = trade
+        self._open_by_ticker.setdefault(ticker, []).append(trade)
+        self._count(trade_type, 1)
+        self._count((strategy, trade_type), 1)
+        return trade.id
+
+    def close_trade(self, trade_id, exit_price, pnl, current_time=None):
+        if not 0 < trade_id <= len(self.trades): return False
+        trade = self.trades[trade_id - 1]
+        if trade.status != 'open': return False
+        del self._open[trade.id]
+        self._open_by_ticker[trade.ticker].remove(trade)
+        self._count(trade.trade_type, -1)
+        self._count((trade.strategy_name, trade.trade_type), -1)
+
+        trade.exit_price, trade.pnl_usd, trade.status = _float(exit_price), _float(pnl), 'closed'
+        trade.closed_at = _naive(current_time)
+        bisect.insort(self._closed_by_strategy.setdefault(trade.strategy_name, []), trade, key=lambda t: (t.closed_at, t.id))
+        if trade.trade_type == 'live':
+            bisect.insort(self._closed_live, trade, key=lambda t: t.id)
+        self._track_last_closed(trade)
+        return True
+
+    def _track_last_closed(self, trade):
+        # ORDER BY closed_at DESC в SQLite при равенстве отдает меньший id
+        last = self._last_closed.get(trade.ticker)
+        if last is None or trade.closed_at > last.closed_at or (trade.closed_at == last.closed_at and trade.id < last.id):
+            self._last_closed[trade.ticker] = trade
+        key = (trade.ticker, trade.strategy_name)
+        self._last_closed_at[key] = max(self._last_closed_at.get(key, trade.closed_at), trade.closed_at)
+
+    def set_breakeven(self, trade_id, stop_loss):
+        if 0 < trade_id <= len(self.trades):
+            trade = self.trades[trade_id - 1]
+            trade.stop_loss, trade.is_breakeven = _float(stop_loss), True
+
+    def get_open_trades(self):
+        return list(self._open.values())
+
+    def triggered(self, ticker, price):
+        return list(self._open_by_ticker.get(ticker, ()))
+
+    def get_open_trade_times(self):
+        return [(t.strategy_name, t.created_at) for t in self._open.values()]
+
+    def has_open_trade(self, ticker, strategy_name=None, trade_type='paper'):
+        return any(t.trade_type == trade_type and (not strategy_name or t.strategy_name == strategy_name)
+                   for t in self._open_by_ticker.get(ticker, ()))
+
+    def has_recent_trade(self, ticker, strategy_name, minutes=15):
+        if any(t.strategy_name == strategy_name for t in self._open_by_ticker.get(ticker, ())): return True
+        # Как и в SqlLedger, окно отсчитывается от настенных часов
+        since = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(minutes=minutes)
+        last = self._last_closed_at.get((ticker, strategy_name))
+        return last is not None and last >= since
+
+    def get_active_trades_count(self, trade_type='paper'):
+        return self._open_count.get(trade_type, 0)
+
+    def get_active_count_by_strategy(self, strategy_name, trade_type='paper'):
+        return self._open_count.get((strategy_name, trade_type), 0)
+
+    def is_ticker_in_cooldown(self, ticker, current_time=None):
+        last = self._last_closed.get(ticker)
+        if not last or not last.closed_at: return False
+        cooldown = COOLDOWN_LOSS if last.pnl_usd < 0 else COOLDOWN_WIN
+        return (_naive(current_time) - last.closed_at) < cooldown
+
+    def scan_gate(self, current_time=None):
+        # Индексы журнала и так в памяти: снимок смотрит в них напрямую
+        return ScanGate(self._last_closed, self._last_closed_at,
+                        lambda t, s: any(o.strategy_name == s for o in self._open_by_ticker.get(t, ())))
+
+    def get_live_daily_pnl(self, since_time):
+        st = _naive(since_time)
+        pnls = [t.pnl_usd for t in self._closed_live if t.closed_at >= st]
+        return float(sum(pnls)) if pnls else 0.0
+
+    def get_detailed_stats(self, strategy_name, hours=24, current_time=None):
+        since = _naive(current_time) - timedelta(hours=hours)
+        closed = self._closed_by_strategy.get(strategy_name, [])
+        start = bisect.bisect_left(closed, since, key=lambda t: t.closed_at)
+        return self.summarize(closed[start:])
+
+    def check_consecutive_live_losses(self, limit=5, since_time=None):
+        trades = self._closed_live
+        if since_time: trades = [t for t in trades if t.closed_at >= since_time.replace(tzinfo=None)]
+        last_trades = sorted(trades, key=lambda t: t.closed_at, reverse=True)[:limit]
+        return len(last_trades) >= limit and all(t.pnl_usd < 0 for t in last_trades)
+
+    def flush(self):
+        """Одна транзакция: все сделки прогона уходят в SQLite для анализа (optimize.py)"""
+        if not self.trades: return
+        session = self.Session()
+        try:
+            session.query(Trade).delete()
+            session.bulk_insert_mappings(Trade, [t.as_row() for t in self.trades])
+            session.commit()
+            logger.info(f"💾 Сделки сохранены в базу: {len(self.trades)}")
+        finally: session.close()
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL: чтение не ждет фонового писателя; NORMAL — fsync только на чекпоинтах WAL
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA cache_size=-65536") # 64 МБ страничного кэша на соединение
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+class DatabaseManager:
+    def __init__(self, db_path="data/trade_bot.db", in_memory=False):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False}, echo=False)
+        event.listen(self.engine, "connect", _sqlite_pragmas)
+        Base.metadata.create_all(self.engine)
+        # create_all не добавляет новые индексы в уже существующую таблицу
+        for index in Trade.__table__.indexes: index.create(self.engine, checkfirst=True)
+        self.Session = sessionmaker(bind=self.engine)
+        self.Trade = Trade
+        # Сделки: в бэктесте — в памяти со сбросом в файл через flush(),
+        # в живом боте — запись пачками в фоновом потоке
+        self.writer = None if in_memory else SqlWriter(self.Session)
+        self.ledger = MemoryLedger(self.Session) if in_memory else SqlLedger(self.Session, self.writer)
+        self._reset_time = None
+        if self.writer is not None: atexit.register(self.close)
+
+    def _write(self, op):
+        """Запись через фоновый поток, а без него (бэктест) — сразу"""
+        if self.writer is not None: return self.writer.submit(op)
+        session = self.Session()
+        try:
+            op(session)
+            session.commit()
+        finally: session.close()
+
+    def close(self):
+        """Дописать отложенное и остановить фоновую запись"""
+        if self.writer is not None: self.writer.close()
+
+    def reset_database(self):
+        """Полная очистка таблиц (бэктест перед прогоном)"""
+        self.flush()
+        Base.metadata.drop_all(self.engine)
+        Base.metadata.create_all(self.engine)
+        self.ledger.reset()
+
+    def flush(self):
+        """Запись накопленных в памяти сделок в SQLite (для SqlLedger — ожидание фоновой записи)"""
+        self.ledger.flush()
+
+    def _get_now(self, current_time=None):
+        return _naive(current_time)
+
+    def get_last_reset_time(self):
+        if self._reset_time is not None: return self._reset_time # Записано, но, возможно, еще не в базе
+        session = self.Session()
+        try:
+            setting = session.query(BotSettings).filter(BotSettings.key == 'last_cycle_reset').first()
+            return setting.value_date if setting else None
+        finally: session.close()
+
+    def save_reset_time(self, reset_time):
+        rt = reset_time.replace(tzinfo=None) if hasattr(reset_time, 'tzinfo') and reset_time.tzinfo else reset_time
+        self._reset_time = rt
+        self._write(lambda session: session.merge(BotSettings(key='last_cycle_reset', value_date=rt)))
+
+    # --- Сделки: все операции обслуживает ledger ---
+    def add_trade(self, *args, **kwargs): return self.ledger.add_trade(*args, **kwargs)
+    def close_trade(self, *args, **kwargs): return self.ledger.close_trade(*args, **kwargs)
+    def set_breakeven(self, trade_id, stop_loss): return self.ledger.set_breakeven(trade_id, stop_loss)
+    def get_open_trades(self): return self.ledger.get_open_trades()
+    def get_open_trade_times(self): return self.ledger.get_open_trade_times()
+    def has_open_trade(self, *args, **kwargs): return self.ledger.has_open_trade(*args, **kwargs)
+    def has_recent_trade(self, *args, **kwargs): return self.ledger.has_recent_trade(*args, **kwargs)
+    def get_active_trades_count(self, *args, **kwargs): return self.ledger.get_active_trades_count(*args, **kwargs)
+    def get_active_count_by_strategy(self, *args, **kwargs): return self.ledger.get_active_count_by_strategy(*args, **kwargs)
+    def is_ticker_in_cooldown(self, *args, **kwargs): return self.ledger.is_ticker_in_cooldown(*args, **kwargs)
+    def get_live_daily_pnl(self, since_time): return self.ledger.get_live_daily_pnl(since_time)
+    def get_detailed_stats(self, *args, **kwargs): return self.ledger.get_detailed_stats(*args, **kwargs)
+    def check_consecutive_live_losses(self, *args, **kwargs): return self.ledger.check_consecutive_live_losses(*args, **kwargs)
+    def triggered(self, ticker, price): return self.ledger.triggered(ticker, price)
+    def scan_gate(self, current_time=None): return self.ledger.scan_gate(current_time)
@@ -0,0 +1,175 @@
+import asyncio
+import threading
+import time
+import numpy as np
+from loguru import logger
+
+from .strategies.window import COLUMNS, KlineWindow
+from .strategies.features import FEATURE_LOOKBACK
+
+class KlineRing:
+    """
+    Кольцевой буфер закрытых свечей одной серии (колонки NumPy фиксированной
+    емкости). Хранит только подтвержденные свечи, без разрывов: свеча не на
+    своем месте помечает серию для дозагрузки через REST.
+    """
+    def __init__(self, interval, capacity=1000):
+        self.step = int(interval) * 60_000
+        self.capacity = capacity
+        self.data = {name: np.zeros(capacity, dtype=np.int64 if name == 'time_ms' else np.float64) for name in COLUMNS}
+        self.count = 0
+        self.head = 0         # Позиция следующей записи
+        self.last_time = None # Открытие последней свечи, мс
+        self.gap = True       # Нужна дозагрузка (старт или пропуск свечей)
+
+    def append(self, bar):
+        """bar: (time_ms, open, high, low, close, volume) подтвержденной свечи"""
+        time_ms = int(bar[0])
+        if self.last_time is not None:
+            if time_ms == self.last_time:
+                # Повтор последней свечи — просто обновляем ее
+                self._write((self.head - 1) % self.capacity, bar)
+                return
+            if time_ms < self.last_time:
+                return
+            if time_ms != self.last_time + self.step:
+                self.gap = True
+        self._write(self.head, bar)
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.last_time = time_ms
+
+    def _write(self, pos, bar):
+        for name, value in zip(COLUMNS, bar):
+            self.data[name][pos] = value
+
+    def reset(self, bars):
+        """Полная замена содержимого (дозагрузка через REST), bars от старых к новым"""
+        self.count = self.head = 0
+        self.last_time = None
+        self.gap = not bars
+        for bar in bars[-self.capacity:]:
+            self.append(bar)
+
+    def bars_after(self, time_ms):
+        """Свечи буфера новее time_ms (кортежами, от старых к новым)"""
+        idx = (self.head - self.count + np.arange(self.count)) % self.capacity
+        idx = idx[self.data['time_ms'][idx] > time_ms]
+        return list(zip(*(self.data[name][idx].tolist() for name in COLUMNS)))
+
+    def window(self, limit):
+        """Последние limit свечей копией в KlineWindow"""
+        n = min(int(limit), self.count)
+        idx = (self.head - n + np.arange(n)) % self.capacity
+        return KlineWindow(*(self.data[name][idx] for name in COLUMNS))
+
+
+class KlineBook:
+    """
+    Кольцевые буферы свечей по (тикер, интервал), которые пополняет WebSocket.
+    Чтение (get_window) не ходит в сеть; REST нужен только для дозагрузки
+    пустых, разорванных или отставших серий (backfill перед сканом): отставшей
+    докачивается только недостающий хвост, пустой или разорванной — lookback свечей.
+    """
+    def __init__(self, capacity=1000, grace=5, lookback=FEATURE_LOOKBACK):
+        self.capacity = capacity
+        self.grace = grace # Секунд после закрытия свечи на ее приход по WS
+        self.lookback = lookback # Глубина, нужная стратегиям
+        self._rings = {}
+        self._lock = threading.Lock()
+
+    def _ring(self, symbol, interval):
+        key = (symbol, str(interval))
+        ring = self._rings.get(key)
+        if ring is None:
+            ring = self._rings[key] = KlineRing(interval, self.capacity)
+        return ring
+
+    def on_kline(self, symbol, interval, item):
+        """Свеча из топика kline.{interval}.{symbol}; неподтвержденные пропускаются"""
+        if not item.get('confirm'):
+            return
+        bar = (int(item['start']), float(item['open']), float(item['high']),
+               float(item['low']), float(item['close']), float(item['volume']))
+        with self._lock:
+            self._ring(symbol, interval).append(bar)
+
+    def expected_last(self, interval, now=None):
+        """Открытие последней свечи, которая уже должна была прийти, мс"""
+        step = int(interval) * 60
+        now = (now or time.time()) - self.grace
+        return (int(now) // step - 1) * step * 1000
+
+    def is_ready(self, symbol, interval, now=None):
+        with self._lock:
+            ring = self._rings.get((symbol, str(interval)))
+            return ring is not None and not ring.gap and ring.last_time is not None and ring.last_time >= self.expected_last(interval, now)
+
+    def get_window(self, symbol, interval, limit):
+        """Последние limit закрытых свечей; пустое окно, если серия не готова"""
+        with self._lock:
+            ring = self._rings.get((symbol, str(interval)))
+            if ring is None or ring.gap:
+                return KlineWindow.from_klines([])
+            return ring.window(limit)
+
+    def stale(self, symbols, intervals, now=None):
+        """Серии, которые пусты, с разрывом или отстали от часов"""
+        return [(symbol, str(interval)) for symbol in symbols for interval in intervals if not self.is_ready(symbol, interval, now)]
+
+    def fetch_limit(self, symbol, interval, now=None):
+        """Сколько свечей запросить у REST (с текущей незакрытой)"""
+        full = self.lookback + 1
+        with self._lock:
+            ring = self._rings.get((symbol, str(interval)))
+            if ring is None or ring.gap or ring.last_time is None:
+                return full
+            # Недостающие свечи, последняя сохраненная (для стыковки) и незакрытая
+            missing = (self.expected_last(interval, now) - ring.last_time) // ring.step
+            return int(min(max(missing, 0) + 2, full))
+
+    def store(self, symbol, interval, klines):
+        """Ответ get_kline (от новых к старым, первая свеча — текущая незакрытая) в буфер"""
+        bars = [(int(k[0]), *map(float, k[1:6])) for k in reversed(klines[1:])]
+        if not bars:
+            return False
+        with self._lock:
+            ring = self._ring(symbol, interval)
+            if not ring.gap and ring.last_time is not None and bars[0][0] <= ring.last_time <= bars[-1][0]:
+                # Ответ стыкуется с буфером: дописываем хвост, старые свечи остаются
+                for bar in bars:
+                    ring.append(bar)
+                return True
+            # Пока шел запрос, WS мог прислать свечи новее ответа: оставляем их, если без разрыва
+            fresh = ring.bars_after(bars[-1][0])
+            ring.reset(bars)
+            for bar in fresh:
+                if bar[0] != ring.last_time + ring.step: break
+                ring.append(bar)
+        return True
+
+    def backfill(self, session, symbols, intervals, now=None):
+        """Дозагрузка через REST (синхронный session) по одной серии"""
+        loaded = 0
+        for symbol, interval in self.stale(symbols, intervals, now):
+            try:
+                response = session.get_kline(category="linear", symbol=symbol, interval=interval, limit=self.fetch_limit(symbol, interval, now))
+                loaded += self.store(symbol, interval, response.get('result', {}).get('list', []))
+            except Exception as e:
+                logger.error(f"❌ Свечи: ошибка дозагрузки {symbol} {interval}м: {e}")
+        return loaded
+
+    async def backfill_async(self, client, symbols, intervals, now=None):
+        """Дозагрузка всех отставших серий разом: запросы идут параллельно под лимитами клиента"""
+        stale = self.stale(symbols, intervals, now)
+        responses = await asyncio.gather(*(
+            client.get_kline(category="linear", symbol=symbol, interval=interval, limit=self.fetch_limit(symbol, interval, now))
+            for symbol, interval in stale
+        ), return_exceptions=True)
+        loaded = 0
+        for (symbol, interval), response in zip(stale, responses):
+            if isinstance(response, Exception):
+                logger.error(f"❌ Свечи: ошибка дозагрузки {symbol} {interval}м: {response}")
+                continue
+            loaded += self.store(symbol, interval, response.get('result', {}).get('list', []))
+        return loaded
@@ -1,5 +1,10 @@
 import asyncio
+import os
+import multiprocessing
+import threading
 import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta, timezone
 from decimal import Decimal, ROUND_DOWN
 from loguru import logger
@@ -8,21 +13,48 @@ from .strategies.fakeout import FakeoutStrategy
 from .strategies.breakout import BreakoutStrategy
 from .strategies.bounce import BounceStrategy
 from .strategies.trend import TrendStrategy
+from .strategies.base import BaseStrategy, HTF_INTERVALS
+from .strategies.features import FEATURE_LOOKBACK
+from .strategies.parallel import evaluate_signals, pack_window
 from .database import DatabaseManager
+from .klines import KlineBook
+from .api_client import InstrumentCache, wallet_snapshot
+from .universe import BLACKLIST
 from .utils.telegram_notify import send_telegram_message
 
+SL_NOT_MODIFIED = 34040 # Bybit: такой стоп уже стоит
+
+STRATEGY_MAP = {'breakout': BreakoutStrategy, 'fakeout': FakeoutStrategy, 'bounce': BounceStrategy, 'trend': TrendStrategy}
+
 class Orchestrator:
-    def __init__(self, session, ticker_list, db_path="data/trade_bot.db", is_backtest=False, start_time=None, params=None):
+    def __init__(self, session, ticker_list, db_path="data/trade_bot.db", is_backtest=False, start_time=None, params=None, rest_client=None, eval_workers=0):
         self.session = session
-        self.db = DatabaseManager(db_path)
+        self.rest = rest_client # Асинхронный REST-клиент: параллельная загрузка свечей перед сканом
+        # В бэктесте сделки живут в памяти и пишутся в db_path один раз (db.flush)
+        self.db = DatabaseManager(db_path, in_memory=is_backtest)
         self.all_tickers = ticker_list
         self.ws = None 
+        self.universe = None # TickerUniverse из WebSocket: список тикеров скана без REST
         self.is_backtest = is_backtest
         self._sim_time = start_time 
         self.params = params or {} 
         self.lock = asyncio.Lock()
-        self.semaphore = asyncio.Semaphore(5)
+        self.trade_lock = threading.RLock() # Проверка сделок: поток тиков WebSocket и монитор
+        self.semaphore = asyncio.Semaphore(max(5, eval_workers))
+        # Расчет стратегий в процессах (Live): воркерам уходят только окна свечей и параметры.
+        # spawn, а не fork: в главном процессе уже работают потоки WebSocket и to_thread
+        self.executor = ProcessPoolExecutor(max_workers=eval_workers, mp_context=multiprocessing.get_context("spawn")) if eval_workers and not is_backtest else None
         self.last_http = {}
+        self.exit_alerts = set() # id live-сделок, о неудачном выходе которых уже сообщили
+        self.sl_unconfirmed = set() # id live-сделок, чей перенос стопа биржа не подтвердила
+        # Пересечения уровней из потока WebSocket: закрывает их монитор, а не поток сокета
+        self.tick_queue = deque()   # (сделка, цена) в порядке тиков
+        self.tick_waiting = {}      # тикер -> {id: сделка} с необработанными тиками в очереди
+        self.tick_counts = {}       # id -> число ее тиков в очереди
+        self.tick_lock = threading.Lock()
+        self.tick_event = None      # asyncio.Event монитора (создается в его цикле)
+        self.loop = None
+        self.reselect_pending = False # Пересчет портфеля после закрытия — в мониторе под self.lock
 
         last_reset = self.db.get_last_reset_time()
         self.cycle_start_time = start_time if is_backtest else (last_reset or self.get_now())
@@ -39,8 +71,55 @@ class Orchestrator:
         self.max_order_usd_limit = 40.0 
         self.max_live_slots_total = 5   
         self.timeframes = ["15", "60"]
+        # Справочник инструментов и выставленное плечо: ордер — один REST-запрос
+        self.instruments = InstrumentCache(session) if not is_backtest else None
+        self.signal_source = None # Готовые сигналы бэктеста (backtest.signals) вместо check_signal
+
+        # Реестр уровней переживает перезапуск: лежит рядом с базой
+        self.levels_path = os.path.join(os.path.dirname(db_path) or ".", "levels.json")
+        if not is_backtest:
+            try:
+                if BaseStrategy._levels.load(self.levels_path): logger.info("📐 Реестр уровней загружен")
+            except Exception as e: logger.error(f"Ошибка загрузки реестра уровней: {e}")
+            # Свечи для стратегий: без WebSocket буферы заполняет только стадия загрузки скана
+            if BaseStrategy._klines is None: BaseStrategy._klines = KlineBook()
         self.select_best_strategy_extended()
 
+    def attach_ws(self, ws):
+        """Подключение WebSocket: цены для мониторинга, буферы свечей для стратегий и книга позиций"""
+        self.ws = ws
+        BaseStrategy._klines = getattr(ws, 'klines', None) or BaseStrategy._klines
+        if not self.is_backtest: self.universe = getattr(ws, 'universe', None)
+        if not self.is_backtest and hasattr(ws, 'on_price'): ws.on_price = self.on_tick
+        book = self.position_book()
+        if book is not None:
+            book.on_close = self.on_exchange_close
+            self.sync_positions()
+
+    def position_book(self):
+        """Книга позиций приватного WebSocket (None в бэктесте и без ключей)"""
+        if self.is_backtest or self.ws is None or not getattr(self.ws, 'private_ready', False): return None
+        return getattr(self.ws, 'positions', None)
+
+    def sync_positions(self):
+        """Стартовый снимок открытых позиций: дальше книгу ведут топики position/execution"""
+        try:
+            positions, cursor = [], None
+            while True:
+                params = {'category': "linear", 'settleCoin': "USDT", 'limit': 200}
+                if cursor: params['cursor'] = cursor
+                result = self.session.get_positions(**params).get('result', {})
+                positions.extend(result.get('list', []))
+                cursor = result.get('nextPageCursor')
+                if not cursor: break
+            self.ws.positions.load(positions)
+            logger.info(f"📒 Книга позиций: {sum(1 for p in positions if float(p.get('size') or 0) > 0)} открытых")
+        except Exception as e: logger.error(f"Ошибка загрузки позиций: {e}")
+
+    def kline_intervals(self):
+        """Интервалы свечей, нужные стратегиям: свои ТФ и старшие ТФ для тренда"""
+        return sorted(set(self.timeframes) | {HTF_INTERVALS.get(tf, "240") for tf in self.timeframes}, key=int)
+
     def get_now(self):
         dt = self._sim_time if self.is_backtest and self._sim_time else datetime.now(timezone.utc)
         return dt.replace(tzinfo=None) if hasattr(dt, 'tzinfo') and dt.tzinfo else dt
@@ -53,17 +132,17 @@ class Orchestrator:
 
     def get_balances(self):
         if self.is_backtest: return {'equity': 1000.0, 'available': 1000.0}
-        try:
-            res = self.session.get_wallet_balance(accountType="UNIFIED", coin="USDT")
-            acc = res['result']['list'][0]
-            equity = float(acc.get('totalEquity', self.initial_virtual_deposit) or self.initial_virtual_deposit)
-            available = 0.0
-            for c in acc.get('coin', []):
-                if c['coin'] == 'USDT':
-                    available = float(c.get('availableToWithdraw', 0) or 0)
-                    break
-            return {'equity': equity, 'available': available}
-        except: return {'equity': self.initial_virtual_deposit, 'available': 0.0}
+        # Снимок из приватного WebSocket (топик wallet), REST — только если он устарел
+        balances = self.ws.get_wallet() if self.ws else None
+        if not balances:
+            try:
+                res = self.session.get_wallet_balance(accountType="UNIFIED", coin="USDT")
+                balances = wallet_snapshot(res['result']['list'][0])
+                if self.ws: self.ws.update_wallet(balances)
+            except: return {'equity': self.initial_virtual_deposit, 'available': 0.0}
+        # Пустой счет: бумажные сделки считаются от виртуального депозита
+        if not balances['equity']: balances = {**balances, 'equity': self.initial_virtual_deposit}
+        return balances
 
     def calculate_position_size(self, entry, sl):
         bal = self.get_balances()
@@ -119,28 +198,91 @@ class Orchestrator:
 
         self.market_sentiment = await asyncio.to_thread(self.get_market_sentiment)
         current_tickers = await asyncio.to_thread(self.get_market_tickers)
-        strategy_map = {'breakout': BreakoutStrategy, 'fakeout': FakeoutStrategy, 'bounce': BounceStrategy, 'trend': TrendStrategy}
-        tasks = [self._throttled_scan(t, strategy_map) for t in current_tickers]
+
+        # Стадия 1: все нужные свечи разом, стадия 2: расчет стратегий уже без сети
+        fetch_start = time.perf_counter()
+        loaded = await self.prefetch_klines(current_tickers) if not self.is_backtest else 0
+        if self.instruments is not None:
+            await asyncio.to_thread(self.instruments.prepare)
+        eval_start = time.perf_counter()
+        # Кулдауны и недавние сделки — один снимок на скан, дальше отбор без запросов к базе
+        gate = await asyncio.to_thread(self.db.scan_gate, now)
+        tasks = [self._throttled_scan(t, STRATEGY_MAP, gate) for t in current_tickers]
         await asyncio.gather(*tasks)
+        if not self.is_backtest:
+            logger.info(f"⏱ Загрузка свечей: {eval_start - fetch_start:.2f} с ({loaded} серий) | Расчет: {time.perf_counter() - eval_start:.2f} с")
+            try: await asyncio.to_thread(BaseStrategy._levels.save, self.levels_path)
+            except Exception as e: logger.error(f"Ошибка сохранения реестра уровней: {e}")
+            for s in BaseStrategy.cache_stats():
+                logger.info(f"🗃 Кэш {s['name']}: hit {s['hit_rate']:.0%} ({s['hits']}/{s['hits'] + s['misses']}) | "
+                            f"вытеснено {s['evictions']} | истекло {s['expired']} | {s['size']} шт, {s['bytes'] / 1e6:.1f} МБ")
         logger.info(f"✅ Скан завершен в {now.strftime('%H:%M:%S')}")
 
-    async def _throttled_scan(self, ticker, strategy_map):
+    async def prefetch_klines(self, tickers):
+        """
+        Загрузка всех свечей скана (тикеры x ТФ x старшие ТФ) в буферы стратегий.
+        REST только для пустых, разорванных или отставших серий; с асинхронным
+        клиентом запросы идут параллельно под его лимитами.
+        """
+        book = BaseStrategy._klines
+        if book is None: return 0
+        try:
+            if self.rest is not None:
+                return await book.backfill_async(self.rest, tickers, self.kline_intervals())
+            return await asyncio.to_thread(book.backfill, self.session, tickers, self.kline_intervals())
+        except Exception as e:
+            logger.error(f"Ошибка загрузки свечей: {e}")
+            return 0
+
+    async def _throttled_scan(self, ticker, strategy_map, gate):
+        # Темп REST-запросов держит клиент (лимиты Bybit), здесь только число параллельных тикеров
         async with self.semaphore:
-            await asyncio.sleep(0.1) 
-            for tf in self.timeframes: await self.process_ticker_tf(ticker, tf, strategy_map)
+            for tf in self.timeframes: await self.process_ticker_tf(ticker, tf, strategy_map, gate)
 
-    async def process_ticker_tf(self, ticker, tf, strategy_map):
-        if self.db.is_ticker_in_cooldown(ticker, current_time=self.get_now()): return
+    async def process_ticker_tf(self, ticker, tf, strategy_map, gate):
+        if gate.in_cooldown(ticker, current_time=self.get_now()): return
+        if self.executor is not None and self.signal_source is None:
+            return await self.process_ticker_tf_pool(ticker, tf, strategy_map, gate)
         for name, StratClass in strategy_map.items():
             full_name = f"{name}_{tf}"
-            if await asyncio.to_thread(self.db.has_recent_trade, ticker, full_name, 15): continue
-            obj = StratClass(self.session, ticker, tf, self.db, is_backtest=self.is_backtest, params=self.params)
-            signal = await asyncio.to_thread(obj.check_signal)
+            if gate.has_recent_trade(ticker, full_name, 15): continue
+            if self.signal_source is not None:
+                signal = self.signal_source.get_signal(ticker, tf, name)
+            else:
+                obj = StratClass(self.session, ticker, tf, self.db, is_backtest=self.is_backtest, params=self.params)
+                signal = await asyncio.to_thread(obj.check_signal)
             if signal:
                 async with self.lock:
-                    if not self.db.has_recent_trade(ticker, full_name, 1):
+                    if not gate.has_recent_trade(ticker, full_name, 1):
                         await asyncio.to_thread(self.handle_signal_logic, ticker, full_name, signal)
 
+    async def process_ticker_tf_pool(self, ticker, tf, strategy_map, gate):
+        """То же, что process_ticker_tf, но все стратегии тикера считаются одним заданием в процессе"""
+        pending = [(name, StratClass) for name, StratClass in strategy_map.items() if not gate.has_recent_trade(ticker, f"{name}_{tf}", 15)]
+        if not pending: return
+
+        book = BaseStrategy._klines
+        windows = {iv: pack_window(book.get_window(ticker, iv, FEATURE_LOOKBACK)) for iv in (tf, HTF_INTERVALS.get(tf, "240"))}
+        try:
+            loop = asyncio.get_running_loop()
+            signals = await loop.run_in_executor(self.executor, evaluate_signals, ticker, tf, pending, windows, self.params)
+        except Exception as e:
+            logger.error(f"Ошибка расчета {ticker} {tf}м в процессе: {e}")
+            return
+
+        for name, _ in pending:
+            full_name, signal = f"{name}_{tf}", signals.get(name)
+            if signal:
+                async with self.lock:
+                    if not gate.has_recent_trade(ticker, full_name, 1):
+                        await asyncio.to_thread(self.handle_signal_logic, ticker, full_name, signal)
+
+    def shutdown(self):
+        if self.executor is not None: self.executor.shutdown(wait=False, cancel_futures=True)
+        # Сначала сокеты: закрытия из потока WebSocket не должны идти в уже остановленную запись
+        if self.ws is not None and hasattr(self.ws, 'close'): self.ws.close()
+        self.db.close()
+
     def handle_signal_logic(self, ticker, full_name, signal):
         amount = self.calculate_position_size(signal['entry'], signal['sl'])
         if amount <= 0: return
@@ -158,9 +300,9 @@ class Orchestrator:
                             send_telegram_message(f"🚀 <b>LIVE ВХОД</b>\n{ticker} ({full_name})\n{signal['signal'].upper()}")
 
     def update_open_trades_ws(self):
-        session_db = self.db.Session()
+        """Периодический проход (бэктест, TTL, цены через HTTP): без запросов к базе — сделки в памяти"""
         try:
-            open_trades = session_db.query(self.db.Trade).filter(self.db.Trade.status == 'open').all()
+            open_trades = self.db.get_open_trades()
             now = self.get_now()
             for trade in open_trades:
                 price = self.ws.get_last_price(trade.ticker) if self.ws else None
@@ -174,56 +316,166 @@ class Orchestrator:
                             logger.debug(f"🔄 Цена {trade.ticker} получена через HTTP")
                         except: continue
                     else: continue
-                if not trade.is_breakeven and trade.atr_at_entry and trade.atr_at_entry > 0:
-                    trigger = trade.atr_at_entry * 2.0
-                    if (trade.side == 'long' and price >= (trade.entry_price + trigger)) or (trade.side == 'short' and price <= (trade.entry_price - trigger)):
-                        trade.stop_loss, trade.is_breakeven = trade.entry_price, True
-                        if trade.trade_type == 'live' and not self.is_backtest: self.modify_live_stop_loss(trade.ticker, trade.entry_price)
-                ttl = 8 if "15" in trade.strategy_name else 24
-                if (now - trade.created_at.replace(tzinfo=None)).total_seconds() > ttl * 3600:
-                    self.close_and_notify(trade, price, "TTL Exit")
-                    continue
-                is_closed = False
-                if trade.side == 'long':
-                    if price >= trade.take_profit or price <= trade.stop_loss: is_closed = True
-                else:
-                    if price <= trade.take_profit or price >= trade.stop_loss: is_closed = True
-                if is_closed: self.close_and_notify(trade, price, "Target/Stop")
-            session_db.commit()
+                with self.trade_lock: self.check_trade(trade, price, now)
         except Exception as e: logger.error(f"WS Error: {e}")
-        finally: session_db.close()
+
+    def on_tick(self, ticker, price):
+        """
+        Тик WebSocket: только отбор сделок, чьи уровни (TP/SL/безубыток) цена пересекла.
+        REST, база и уведомления — в мониторе (process_ticks), поток сокета не ждет их.
+        """
+        try:
+            trades = self.db.triggered(ticker, price)
+            with self.tick_lock:
+                # Сделки, ждущие монитора, получают и этот тик: их уровни еще могут сдвинуться (безубыток)
+                waiting = self.tick_waiting.get(ticker)
+                if waiting: trades = sorted({**waiting, **{t.id: t for t in trades}}.values(), key=lambda t: t.id)
+                if not trades: return
+                waiting = self.tick_waiting.setdefault(ticker, {})
+                for trade in trades:
+                    self.tick_queue.append((trade, price))
+                    waiting[trade.id] = trade
+                    self.tick_counts[trade.id] = self.tick_counts.get(trade.id, 0) + 1
+            if self.loop is not None: self.loop.call_soon_threadsafe(self.tick_event.set)
+        except Exception as e: logger.error(f"Ошибка обработки тика {ticker}: {e}")
+
+    async def wait_ticks(self, timeout):
+        """Ожидание пересечений от on_tick, но не дольше timeout секунд"""
+        if self.tick_event is None:
+            self.tick_event = asyncio.Event()
+            self.loop = asyncio.get_running_loop()
+        if not self.tick_queue:
+            try: await asyncio.wait_for(self.tick_event.wait(), timeout)
+            except asyncio.TimeoutError: pass
+        self.tick_event.clear()
+
+    def process_ticks(self):
+        """Пересечения из очереди on_tick по порядку тиков (в потоке монитора)"""
+        now = self.get_now()
+        while True:
+            with self.tick_lock:
+                if not self.tick_queue: return
+                trade, price = self.tick_queue.popleft()
+            try:
+                with self.trade_lock: self.check_trade(trade, price, now)
+            except Exception as e: logger.error(f"Ошибка проверки сделки {trade.ticker}: {e}")
+            finally:
+                with self.tick_lock:
+                    self.tick_counts[trade.id] -= 1
+                    if not self.tick_counts[trade.id]:
+                        del self.tick_counts[trade.id]
+                        waiting = self.tick_waiting[trade.ticker]
+                        del waiting[trade.id]
+                        if not waiting: del self.tick_waiting[trade.ticker]
+
+    async def apply_reselect(self):
+        """Отложенный пересчет портфеля после закрытий — под тем же self.lock, что и скан"""
+        if not self.reselect_pending: return
+        async with self.lock:
+            self.reselect_pending = False
+            await asyncio.to_thread(self.select_best_strategy_extended)
+
+    def check_trade(self, trade, price, now):
+        """Безубыток, TTL и TP/SL одной сделки по цене price"""
+        if trade.status != 'open': return
+        if not trade.is_breakeven and trade.atr_at_entry and trade.atr_at_entry > 0:
+            trigger = trade.atr_at_entry * 2.0
+            if (trade.side == 'long' and price >= (trade.entry_price + trigger)) or (trade.side == 'short' and price <= (trade.entry_price - trigger)):
+                trade.stop_loss, trade.is_breakeven = trade.entry_price, True
+                self.db.set_breakeven(trade.id, trade.entry_price)
+                if trade.trade_type == 'live' and not self.is_backtest and not self.modify_live_stop_loss(trade.ticker, trade.entry_price):
+                    self.sl_unconfirmed.add(trade.id)
+        ttl = self.get_trade_ttl_hours(trade.strategy_name)
+        if (now - trade.created_at.replace(tzinfo=None)).total_seconds() > ttl * 3600:
+            self.close_and_notify(trade, price, "TTL Exit")
+            return
+        is_closed = False
+        if trade.side == 'long':
+            if price >= trade.take_profit or price <= trade.stop_loss: is_closed = True
+        else:
+            if price <= trade.take_profit or price >= trade.stop_loss: is_closed = True
+        if is_closed:
+            # TP/SL live-сделки стоят на бирже: сделку закроет исполнение по реальной цене.
+            # Если биржа не подтвердила перенос стопа, ее стоп не тот — закрываем сами
+            book = self.position_book() if trade.trade_type == 'live' else None
+            if book is not None and (book.size(trade.ticker) or 0) > 0 and trade.id not in self.sl_unconfirmed: return
+            self.close_and_notify(trade, price, "Target/Stop")
+
+    def get_trade_ttl_hours(self, strategy_name):
+        return 8 if "15" in strategy_name else 24
+
+    def next_ttl_deadline(self):
+        """Ближайший предстоящий выход по TTL среди открытых сделок (для событийных часов бэктеста)"""
+        now = self.get_now()
+        deadlines = [created.replace(tzinfo=None) + timedelta(hours=self.get_trade_ttl_hours(name)) for name, created in self.db.get_open_trade_times()]
+        upcoming = [d for d in deadlines if d >= now]
+        return min(upcoming) if upcoming else None
 
     def modify_live_stop_loss(self, ticker, new_sl):
+        """True — биржа приняла новый стоп (или он уже такой)"""
         try:
-            info = self.session.get_instruments_info(category="linear", symbol=ticker)['result']['list'][0]
-            sl_f = self.format_step(new_sl, info['priceFilter']['tickSize'])
-            self.session.set_trading_stop(category="linear", symbol=ticker, stopLoss=str(sl_f), slTriggerBy="LastPrice", tpslMode="Full")
-        except: pass
+            info = self.instruments.get_symbol_info(ticker)
+            sl_f = self.format_step(new_sl, info['price_step'])
+            res = self.session.set_trading_stop(category="linear", symbol=ticker, stopLoss=str(sl_f), slTriggerBy="LastPrice", tpslMode="Full")
+            ok = res.get('retCode') in (0, SL_NOT_MODIFIED)
+            if not ok: logger.error(f"❌ LIVE: стоп {ticker} не перенесен: {res.get('retMsg')}")
+        except Exception as e:
+            # pybit бросает исключение и на "not modified" — стоп уже стоит
+            ok = str(SL_NOT_MODIFIED) in str(e)
+            if not ok: logger.error(f"❌ LIVE: ошибка переноса стопа {ticker}: {e}")
+        if ok: logger.info(f"🛡 LIVE: стоп {ticker} перенесен в безубыток")
+        return ok
 
     def place_live_order(self, ticker, side, entry, sl, tp, amount_usd):
         if self.is_backtest: return True
         try:
-            info = self.session.get_instruments_info(category="linear", symbol=ticker)['result']['list'][0]
-            qty = self.format_step(amount_usd / entry, info['lotSizeFilter']['qtyStep'])
-            if qty < float(info['lotSizeFilter']['minOrderQty']): return False
-            try: self.session.set_leverage(category="linear", symbol=ticker, buyLeverage=str(self.max_leverage), sellLeverage=str(self.max_leverage))
-            except: pass
+            info = self.instruments.get_symbol_info(ticker)
+            qty = self.format_step(amount_usd / entry, info['qty_step'])
+            if qty < info['min_qty']: return False
+            # Плечо запрашивается один раз на символ, дальше из кэша
+            self.instruments.set_leverage(ticker, self.max_leverage)
             res = self.session.place_order(
                 category="linear", symbol=ticker, side="Buy" if side == "long" else "Sell",
-                orderType="Market", qty=str(qty), takeProfit=str(self.format_step(tp, info['priceFilter']['tickSize'])),
-                stopLoss=str(self.format_step(sl, info['priceFilter']['tickSize'])), tpslMode="Full", isLeverage=1
+                orderType="Market", qty=str(qty), takeProfit=str(self.format_step(tp, info['price_step'])),
+                stopLoss=str(self.format_step(sl, info['price_step'])), tpslMode="Full", isLeverage=1
             )
             return res['retCode'] == 0
         except Exception as e: return False
 
-    def close_and_notify(self, trade, price, reason):
-        if trade.trade_type == 'live' and not self.is_backtest: self.close_live_position(trade.ticker, trade.side)
+    def close_and_notify(self, trade, price, reason, filled=False):
+        """filled — позиция уже закрыта на бирже, ордер не нужен"""
+        if trade.status != 'open': return False
+        if trade.trade_type == 'live' and not self.is_backtest and not filled:
+            # Сначала выход на бирже: сделка закрывается в базе, только когда позиции там больше нет
+            if not self.close_live_position(trade.ticker, trade.side):
+                logger.error(f"❌ LIVE: позиция {trade.ticker} не закрыта ({reason}), сделка остается открытой")
+                if trade.id not in self.exit_alerts:
+                    self.exit_alerts.add(trade.id)
+                    send_telegram_message(f"❗ <b>LIVE: ОШИБКА ВЫХОДА</b>\n{trade.ticker}\n{reason}\nПозиция на бирже открыта, повтор на следующей проверке")
+                return False
         pnl = self.calculate_pnl_simple(trade, price)
-        self.db.close_trade(trade.id, price, pnl, current_time=self.get_now())
+        # Сделку закрывает тот, кто первым сменил статус: монитор и поток исполнений не дублируют друг друга
+        if not self.db.close_trade(trade.id, price, pnl, current_time=self.get_now()): return False
+        self.exit_alerts.discard(trade.id)
+        self.sl_unconfirmed.discard(trade.id)
+        # Статистика стратегий обновляется на каждом закрытии, поэтому пересчет портфеля почти бесплатный
+        if self.params.get('reselect_on_close'):
+            if self.is_backtest: self.select_best_strategy_extended()
+            else: self.reselect_pending = True
         if trade.trade_type == 'live':
             icon = "💰" if pnl > 0 else "📉"
             send_telegram_message(f"{icon} <b>LIVE ЗАКРЫТ</b>\n{trade.ticker}\nPnL: ${pnl:+.2f}\n{reason}")
         logger.info(f"✅ CLOSED {trade.ticker} ({trade.trade_type}): {pnl}$ | {reason}")
+        return True
+
+    def on_exchange_close(self, event):
+        """Позиция закрыта на бирже (TP/SL, ликвидация, вручную): live-сделка закрывается по цене исполнения"""
+        trades = [t for t in self.db.get_open_trades() if t.trade_type == 'live' and t.ticker == event['symbol'] and t.side == event['side']]
+        if not trades:
+            logger.debug(f"Закрытие {event['symbol']} на бирже: открытой live-сделки нет")
+            return
+        for trade in trades:
+            self.close_and_notify(trade, event['price'], event['reason'], filled=True)
 
     def calculate_pnl_simple(self, trade, exit_price):
         diff = (exit_price - trade.entry_price) / trade.entry_price
@@ -231,18 +483,28 @@ class Orchestrator:
         return round((diff * trade.amount_usd) - (trade.amount_usd * 0.0012), 4)
 
     def get_market_tickers(self):
+        if self.universe is not None:
+            # Оборот обновляет поток тикеров; полный REST-снимок — раз в refresh_sec (новые листинги)
+            self.universe.refresh(self.session)
+            return self.universe.symbols() or self.all_tickers
         try:
             res = self.session.get_tickers(category="linear")
-            blacklist = ['DOLOUSDT', 'DEGENUSDT', 'DEFIUSDT', 'BUSDT', 'ARBUSDT', 'FILUSDT']
-            return [t['symbol'] for t in res['result']['list'] if t['symbol'].endswith('USDT') and float(t['turnover24h']) > 20_000_000 and t['symbol'] not in blacklist]
+            return [t['symbol'] for t in res['result']['list'] if t['symbol'].endswith('USDT') and float(t['turnover24h']) > 20_000_000 and t['symbol'] not in BLACKLIST]
         except: return self.all_tickers
 
     def close_live_position(self, ticker, side):
+        """True — позиции на бирже нет или закрывающий ордер принят, False — закрыть не удалось"""
         try:
-            res = self.session.get_positions(category="linear", symbol=ticker)
-            pos = res.get('result', {}).get('list', [])
-            if pos and float(pos[0].get('size', 0)) > 0:
-                self.session.place_order(category="linear", symbol=ticker, side="Sell" if side=="long" else "Buy", orderType="Market", qty=pos[0]['size'], reduceOnly=True)
-                return True
-            return False
-        except: return False
\ No newline at end of file
+            # Размер из книги позиций; REST — только если поток этот символ еще не видел
+            book = self.position_book()
+            size = book.size(ticker) if book is not None else None
+            if size is None:
+                res = self.session.get_positions(category="linear", symbol=ticker)
+                pos = res.get('result', {}).get('list', [])
+                size = float(pos[0].get('size', 0)) if pos else 0.0
+            if size <= 0 or (book is not None and book.has_closing_order(ticker)): return True
+            res = self.session.place_order(category="linear", symbol=ticker, side="Sell" if side=="long" else "Buy", orderType="Market", qty=f"{size:f}".rstrip('0').rstrip('.'), reduceOnly=True)
+            return res.get('retCode') == 0
+        except Exception as e:
+            logger.error(f"❌ LIVE: ошибка ордера закрытия {ticker}: {e}")
+            return False
\ No newline at end of file
@@ -0,0 +1,133 @@
+import threading
+from collections import deque
+from loguru import logger
+
+# Причина закрытия по исполнению: stopOrderType, иначе createType ордера
+CLOSE_REASONS = {
+    'TakeProfit': "Take Profit (биржа)", 'PartialTakeProfit': "Take Profit (биржа)",
+    'StopLoss': "Stop Loss (биржа)", 'PartialStopLoss': "Stop Loss (биржа)",
+    'TrailingStop': "Trailing Stop (биржа)",
+    'CreateByLiq': "Ликвидация", 'CreateByTakeOver_PassThrough': "Ликвидация", 'CreateByAdl_PassThrough': "ADL",
+}
+ACTIVE_ORDER = ('New', 'PartiallyFilled')
+TERMINAL_ORDER = ('Filled', 'Cancelled', 'Rejected', 'PartiallyFilledCanceled', 'Deactivated')
+
+class PositionBook:
+    """
+    Позиции аккаунта из приватных топиков position / execution / order.
+    Размер позиции знает только position; цену закрытия дают исполнения
+    с closedSize > 0. Когда позиция стала нулевой и исполнения покрыли ее
+    последний размер (порядок сообщений любой), вызывается on_close(событие)
+    — один раз, с ценой закрытия, средней по исполнениям.
+    """
+    def __init__(self, on_close=None, max_exec_ids=5000):
+        self.on_close = on_close
+        self._positions = {} # символ -> {'side', 'size', 'entry', 'seq', 'time', 'flat_from'}
+        self._closing = {}   # символ -> {'qty', 'value', 'reason', 'side', 'time'} закрывающих исполнений
+        self._orders = {}    # orderId -> активный reduce-only ордер {'symbol', 'status'}
+        self._exec_ids = set()
+        self._exec_order = deque()
+        self.max_exec_ids = max_exec_ids
+        self._lock = threading.RLock()
+
+    def load(self, positions):
+        """Стартовый снимок из REST get_positions: топик position шлет только изменения"""
+        with self._lock:
+            for item in positions:
+                self._set_position(item)
+
+    def _set_position(self, item):
+        symbol = item['symbol']
+        seq = int(item.get('seq') or 0)
+        prev = self._positions.get(symbol)
+        if prev is not None and 0 < seq < prev['seq']:
+            return # Устаревшее сообщение
+        side = {'Buy': 'long', 'Sell': 'short'}.get(item.get('side'))
+        size = float(item.get('size') or 0)
+        pos = {
+            'side': side or (prev['side'] if prev else None), 'size': size,
+            'entry': float(item.get('entryPrice') or item.get('avgPrice') or 0),
+            'seq': seq, 'time': int(item.get('updatedTime') or 0),
+            # Размер перед обнулением: закрытие ждет исполнений на весь объем
+            'flat_from': 0.0 if size > 0 or prev is None else (prev['size'] or prev['flat_from']),
+        }
+        self._positions[symbol] = pos
+
+    def on_position(self, item):
+        with self._lock:
+            self._set_position(item)
+            event = self._take_close(item['symbol'])
+        self._emit(event)
+
+    def on_execution(self, item):
+        if item.get('execType', 'Trade') != 'Trade':
+            return # Funding и прочее не меняют позицию
+        closed = float(item.get('closedSize') or 0)
+        with self._lock:
+            exec_id = item.get('execId')
+            if exec_id:
+                if exec_id in self._exec_ids: return
+                self._exec_ids.add(exec_id)
+                self._exec_order.append(exec_id)
+                if len(self._exec_order) > self.max_exec_ids:
+                    self._exec_ids.discard(self._exec_order.popleft())
+            if closed <= 0:
+                return
+            symbol = item['symbol']
+            qty = float(item['execQty'])
+            closing = self._closing.setdefault(symbol, {'qty': 0.0, 'value': 0.0, 'reason': None, 'side': None, 'time': 0})
+            closing['qty'] += qty
+            closing['value'] += qty * float(item['execPrice'])
+            closing['side'] = 'long' if item.get('side') == 'Sell' else 'short'
+            closing['time'] = max(closing['time'], int(item.get('execTime') or 0))
+            reason = CLOSE_REASONS.get(item.get('stopOrderType')) or CLOSE_REASONS.get(item.get('createType'))
+            if reason: closing['reason'] = reason
+            event = self._take_close(symbol)
+        self._emit(event)
+
+    def on_order(self, item):
+        """Активные reduce-only ордера: чтобы не отправлять второй закрывающий ордер"""
+        with self._lock:
+            order_id = item.get('orderId')
+            if not order_id: return
+            if item.get('reduceOnly') and item.get('orderStatus') in ACTIVE_ORDER:
+                self._orders[order_id] = {'symbol': item['symbol'], 'status': item['orderStatus']}
+            elif item.get('orderStatus') in TERMINAL_ORDER or order_id in self._orders:
+                self._orders.pop(order_id, None)
+
+    def _take_close(self, symbol):
+        """Событие закрытия, если позиция нулевая и есть закрывающие исполнения"""
+        pos = self._positions.get(symbol)
+        closing = self._closing.get(symbol)
+        if pos is None or pos['size'] > 0 or not closing or closing['qty'] < pos['flat_from'] * (1 - 1e-9):
+            return None
+        del self._closing[symbol]
+        return {
+            'symbol': symbol, 'side': closing['side'] or pos['side'], 'qty': closing['qty'],
+            'price': closing['value'] / closing['qty'], 'reason': closing['reason'] or "Закрыта на бирже",
+            'time': closing['time'] or pos['time'],
+        }
+
+    def _emit(self, event):
+        # Вне блокировки: обработчик пишет в базу и шлет уведомления
+        if event is None or self.on_close is None:
+            return
+        try:
+            self.on_close(event)
+        except Exception as e:
+            logger.error(f"❌ Позиции: ошибка обработки закрытия {event['symbol']}: {e}")
+
+    def size(self, symbol):
+        """Размер позиции по данным потока; None — символ еще не встречался"""
+        with self._lock:
+            pos = self._positions.get(symbol)
+            return None if pos is None else pos['size']
+
+    def get(self, symbol):
+        with self._lock:
+            pos = self._positions.get(symbol)
+            return dict(pos) if pos else None
+
+    def has_closing_order(self, symbol):
+        with self._lock:
+            return any(o['symbol'] == symbol for o in self._orders.values())
@@ -0,0 +1,236 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import hmac
+import json
+import time
+from urllib.parse import urlencode
+
+import aiohttp
+from loguru import logger
+
+MAINNET_URL = "https://api.bybit.com"
+TESTNET_URL = "https://api-testnet.bybit.com"
+
+# Группы эндпоинтов со своими лимитами: (путь, подписан ли запрос, группа)
+ENDPOINTS = {
+    'get_kline': ("GET", "/v5/market/kline", False, 'market'),
+    'get_tickers': ("GET", "/v5/market/tickers", False, 'market'),
+    'get_instruments_info': ("GET", "/v5/market/instruments-info", False, 'market'),
+    'get_wallet_balance': ("GET", "/v5/account/wallet-balance", True, 'account'),
+    'get_positions': ("GET", "/v5/position/list", True, 'position'),
+    'set_leverage': ("POST", "/v5/position/set-leverage", True, 'position'),
+    'set_trading_stop': ("POST", "/v5/position/trading-stop", True, 'position'),
+    'place_order': ("POST", "/v5/order/create", True, 'order'),
+}
+
+# Запросов в секунду до первых заголовков X-Bapi-Limit (публичные — лимит по IP: 600 за 5 с)
+DEFAULT_RATES = {'market': 50, 'account': 10, 'position': 10, 'order': 10}
+
+RATE_LIMIT_CODE = 10006 # "Too many visits"
+
+class InvalidRequestError(Exception):
+    """Ответ с retCode != 0 (как pybit.exceptions.InvalidRequestError)"""
+    def __init__(self, message, status_code, response=None):
+        self.message = message
+        self.status_code = status_code
+        self.response = response
+        super().__init__(f"{message} (ErrCode: {status_code})")
+
+class TokenBucket:
+    """
+    Токен-бакет одной группы эндпоинтов. Емкость и скорость подстраиваются
+    под заголовки Bybit: X-Bapi-Limit (лимит в секунду), X-Bapi-Limit-Status
+    (остаток) и X-Bapi-Limit-Reset-Timestamp (когда окно обнулится, мс).
+    """
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0 # monotonic: до этого момента запросы группы ждут
+        self.lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def update(self, headers):
+        """Подстройка под ответ биржи"""
+        try:
+            limit = headers.get('X-Bapi-Limit')
+            status = headers.get('X-Bapi-Limit-Status')
+            reset = headers.get('X-Bapi-Limit-Reset-Timestamp')
+            if limit:
+                self.rate = max(float(limit), 1.0)
+            if status is not None:
+                self.tokens = min(self.tokens, float(status))
+                if float(status) <= 0 and reset:
+                    self.block_until_reset(int(reset))
+        except (TypeError, ValueError):
+            pass
+
+    def block_until_reset(self, reset_ms):
+        wait = max(reset_ms / 1000 - time.time(), 0.0)
+        self.block(wait)
+
+    def block(self, seconds):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class BybitRestClient:
+    """
+    Асинхронный REST-клиент Bybit v5: один пул keep-alive соединений на всё
+    приложение и токен-бакет на группу эндпоинтов. При retCode 10006 (или
+    HTTP 429/403 лимита по IP) группа ждет сброса окна и запрос повторяется.
+    Таймауты и обрывы повторяются только для GET: подписанный POST мог
+    исполниться, и повтор отправил бы второй ордер.
+    Методы названы как у pybit HTTP и возвращают тот же JSON; retCode != 0
+    (кроме исчерпанных повторов 10006) бросает InvalidRequestError, как pybit.
+    """
+    def __init__(self, api_key=None, api_secret=None, testnet=False, base_url=None, recv_window=10000,
+                 max_connections=20, max_retries=5, rates=None, timeout=15):
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.base_url = base_url or (TESTNET_URL if testnet else MAINNET_URL)
+        self.recv_window = recv_window
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.buckets = {group: TokenBucket(rate) for group, rate in {**DEFAULT_RATES, **(rates or {})}.items()}
+        self.session = None
+        self.loop = None
+
+    async def start(self):
+        if self.session is None:
+            self.loop = asyncio.get_running_loop()
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60, ttl_dns_cache=300)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _sign(self, payload):
+        timestamp = str(int(time.time() * 1000))
+        raw = timestamp + self.api_key + str(self.recv_window) + payload
+        signature = hmac.new(self.api_secret.encode(), raw.encode(), hashlib.sha256).hexdigest()
+        return {
+            'X-BAPI-API-KEY': self.api_key, 'X-BAPI-TIMESTAMP': timestamp,
+            'X-BAPI-RECV-WINDOW': str(self.recv_window), 'X-BAPI-SIGN': signature,
+        }
+
+    async def request(self, name, **params):
+        method, path, signed, group = ENDPOINTS[name]
+        await self.start()
+        bucket = self.buckets[group]
+        params = {k: v for k, v in params.items() if v is not None}
+
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire()
+            if method == "GET":
+                payload = urlencode(params)
+                url, body = f"{self.base_url}{path}" + (f"?{payload}" if payload else ""), None
+            else:
+                payload = body = json.dumps(params)
+                url = f"{self.base_url}{path}"
+            headers = {'Content-Type': 'application/json'}
+            if signed:
+                headers.update(self._sign(payload))
+
+            try:
+                async with self.session.request(method, url, data=body, headers=headers) as response:
+                    bucket.update(response.headers)
+                    if response.status in (403, 429):
+                        # Лимит по IP: ответ не JSON, ждем с нарастающей паузой
+                        delay = min(2 ** attempt, 30)
+                        logger.warning(f"⏳ REST: HTTP {response.status} на {path}, пауза {delay} с")
+                        bucket.block(delay)
+                        continue
+                    data = await response.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # POST (ордер, стоп, плечо) мог дойти до биржи: повтор только если соединения не было
+                if attempt == self.max_retries or (method != "GET" and not isinstance(e, aiohttp.ClientConnectorError)):
+                    raise
+                logger.warning(f"⚠️ REST: {path} не ответил ({e}), повтор")
+                await asyncio.sleep(min(0.5 * 2 ** attempt, 5))
+                continue
+
+            if data.get('retCode') == RATE_LIMIT_CODE:
+                reset = response.headers.get('X-Bapi-Limit-Reset-Timestamp')
+                if reset: bucket.block_until_reset(int(reset))
+                else: bucket.block(min(0.5 * 2 ** attempt, 10))
+                logger.warning(f"⏳ REST: лимит запросов ({path}), повтор {attempt + 1}")
+                continue
+            if data.get('retCode', 0) != 0:
+                raise InvalidRequestError(data.get('retMsg', ''), data['retCode'], data)
+            return data
+        return {'retCode': RATE_LIMIT_CODE, 'retMsg': 'Too many visits', 'result': {}}
+
+    async def get_kline(self, **params): return await self.request('get_kline', **params)
+    async def get_tickers(self, **params): return await self.request('get_tickers', **params)
+    async def get_instruments_info(self, **params): return await self.request('get_instruments_info', **params)
+    async def get_wallet_balance(self, **params): return await self.request('get_wallet_balance', **params)
+    async def get_positions(self, **params): return await self.request('get_positions', **params)
+    async def set_leverage(self, **params): return await self.request('set_leverage', **params)
+    async def set_trading_stop(self, **params): return await self.request('set_trading_stop', **params)
+    async def place_order(self, **params): return await self.request('place_order', **params)
+
+    def sync(self, timeout=120):
+        """Синхронный фасад для кода в потоках (asyncio.to_thread) — вызывать после start()"""
+        return SyncRestSession(self, timeout)
+
+
+class SyncRestSession:
+    """
+    Те же методы, что у pybit HTTP, но запросы выполняются клиентом в цикле
+    событий приложения. Нельзя вызывать из самого цикла — только из потоков.
+    Ответа ждем не дольше timeout секунд: зависший цикл не вешает поток скана.
+    """
+    def __init__(self, client, timeout=120):
+        self.client = client
+        self.timeout = timeout
+
+    def _call(self, name, params):
+        loop = self.client.loop
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            raise RuntimeError(f"{name}: синхронный вызов из цикла событий, используйте await client.{name}")
+        future = asyncio.run_coroutine_threadsafe(self.client.request(name, **params), loop)
+        try:
+            return future.result(self.timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise TimeoutError(f"{name}: нет ответа за {self.timeout} с")
+
+    def get_kline(self, **params): return self._call('get_kline', params)
+    def get_tickers(self, **params): return self._call('get_tickers', params)
+    def get_instruments_info(self, **params): return self._call('get_instruments_info', params)
+    def get_wallet_balance(self, **params): return self._call('get_wallet_balance', params)
+    def get_positions(self, **params): return self._call('get_positions', params)
+    def set_leverage(self, **params): return self._call('set_leverage', params)
+    def set_trading_stop(self, **params): return self._call('set_trading_stop', params)
+    def place_order(self, **params): return self._call('place_order', params)
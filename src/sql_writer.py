@@ -0,0 +1,91 @@
+import queue
+import threading
+import time
+from loguru import logger
+
+class SqlWriter:
+    """
+    Отложенная запись в SQLite одним фоновым потоком. Операции (функции от
+    сессии) копятся не дольше max_latency секунд и коммитятся пачкой. wait()
+    дожидается коммита всего, что отправлено до вызова: так чтение из базы
+    видит собственные записи. После close() операции пишутся сразу в
+    вызывающем потоке (поздние закрытия из потоков WebSocket при выходе).
+    """
+    def __init__(self, session_factory, max_latency=0.2, max_batch=500):
+        self.Session = session_factory
+        self.max_latency = max_latency
+        self.max_batch = max_batch
+        self.commits = 0
+        self.written = 0
+        self._queue = queue.Queue()
+        self._pending = 0 # Отправлено и еще не закоммичено
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="sql-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, op):
+        with self._lock:
+            # Под той же блокировкой, что и close(): операция не встанет в очередь после None
+            if not self._closed:
+                self._pending += 1
+                self._queue.put(op)
+                return
+        self._apply([op])
+
+    def wait(self, timeout=None):
+        """Барьер: все ранее отправленные операции в базе"""
+        with self._lock:
+            if not self._pending: return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        if self._closed: return
+        self.wait()
+        with self._lock:
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None: return
+            ops, barriers = [], []
+            deadline = time.monotonic() + self.max_latency
+            # Пачка: до дедлайна, max_batch операций или первого барьера
+            while True:
+                if isinstance(item, threading.Event): barriers.append(item)
+                elif item is not None: ops.append(item)
+                if item is None or barriers or len(ops) >= self.max_batch: break
+                try: item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty: break
+            self._commit(ops)
+            for done in barriers: done.set()
+            if item is None: return
+
+    def _commit(self, ops):
+        if not ops: return
+        try:
+            if not self._apply(ops):
+                # Пачка не прошла: по одной, чтобы ошибка одной операции не потеряла остальные
+                for op in ops: self._apply([op])
+        finally:
+            with self._lock:
+                self._pending -= len(ops)
+
+    def _apply(self, ops):
+        session = self.Session()
+        try:
+            for op in ops: op(session)
+            session.commit()
+            self.commits += 1
+            self.written += len(ops)
+            return True
+        except Exception as e:
+            session.rollback()
+            logger.error(f"❌ База: ошибка записи ({len(ops)} операций): {e}")
+            return False
+        finally: session.close()
@@ -2,12 +2,31 @@ from abc import ABC, abstractmethod
 import pandas as pd
 import numpy as np
 import time
+from datetime import timezone
+from numpy.lib.stride_tricks import sliding_window_view
 from loguru import logger
 
+from .window import KlineWindow
+from .indicators import IndicatorEngine
+from .levels import pivot_flags, cluster_levels, valid_levels, LevelRegistry
+from .features import FeatureStore
+from .cache import bar_end
+from .regime import HTFRegime
+
+# Старший ТФ для фильтра тренда
+HTF_INTERVALS = {"15": "60", "60": "240"}
+
 class BaseStrategy(ABC):
-    # Статический кэш для предотвращения повторных расчетов внутри одного цикла сканирования
-    _analysis_cache = {}
-    _trend_cache = {} 
+    # Инкрементальные индикаторы по (тикер, интервал): одна новая свеча — O(1)
+    _indicators = IndicatorEngine()
+    # Фракталы по (тикер, интервал, window), живут между сканами и перезапусками
+    _levels = LevelRegistry()
+    # Кадры признаков: одна загрузка истории на (тикер, интервал, момент) для всех стратегий
+    _features = FeatureStore(_indicators, _levels)
+    # Тренд старшего ТФ: пересчет только на закрытии его свечи (и в Live, и в бэктесте)
+    _regime = HTFRegime(_features)
+    # Буферы свечей из WebSocket (KlineBook): в Live данные берутся из них без REST
+    _klines = None
     def __init__(self, session, ticker, interval, db_manager, is_backtest=False, params=None):
         self.session = session
         self.ticker = ticker
@@ -18,168 +37,242 @@ class BaseStrategy(ABC):
 
     def get_data(self, limit=200):
         """
-        Получение данных. В Live-режиме всегда отрезает текущую незакрытую свечу
-        для полной синхронизации с логикой бэктеста.
+        Получение данных в виде KlineWindow (колонки NumPy, от старых к новым).
+        Это срез общего кадра признаков: история грузится один раз на
+        (тикер, интервал, момент) с глубиной FEATURE_LOOKBACK для всех стратегий,
+        а каждая получает ровно limit свечей.
         """
-        # Ключ кэша: (тикер, интервал, метка времени)
-        # В Live кэш живет 1 минуту
-        now_mark = self.session.sim_time if self.is_backtest else int(time.time() // 60)
-        cache_key = (self.ticker, self.interval, now_mark)
+        if limit > BaseStrategy._features.lookback:
+            return self.load_window(self.interval, limit)
+        return self.features().view(limit)
+
+    def features(self, interval=None):
+        """Кадр признаков (FeatureFrame) серии на текущий момент"""
+        interval = interval or self.interval
+        loader = lambda limit: self.load_window(interval, limit)
+        if self.is_backtest:
+            # Ключ кадра: (тикер, интервал, время симуляции)
+            return BaseStrategy._features.frame(self.ticker, interval, self.session.sim_time, loader)
 
-        if cache_key in BaseStrategy._analysis_cache:
-            return BaseStrategy._analysis_cache[cache_key]
+        # В Live ключ — последняя закрытая свеча, кадр живет до закрытия текущей
+        mark = self.bar_mark(interval)
+        expires_at = mark // 1000 + 2 * int(interval) * 60
+        return BaseStrategy._features.frame(self.ticker, interval, mark, loader, expires_at=expires_at, last_time=mark)
 
+    def load_window(self, interval, limit):
+        """
+        Загрузка limit закрытых свечей. В Live-режиме всегда отрезает текущую
+        незакрытую свечу для полной синхронизации с логикой бэктеста.
+        """
         try:
+            if self.is_backtest and hasattr(self.session, 'get_window'):
+                # Бэктест: read-only срезы предзагруженной истории без list -> DataFrame
+                return self.session.get_window(self.ticker, interval, limit)
+
+            if not self.is_backtest and BaseStrategy._klines is not None:
+                # Live с WebSocket: только подтвержденные свечи из буфера, без сети
+                return BaseStrategy._klines.get_window(self.ticker, interval, limit)
+
             # В Live запрашиваем на 1 свечу больше, чтобы отбросить "живую"
             fetch_limit = limit + 1 if not self.is_backtest else limit
             
             response = self.session.get_kline(
-                category="linear", symbol=self.ticker, interval=self.interval, limit=fetch_limit
+                category="linear", symbol=self.ticker, interval=interval, limit=fetch_limit
             )
             klines = response.get('result', {}).get('list', [])
-            if not klines:
-                return pd.DataFrame()
 
-            # Формируем DataFrame
-            df = pd.DataFrame(klines, columns=['time_ms', 'open', 'high', 'low', 'close', 'volume', 'turnover'])
-            
-            # Быстрое приведение к числам
-            num_cols = ['open', 'high', 'low', 'close', 'volume']
-            df[num_cols] = df[num_cols].astype(float)
-            
-            # Переворачиваем в хронологию
-            df = df.iloc[::-1].reset_index(drop=True)
+            # Окно в хронологическом порядке (числа сразу во float)
+            df = KlineWindow.from_klines(klines)
 
             # ВАЖНО: В Live отсекаем последнюю (текущую) свечу
-            if not self.is_backtest:
-                df = df.iloc[:-1].reset_index(drop=True)
-
-            # Сохраняем в кэш
-            BaseStrategy._analysis_cache[cache_key] = df
-            
-            # Очистка старого кэша при раздувании
-            if len(BaseStrategy._analysis_cache) > 500:
-                BaseStrategy._analysis_cache.clear()
-
+            if not self.is_backtest and not df.empty:
+                df = df[:-1]
             return df
         except Exception as e:
             logger.error(f"Ошибка получения данных для {self.ticker}: {e}")
-            return pd.DataFrame()
+            return KlineWindow.from_klines([])
+
+    def indicators(self, df, interval=None):
+        """Состояние инкрементальных индикаторов на последней свече окна df"""
+        return BaseStrategy._indicators.sync(self.ticker, interval or self.interval, df)
 
     def calculate_atr(self, df, period=14):
-        """Скоростной расчет ATR через NumPy"""
+        """ATR(14) и ATR% последней свечи из движка индикаторов"""
         if len(df) < period + 1:
             return 0.0, 0.0
-        
-        high = df['high'].values
-        low = df['low'].values
-        prev_close = df['close'].shift(1).values
-
-        tr = np.maximum(high - low, 
-                np.maximum(abs(high - prev_close), 
-                abs(low - prev_close)))
-        
-        atr = np.nanmean(tr[-period:])
-        atr_pct = (atr / df['close'].iloc[-1]) * 100
-        return float(atr), float(atr_pct)
+        ind = self.indicators(df)
+        return ind.atr, float(ind.atr_pct)
 
     def find_levels(self, df, window=7):
-        """Поиск фрактальных уровней ( window=7 оптимально для 15м/60м )"""
+        """
+        Фрактальные уровни окна df ( window=7 оптимально для 15м/60м ), по возрастанию цены.
+        Берутся из реестра уровней, который между сканами лишь дополняется новыми пивотами.
+        """
         if len(df) < window * 2 + 1:
             return [], []
-        
-        highs = df['high'].values
-        lows = df['low'].values
-        res_levels = []
-        sup_levels = []
-
-        for i in range(window, len(df) - window):
-            # Сопротивление
-            if all(highs[i] >= highs[i-window:i]) and all(highs[i] > highs[i+1:i+window+1]):
-                res_levels.append(highs[i])
-            # Поддержка
-            if all(lows[i] <= lows[i-window:i]) and all(lows[i] < lows[i+1:i+window+1]):
-                sup_levels.append(lows[i])
-        
-        return res_levels, sup_levels
+        return BaseStrategy._levels.sync(self.ticker, self.interval, window, df)
 
     def cluster_levels(self, levels, atr_pct):
         """Объединение близких уровней"""
-        if not levels: return []
-        threshold = (atr_pct / 100) * 0.7 
-        sorted_lvls = sorted(levels)
-        clusters = []
-        if not sorted_lvls: return []
-        
-        current_cluster = [sorted_lvls[0]]
-        for i in range(1, len(sorted_lvls)):
-            avg = np.mean(current_cluster)
-            if (sorted_lvls[i] - avg) / avg < threshold:
-                current_cluster.append(sorted_lvls[i])
-            else:
-                clusters.append(np.mean(current_cluster))
-                current_cluster = [sorted_lvls[i]]
-        clusters.append(np.mean(current_cluster))
-        return clusters
+        return cluster_levels(levels, atr_pct)
 
     def analyze_volume_spike(self, df, multiplier=1.3):
         """Проверка всплеска объема относительно среднего"""
         if len(df) < 21: return False
-        avg_vol = df['volume'].iloc[-21:-1].mean()
-        return df['volume'].iloc[-1] > (avg_vol * multiplier)
+        ind = self.indicators(df)
+        return ind.volume > (ind.volume_avg * multiplier)
 
     def get_htf_trend(self):
-        """Определение тренда с кэшированием на 10 минут"""
-        now_ts = time.time()
-        cache_key = (self.ticker, self.interval)
-        
-        # Если в кэше есть свежий тренд (младше 10 минут) - берем его
-        if not self.is_backtest and cache_key in BaseStrategy._trend_cache:
-            ts, val = BaseStrategy._trend_cache[cache_key]
-            if now_ts - ts < 600: # 600 секунд = 10 минут
-                return val
-
-        # Если нет - делаем запрос (твой старый код)
-        htf_interval = "60" if self.interval == "15" else "240"
-        old_interval = self.interval
-        self.interval = htf_interval
-        df_htf = self.get_data(limit=250)
-        self.interval = old_interval
-        
-        res = 0
-        if not df_htf.empty and len(df_htf) >= 200:
-            ema200 = df_htf['close'].ewm(span=200, adjust=False).mean().iloc[-1]
-            current = df_htf['close'].iloc[-1]
-            if current > ema200 * 1.0002: res = 1
-            elif current < ema200 * 0.9998: res = -1
-
-        # Сохраняем в кэш
-        if not self.is_backtest:
-            BaseStrategy._trend_cache[cache_key] = (now_ts, res)
-        
-        return res
+        """Тренд старшего ТФ (EMA200), пересчитывается только на закрытии его свечи"""
+        lookback = BaseStrategy._features.lookback
+        loader = lambda interval, limit: self.features(interval).view(limit) if limit <= lookback else self.load_window(interval, limit)
+        return BaseStrategy._regime.trend(self.ticker, self.htf_interval(), self.bar_mark, loader)
+
+    def bar_mark(self, interval):
+        """Время открытия (мс) последней доступной свечи интервала на текущий момент"""
+        step = int(interval) * 60_000
+        if self.is_backtest:
+            # В бэктесте свеча доступна с минуты своего открытия (BacktestSession)
+            now_ms = int(self.session.sim_time.replace(tzinfo=timezone.utc).timestamp()) * 1000
+            return now_ms // step * step
+        return bar_end(time.time(), interval) * 1000 - 2 * step
+
+    @staticmethod
+    def cache_stats():
+        """Счетчики кэшей стратегий с прошлого вызова (лог раз в скан)"""
+        return [BaseStrategy._features.cache.stats(), BaseStrategy._regime.cache.stats()]
+
+    def htf_interval(self):
+        return HTF_INTERVALS.get(self.interval, "240")
 
     def check_level_quality(self, df, level, level_type, atr_pct):
         """Проверка надежности уровня по всей истории DataFrame"""
-        zone = level * (atr_pct / 100) * 0.4
-        touches = 0
-        violations = 0 
-        
-        for i in range(len(df)):
-            low, high = df['low'].iloc[i], df['high'].iloc[i]
-            body_max = max(df['open'].iloc[i], df['close'].iloc[i])
-            body_min = min(df['open'].iloc[i], df['close'].iloc[i])
-            
-            if level_type == 'resistance':
-                if high >= level - zone and high <= level + zone: touches += 1
-                if body_max > level + zone: violations += 1
-            else:
-                if low >= level - zone and low <= level + zone: touches += 1
-                if body_min < level - zone: violations += 1
-        
         # Уровень годен, если было хоть одно подтверждающее касание
-        return touches >= 1 and (violations <= touches)
+        return bool(valid_levels(df['open'], df['high'], df['low'], df['close'], [level], level_type, atr_pct))
+
+    def filter_levels(self, df, res_raw, sup_raw, atr_pct):
+        """Кластеризация уровней и отсев ненадежных по истории окна (все уровни разом)"""
+        columns = (df['open'], df['high'], df['low'], df['close'])
+        valid_res = valid_levels(*columns, self.cluster_levels(res_raw, atr_pct), 'resistance', atr_pct)
+        valid_sup = valid_levels(*columns, self.cluster_levels(sup_raw, atr_pct), 'support', atr_pct)
+        return valid_res, valid_sup
+
+    def window_starts(self, n, limit):
+        """Начало окна get_data(limit) для каждого бара, если бар — последний в окне"""
+        return np.maximum(np.arange(n) - (limit - 1), 0)
 
     @abstractmethod
     def check_signal(self):
-        pass
\ No newline at end of file
+        pass
+
+    # --- Пакетный режим: сигналы сразу по всей истории (бэктест) ---
+
+    @abstractmethod
+    def generate_signals(self, df, htf_trend):
+        """
+        Сигналы для каждого бара истории df так, как их вернул бы check_signal,
+        если бы этот бар был последним в окне get_data(limit) стратегии.
+        htf_trend — массив тренда старшего ТФ на каждый бар (batch_htf_trend).
+        Возвращает массивы side (1 long / -1 short / 0), entry, sl, tp, atr.
+        """
+
+    def new_signal_arrays(self, n):
+        nan = np.full(n, np.nan)
+        return {'side': np.zeros(n, dtype=np.int8), 'entry': nan.copy(), 'sl': nan.copy(), 'tp': nan.copy(), 'atr': nan}
+
+    def store_signal(self, out, i, signal):
+        if signal:
+            out['side'][i] = 1 if signal['signal'] == 'long' else -1
+            for key in ('entry', 'sl', 'tp', 'atr'):
+                out[key][i] = signal[key]
+
+    def batch_atr(self, df, period=14):
+        """calculate_atr для каждого бара (окно из period последних TR)"""
+        high = np.asarray(df['high'])
+        low = np.asarray(df['low'])
+        close = np.asarray(df['close'])
+        prev_close = np.concatenate(([np.nan], close[:-1]))
+        tr = np.maximum(high - low, np.maximum(abs(high - prev_close), abs(low - prev_close)))
+
+        atr = np.full(len(close), np.nan)
+        if len(close) >= period:
+            atr[period-1:] = np.nanmean(sliding_window_view(tr, period), axis=1)
+        return atr, (atr / close) * 100
+
+    def batch_volume_avg(self, df, period=20):
+        """Средний объем за period свечей перед каждым баром (как в analyze_volume_spike)"""
+        volume = np.asarray(df['volume'])
+        avg = np.full(len(volume), np.nan)
+        if len(volume) > period:
+            avg[period:] = sliding_window_view(volume, period)[:-1].mean(axis=1)
+        return avg
+
+    def batch_rolling(self, values, period, func):
+        """func (np.max/np.min) по period значениям перед каждым баром, без самого бара"""
+        values = np.asarray(values)
+        out = np.full(len(values), np.nan)
+        if len(values) > period:
+            out[period:] = func(sliding_window_view(values, period)[:-1], axis=1)
+        return out
+
+    def batch_pivots(self, df, window=7):
+        """
+        Флаги фракталов find_levels по всей истории. Условие смотрит только на
+        window свечей по обе стороны, поэтому для любого окна истории его
+        уровни — это флаги на позициях [start + window, end - window].
+        """
+        return pivot_flags(df['high'], df['low'], window)
+
+    def window_levels(self, df, start, end, res_flags, sup_flags, window=7):
+        """Уровни find_levels для окна истории [start, end] по готовым флагам batch_pivots"""
+        highs = np.asarray(df['high'])
+        lows = np.asarray(df['low'])
+        if end - start + 1 < window * 2 + 1:
+            return [], []
+        part = slice(start + window, end - window + 1)
+        return list(highs[part][res_flags[part]]), list(lows[part][sup_flags[part]])
+
+    def window_ema(self, values, span, length):
+        """
+        EMA как pandas ewm(span, adjust=False).mean() для каждого бара по окну из
+        length последних значений (пересчет с начала окна, как в check_signal).
+        Возвращает (last, prev): EMA на последнем и на предпоследнем баре окна.
+        """
+        values = np.asarray(values, dtype=float)
+        n = len(values)
+        alpha = 1. / (1. + (span - 1) / 2.)
+        old_wt = 1. - alpha
+        ends = np.arange(n)
+        starts = np.maximum(ends - (length - 1), 0)
+
+        last = values[starts].copy()
+        prev = np.full(n, np.nan)
+        for k in range(1, length):
+            pos = starts + k
+            active = pos <= ends
+            if not active.any():
+                break
+            prev = np.where(pos == ends, last, prev)
+            cur = values[np.minimum(pos, n - 1)]
+            # Та же формула и та же проверка weighted != cur, что внутри pandas
+            step = active & (last != cur)
+            last = np.where(step, (old_wt * last + alpha * cur) / (old_wt + alpha), last)
+        return last, prev
+
+    def batch_htf_trend(self, df_htf, times, lag_ms=0):
+        """
+        get_htf_trend на момент открытия каждого бара: EMA200 по 250 свечам старшего ТФ.
+        lag_ms — задержка доступности свечи старшего ТФ после ее открытия (у собранных из 60м).
+        """
+        trend = np.zeros(len(times), dtype=np.int8)
+        if df_htf is None or df_htf.empty:
+            return trend
+
+        closes = np.asarray(df_htf['close'])
+        ema200, _ = self.window_ema(closes, 200, 250)
+        htf = np.where(closes > ema200 * 1.0002, 1, np.where(closes < ema200 * 0.9998, -1, 0)).astype(np.int8)
+        htf[:199] = 0 # Меньше 200 свечей в окне — тренд не определен
+
+        idx = np.searchsorted(np.asarray(df_htf['time_ms']) + lag_ms, np.asarray(times), side='right') - 1
+        trend[idx >= 0] = htf[idx[idx >= 0]]
+        return trend
\ No newline at end of file
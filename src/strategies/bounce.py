@@ -1,11 +1,13 @@
 import pandas as pd
 import numpy as np
 from .base import BaseStrategy
+from .levels import nearest_above, nearest_below
 
 class BounceStrategy(BaseStrategy):
     def check_signal(self):
         # 1. Загрузка данных
-        df = self.get_data(limit=150)
+        features = self.features()
+        df = features.view(150)
         if df.empty or len(df) < 100: 
             return None
 
@@ -14,35 +16,52 @@ class BounceStrategy(BaseStrategy):
         tp_mult = self.params.get('bounce_tp', 4.5) # Используем наш оптимизированный ТП
 
         # 3. Расчет индикаторов
-        atr, atr_pct = self.calculate_atr(df)
+        atr, atr_pct = features.atr, features.atr_pct
         if atr <= 0: return None
 
-        current_close = df['close'].iloc[-1]
-        current_high = df['high'].iloc[-1]
-        current_low = df['low'].iloc[-1]
+        current_close = df['close'][-1]
+        current_high = df['high'][-1]
+        current_low = df['low'][-1]
         
         # 4. Поиск и фильтрация уровней
-        res_raw, sup_raw = self.find_levels(df, window=7)
+        res_raw, sup_raw = features.levels(150, window=7)
         
         # Используем методы из BaseStrategy
-        valid_res = [r for r in self.cluster_levels(res_raw, atr_pct) 
-                     if self.check_level_quality(df, r, 'resistance', atr_pct)]
-        
-        valid_sup = [s for s in self.cluster_levels(sup_raw, atr_pct) 
-                     if self.check_level_quality(df, s, 'support', atr_pct)]
+        valid_res, valid_sup = self.filter_levels(df, res_raw, sup_raw, atr_pct)
 
         # 5. Глобальный тренд (HTF)
         htf_trend = self.get_htf_trend()
 
+        return self._decide(htf_trend, atr, current_close, current_high, current_low, valid_res, valid_sup, sl_mult, tp_mult)
+
+    def generate_signals(self, df, htf_trend):
+        """Пакетный check_signal по всей истории (окно 150 свечей, минимум 100)"""
+        n = len(df)
+        out = self.new_signal_arrays(n)
+        sl_mult = self.params.get('bounce_sl', 1.5)
+        tp_mult = self.params.get('bounce_tp', 4.5)
+
+        atr, atr_pct = self.batch_atr(df)
+        res_flags, sup_flags = self.batch_pivots(df, window=7)
+        starts = self.window_starts(n, 150)
+        closes, highs, lows = np.asarray(df['close']), np.asarray(df['high']), np.asarray(df['low'])
+
+        for i in np.flatnonzero((np.arange(n) >= 99) & (atr > 0)):
+            res_raw, sup_raw = self.window_levels(df, starts[i], i, res_flags, sup_flags, window=7)
+            valid_res, valid_sup = self.filter_levels(df[starts[i]:i+1], res_raw, sup_raw, atr_pct[i])
+            self.store_signal(out, i, self._decide(
+                htf_trend[i], atr[i], closes[i], highs[i], lows[i], valid_res, valid_sup, sl_mult, tp_mult
+            ))
+        return out
+
+    def _decide(self, htf_trend, atr, current_close, current_high, current_low, valid_res, valid_sup, sl_mult, tp_mult):
         # 6. Поиск ближайших границ коридора
-        upper_levels = [r for r in valid_res if r > current_close * 1.001]
-        lower_levels = [s for s in valid_sup if s < current_close * 0.999]
+        # Уровни идут по возрастанию цены — ищем бинарным поиском
+        nearest_res = nearest_above(valid_res, current_close * 1.001)
+        nearest_sup = nearest_below(valid_sup, current_close * 0.999)
 
-        if not upper_levels or not lower_levels:
+        if nearest_res is None or nearest_sup is None:
             return None # Стратегии нужен четкий канал
-
-        nearest_res = min(upper_levels)
-        nearest_sup = max(lower_levels)
         
         # Зона входа (20% от ATR)
         entry_zone = atr * 0.2
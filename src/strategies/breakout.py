@@ -1,4 +1,5 @@
 import pandas as pd
+import numpy as np
 from .base import BaseStrategy
 
 class BreakoutStrategy(BaseStrategy):
@@ -8,8 +9,9 @@ class BreakoutStrategy(BaseStrategy):
         if htf_trend == 0: 
             return None
 
-        # 2. Получение данных
-        df = self.get_data(limit=100)
+        # 2. Получение данных (срез общего кадра признаков)
+        features = self.features()
+        df = features.view(100)
         if df.empty or len(df) < 50: 
             return None
 
@@ -18,20 +20,47 @@ class BreakoutStrategy(BaseStrategy):
         sl_mult = self.params.get('breakout_sl', 1.0)
         tp_mult = self.params.get('breakout_tp', 4.0)  # Увеличили тейк для лучшего RR
 
-        atr, _ = self.calculate_atr(df)
+        atr = features.atr
         if atr <= 0: return None
         
-        last_close = df['close'].iloc[-1]
-        last_open = df['open'].iloc[-1]
+        last_close = df['close'][-1]
+        last_open = df['open'][-1]
         
         # 4. Определение границ канала за последние 30 закрытых свечей
         lookback = 30
-        channel_high = df['high'].iloc[-(lookback+1):-1].max()
-        channel_low = df['low'].iloc[-(lookback+1):-1].min()
+        channel_high = df['high'][-(lookback+1):-1].max()
+        channel_low = df['low'][-(lookback+1):-1].min()
         
         # 5. Проверка всплеска объема
-        volume_ok = self.analyze_volume_spike(df, multiplier=vol_mult)
+        volume_ok = features.volume_spike(vol_mult)
 
+        return self._decide(htf_trend, atr, last_close, last_open, channel_high, channel_low, volume_ok, sl_mult, tp_mult)
+
+    def generate_signals(self, df, htf_trend):
+        """Пакетный check_signal по всей истории (окно 100 свечей, минимум 50)"""
+        n = len(df)
+        out = self.new_signal_arrays(n)
+        vol_mult = self.params.get('breakout_vol', 1.5)
+        sl_mult = self.params.get('breakout_sl', 1.0)
+        tp_mult = self.params.get('breakout_tp', 4.0)
+
+        atr, _ = self.batch_atr(df)
+        lookback = 30
+        channel_high = self.batch_rolling(df['high'], lookback, np.max)
+        channel_low = self.batch_rolling(df['low'], lookback, np.min)
+        volume = np.asarray(df['volume'])
+        volume_ok = volume > self.batch_volume_avg(df) * vol_mult
+        closes, opens = np.asarray(df['close']), np.asarray(df['open'])
+
+        # Окно 100 свечей набирает минимум 50 с 50-го бара истории
+        candidates = np.flatnonzero((htf_trend != 0) & (np.arange(n) >= 49) & (atr > 0))
+        for i in candidates:
+            self.store_signal(out, i, self._decide(
+                htf_trend[i], atr[i], closes[i], opens[i], channel_high[i], channel_low[i], volume_ok[i], sl_mult, tp_mult
+            ))
+        return out
+
+    def _decide(self, htf_trend, atr, last_close, last_open, channel_high, channel_low, volume_ok, sl_mult, tp_mult):
         # --- ЛОГИКА LONG ---
         if htf_trend == 1:
             # Условия: Закрылись выше канала, открылись внутри/ниже, цена не улетела слишком далеко (0.5 ATR)
@@ -66,4 +95,4 @@ class BreakoutStrategy(BaseStrategy):
                             'strategy': f'breakout_{self.interval}'
                         }
 
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import OrderedDict
+
+def bar_end(now_s, interval):
+    """Момент (unix, с) закрытия текущей свечи интервала interval (минуты)"""
+    step = int(interval) * 60
+    return (int(now_s) // step + 1) * step
+
+
+class TTLCache:
+    """
+    Потокобезопасный кэш: LRU-вытеснение по числу записей и по суммарному
+    размеру (sizeof), плюс срок жизни каждой записи (expires_at, unix-время).
+    Счетчики hits/misses/evictions/expired снимаются раз в скан через stats().
+    """
+    def __init__(self, name, max_entries=1000, max_bytes=None, sizeof=None, clock=time.time):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.clock = clock
+        self._data = OrderedDict() # key -> (value, expires_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._reset_counters()
+
+    def _reset_counters(self):
+        self.hits = self.misses = self.evictions = self.expired = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def _drop(self, key):
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            if item[1] is not None and item[1] <= self.clock():
+                self._drop(key)
+                self.expired += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value, expires_at=None):
+        size = self.sizeof(value) if self.sizeof else 0
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (value, expires_at, size)
+            self._bytes += size
+            self._evict()
+
+    def _over_limit(self):
+        return len(self._data) > self.max_entries or (self.max_bytes and self._bytes > self.max_bytes)
+
+    def _evict(self):
+        if not self._over_limit():
+            return
+        # При переполнении сначала выбрасываем просроченные, затем самые давно использованные
+        now = self.clock()
+        for key in [k for k, (_, exp, _) in self._data.items() if exp is not None and exp <= now]:
+            self._drop(key)
+            self.expired += 1
+        while self._data and self._over_limit():
+            self._drop(next(iter(self._data)))
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self, reset=True):
+        """Счетчики с прошлого снятия: для лога раз в скан"""
+        with self._lock:
+            total = self.hits + self.misses
+            stats = {
+                'name': self.name, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'evictions': self.evictions, 'expired': self.expired,
+                'size': len(self._data), 'bytes': self._bytes,
+            }
+            if reset:
+                self._reset_counters()
+            return stats
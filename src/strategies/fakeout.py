@@ -1,10 +1,12 @@
 import pandas as pd
+import numpy as np
 from .base import BaseStrategy
 
 class FakeoutStrategy(BaseStrategy):
     def check_signal(self):
         # 1. Получение данных
-        df = self.get_data(limit=150)
+        features = self.features()
+        df = features.view(150)
         if df.empty or len(df) < 60: 
             return None
 
@@ -13,42 +15,64 @@ class FakeoutStrategy(BaseStrategy):
         tp_mult = self.params.get('fakeout_tp', 2.5) # Тейк-профит
 
         # 3. Индикаторы
-        atr, atr_pct = self.calculate_atr(df)
+        atr, atr_pct = features.atr, features.atr_pct
         if atr <= 0: return None
         
-        last_candle = df.iloc[-1]
+        last_high, last_low, last_close = df['high'][-1], df['low'][-1], df['close'][-1]
         
         # 4. Поиск и фильтрация уровней (window=10 для сильных зон)
-        res_raw, sup_raw = self.find_levels(df, window=10)
-        valid_res = [r for r in self.cluster_levels(res_raw, atr_pct) 
-                     if self.check_level_quality(df, r, 'resistance', atr_pct)]
-        
-        valid_sup = [s for s in self.cluster_levels(sup_raw, atr_pct) 
-                     if self.check_level_quality(df, s, 'support', atr_pct)]
+        res_raw, sup_raw = features.levels(150, window=10)
+        valid_res, valid_sup = self.filter_levels(df, res_raw, sup_raw, atr_pct)
+
+        volume_spike = features.volume_spike(1.2)
+        htf_trend = self.get_htf_trend()
+
+        return self._decide(htf_trend, atr, last_high, last_low, last_close, valid_res, valid_sup, volume_spike, sl_mult, tp_mult)
 
+    def generate_signals(self, df, htf_trend):
+        """Пакетный check_signal по всей истории (окно 150 свечей, минимум 60)"""
+        n = len(df)
+        out = self.new_signal_arrays(n)
+        sl_mult = self.params.get('fakeout_sl', 1.0)
+        tp_mult = self.params.get('fakeout_tp', 2.5)
+
+        atr, atr_pct = self.batch_atr(df)
+        volume_spike = np.asarray(df['volume']) > self.batch_volume_avg(df) * 1.2
+        res_flags, sup_flags = self.batch_pivots(df, window=10)
+        starts = self.window_starts(n, 150)
+        closes, highs, lows = np.asarray(df['close']), np.asarray(df['high']), np.asarray(df['low'])
+
+        # Без всплеска объема сигнала нет при любых уровнях — их и не считаем
+        for i in np.flatnonzero((np.arange(n) >= 59) & (atr > 0) & volume_spike):
+            res_raw, sup_raw = self.window_levels(df, starts[i], i, res_flags, sup_flags, window=10)
+            valid_res, valid_sup = self.filter_levels(df[starts[i]:i+1], res_raw, sup_raw, atr_pct[i])
+            self.store_signal(out, i, self._decide(
+                htf_trend[i], atr[i], highs[i], lows[i], closes[i], valid_res, valid_sup, True, sl_mult, tp_mult
+            ))
+        return out
+
+    def _decide(self, htf_trend, atr, last_high, last_low, last_close, valid_res, valid_sup, volume_spike, sl_mult, tp_mult):
         # 5. Условия "закола" (от 0.3 до 1.5 ATR)
         min_poke, max_poke = atr * 0.3, atr * 1.5
-        volume_spike = self.analyze_volume_spike(df, multiplier=1.2)
-        htf_trend = self.get_htf_trend()
 
         # --- ЛОГИКА SHORT (Ложный пробой сопротивления) ---
         # В идеале торгуем, когда глобальный тренд не бычий
         if htf_trend <= 0:
             for level in valid_res:
-                poke_dist = last_candle['high'] - level
+                poke_dist = last_high - level
                 # Если хай свечи выше уровня, а закрытие под ним + объем
-                if min_poke < poke_dist < max_poke and last_candle['close'] < level and volume_spike:
+                if min_poke < poke_dist < max_poke and last_close < level and volume_spike:
                     
                     # Стоп за хай "закола" + отступ
-                    sl = last_candle['high'] + (atr * sl_mult * 0.2)
-                    tp = last_candle['close'] - (atr * tp_mult)
+                    sl = last_high + (atr * sl_mult * 0.2)
+                    tp = last_close - (atr * tp_mult)
                     
                     # Проверка Risk/Reward (минимум 1.5)
-                    risk = sl - last_candle['close']
-                    reward = last_candle['close'] - tp
+                    risk = sl - last_close
+                    reward = last_close - tp
                     if risk > 0 and (reward / risk) >= 1.5:
                         return {
-                            'ticker': self.ticker, 'signal': 'short', 'entry': last_candle['close'], 
+                            'ticker': self.ticker, 'signal': 'short', 'entry': last_close, 
                             'sl': sl, 'tp': tp, 'atr': atr, 
                             'strategy': f'fakeout_{self.interval}'
                         }
@@ -56,17 +80,17 @@ class FakeoutStrategy(BaseStrategy):
         # --- ЛОГИКА LONG (Ложный пробой поддержки) ---
         if htf_trend >= 0:
             for level in valid_sup:
-                poke_dist = level - last_candle['low']
-                if min_poke < poke_dist < max_poke and last_candle['close'] > level and volume_spike:
+                poke_dist = level - last_low
+                if min_poke < poke_dist < max_poke and last_close > level and volume_spike:
                     
-                    sl = last_candle['low'] - (atr * sl_mult * 0.2)
-                    tp = last_candle['close'] + (atr * tp_mult)
+                    sl = last_low - (atr * sl_mult * 0.2)
+                    tp = last_close + (atr * tp_mult)
                     
-                    risk = last_candle['close'] - sl
-                    reward = tp - last_candle['close']
+                    risk = last_close - sl
+                    reward = tp - last_close
                     if risk > 0 and (reward / risk) >= 1.5:
                         return {
-                            'ticker': self.ticker, 'signal': 'long', 'entry': last_candle['close'], 
+                            'ticker': self.ticker, 'signal': 'long', 'entry': last_close, 
                             'sl': sl, 'tp': tp, 'atr': atr, 
                             'strategy': f'fakeout_{self.interval}'
                         }
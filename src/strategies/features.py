@@ -0,0 +1,105 @@
+from .cache import TTLCache
+from .window import COLUMNS
+
+FEATURE_LOOKBACK = 250 # Самое длинное окно среди стратегий (Trend и тренд старшего ТФ)
+
+class FeatureFrame:
+    """
+    Окно глубиной FEATURE_LOOKBACK и общие признаки серии на его последней
+    закрытой свече. Стратегии получают из него срезы нужной длины (view),
+    а ATR, объем, уровни и тренд считаются один раз на всех.
+    """
+    def __init__(self, store, ticker, interval, window):
+        self.store = store
+        self.ticker = ticker
+        self.interval = interval
+        self.window = window
+        self.expires_at = None
+        self._levels = {}
+        self._trend = None
+
+        self.atr = self.atr_pct = 0.0
+        self.volume = self.volume_avg = None
+        if len(window) >= 15:
+            ind = store.indicators.sync(ticker, interval, window)
+            self.atr, self.atr_pct = ind.atr, float(ind.atr_pct)
+        if len(window) >= 21:
+            self.volume, self.volume_avg = ind.volume, ind.volume_avg
+
+    @property
+    def empty(self):
+        return self.window.empty
+
+    def view(self, limit):
+        """Последние limit свечей окна (read-only срез без копирования)"""
+        return self.window if limit >= len(self.window) else self.window[-limit:]
+
+    @property
+    def volume_ratio(self):
+        """Объем последней свечи к среднему за 20 предыдущих"""
+        return self.volume / self.volume_avg if self.volume_avg else 0.0
+
+    def volume_spike(self, multiplier):
+        return self.volume_avg is not None and self.volume > (self.volume_avg * multiplier)
+
+    def levels(self, limit, window):
+        """Фракталы окна из limit свечей (реестр уровней), один раз на кадр"""
+        key = (limit, window)
+        if key not in self._levels:
+            df = self.view(limit)
+            self._levels[key] = ([], []) if len(df) < window * 2 + 1 else self.store.levels.sync(self.ticker, self.interval, window, df)
+        return self._levels[key]
+
+    @property
+    def trend(self):
+        """Тренд по EMA200 на этом окне (используется как тренд старшего ТФ)"""
+        if self._trend is None:
+            res = 0
+            if len(self.window) >= 200:
+                ind = self.store.indicators.sync(self.ticker, self.interval, self.window)
+                ema200, _ = ind.ema(200, len(self.window))
+                if ind.close > ema200 * 1.0002: res = 1
+                elif ind.close < ema200 * 0.9998: res = -1
+            self._trend = res
+        return self._trend
+
+
+class FeatureStore:
+    """
+    Кадры признаков по (тикер, интервал, метка свечи): история грузится один
+    раз на максимальную глубину, сколько бы стратегий ее ни запросило.
+    Кадры лежат в TTLCache: LRU по числу и объему окон, срок — до закрытия свечи.
+    """
+    def __init__(self, indicators, levels, lookback=FEATURE_LOOKBACK, max_frames=1000, max_bytes=64 * 1024 * 1024):
+        self.indicators = indicators
+        self.levels = levels
+        self.lookback = lookback
+        self.cache = TTLCache('features', max_entries=max_frames, max_bytes=max_bytes, sizeof=frame_size)
+
+    def frame(self, ticker, interval, mark, loader, expires_at=None, last_time=None):
+        """
+        loader(limit) -> KlineWindow закрытых свечей; вызывается только при промахе.
+        last_time — ожидаемое время открытия последней закрытой свечи (мс): если
+        биржа еще не отдала ее, кадр живет не дольше минуты, а не до конца свечи.
+        """
+        key = (ticker, interval, mark)
+        frame = self.cache.get(key)
+        if frame is not None:
+            return frame
+
+        frame = FeatureFrame(self, ticker, interval, loader(self.lookback))
+        if frame.empty:
+            return frame # Пустой ответ не кэшируем: следующая стратегия попробует снова
+        if expires_at is not None and last_time is not None and int(frame.window['time_ms'][-1]) != last_time:
+            expires_at = min(expires_at, self.cache.clock() + 60)
+        frame.expires_at = expires_at
+        self.cache.set(key, frame, expires_at)
+        return frame
+
+    def clear(self):
+        self.cache.clear()
+
+
+def frame_size(frame):
+    """Объем колонок окна кадра в байтах (для лимита памяти кэша)"""
+    return sum(frame.window[name].nbytes for name in COLUMNS)
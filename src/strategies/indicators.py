@@ -0,0 +1,175 @@
+import threading
+from collections import deque
+import numpy as np
+
+EMA_SPANS = (9, 21, 50, 200)
+
+class IndicatorState:
+    """
+    Индикаторы одной серии (тикер, интервал), которые обновляются за O(1) на
+    каждую новую закрытую свечу: ATR, EMA, ADX и средний объем.
+    Значения считаются на последней свече последнего окна, переданного в sync.
+    """
+    def __init__(self, spans=EMA_SPANS, capacity=250, period=14, volume_period=20):
+        self.spans = spans
+        self.capacity = capacity # Самое длинное окно, для которого можно спросить EMA
+        self.period = period
+        self.volume_period = volume_period
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.first_time = self.last_time = None
+        self.high = self.low = self.close = self.volume = None
+        self.tr = deque(maxlen=self.period)
+        self.prev_volumes = deque(maxlen=self.volume_period)
+        # EMA ведется по всей истории серии, а для окна пересчитывается через
+        # поправку: W_t = E_t - (1-a)^(t-s) * (E_s - x_s), s — первая свеча окна
+        self.ema_full = dict.fromkeys(self.spans)
+        self.ema_prev = dict.fromkeys(self.spans)
+        self.ema_gap = {span: deque(maxlen=self.capacity) for span in self.spans}
+        # ADX: скользящие окна +DM, -DM, TR и DX
+        self.adx_plus = deque(maxlen=self.period)
+        self.adx_minus = deque(maxlen=self.period)
+        self.adx_tr = deque(maxlen=self.period)
+        self.dx = deque(maxlen=self.period)
+
+    def sync(self, df):
+        """Догоняет окно df (KlineWindow): новые свечи по одной, при разрыве — пересборка"""
+        times = np.asarray(df['time_ms'])
+        if not len(times):
+            return self
+
+        start = 0
+        if self.last_time is not None and self.first_time <= times[0] and times[-1] >= self.last_time:
+            pos = int(np.searchsorted(times, self.last_time))
+            if pos < len(times) and times[pos] == self.last_time:
+                start = pos + 1
+        if start == 0:
+            # Окно не продолжает накопленную историю (старт, разрыв, откат времени)
+            self.reset()
+
+        opens, highs, lows = df['open'], df['high'], df['low']
+        closes, volumes = df['close'], df['volume']
+        for i in range(start, len(times)):
+            self.update(int(times[i]), float(highs[i]), float(lows[i]), float(closes[i]), float(volumes[i]))
+        return self
+
+    def update(self, time_ms, high, low, close, volume):
+        """Одна новая закрытая свеча"""
+        if self.first_time is None:
+            self.first_time = time_ms
+        prev_high, prev_low, prev_close = self.high, self.low, self.close
+
+        # TR: у первой свечи нет предыдущего закрытия, как и в calculate_atr
+        if prev_close is None:
+            tr = np.nan
+        else:
+            tr = max(high - low, abs(high - prev_close), abs(low - prev_close))
+        self.tr.append(tr)
+
+        if self.volume is not None:
+            self.prev_volumes.append(self.volume)
+
+        for span in self.spans:
+            alpha = 2. / (span + 1.)
+            ema = self.ema_full[span]
+            self.ema_prev[span] = ema
+            # Формула pandas ewm(adjust=False)
+            if ema is None:
+                ema = close
+            elif ema != close:
+                ema = ((1. - alpha) * ema + alpha * close) / ((1. - alpha) + alpha)
+            self.ema_full[span] = ema
+            self.ema_gap[span].append(ema - close)
+
+        self._update_adx(high, low, prev_high, prev_low, tr)
+
+        self.high, self.low, self.close, self.volume = high, low, close, volume
+        self.last_time = time_ms
+        self.count += 1
+
+    def _update_adx(self, high, low, prev_high, prev_low, tr):
+        if prev_high is None:
+            plus_dm = minus_dm = 0.
+        else:
+            up = max(high - prev_high, 0.)
+            down = max(prev_low - low, 0.)
+            plus_dm = up if (up > down and up > 0) else 0.
+            # Как в TrendStrategy.calculate_adx: сравнение с уже отфильтрованным +DM
+            minus_dm = down if (down > plus_dm and down > 0) else 0.
+        self.adx_plus.append(plus_dm)
+        self.adx_minus.append(minus_dm)
+        self.adx_tr.append(tr)
+
+        dx = np.nan
+        if len(self.adx_tr) == self.period:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                atr_s = np.float64(np.mean(self.adx_tr))
+                plus_di = 100 * (np.float64(np.mean(self.adx_plus)) / atr_s)
+                minus_di = 100 * (np.float64(np.mean(self.adx_minus)) / atr_s)
+                dx = 100 * abs(plus_di - minus_di) / (plus_di + minus_di)
+        self.dx.append(dx)
+
+    @property
+    def atr(self):
+        """ATR как в calculate_atr: среднее последних period TR"""
+        if len(self.tr) < self.period:
+            return 0.0
+        return float(np.nanmean(self.tr))
+
+    @property
+    def atr_pct(self):
+        return (self.atr / self.close) * 100 if self.close else 0.0
+
+    @property
+    def volume_avg(self):
+        """Средний объем за volume_period свечей перед последней"""
+        if len(self.prev_volumes) < self.volume_period:
+            return None
+        return np.mean(self.prev_volumes)
+
+    @property
+    def adx(self):
+        """ADX последней свечи (0, если истории не хватает), как в calculate_adx"""
+        if len(self.dx) < self.period:
+            return 0
+        adx = np.mean(self.dx)
+        return adx if not np.isnan(adx) else 0
+
+    def ema(self, span, length):
+        """
+        (last, prev) EMA(span) для окна из length последних свечей: то же, что
+        ewm(span, adjust=False) по этому окну на последней и предпоследней свече.
+        """
+        length = min(length, self.count, self.capacity)
+        if length == 0:
+            return np.nan, np.nan
+
+        decay = 1. - 2. / (span + 1.)
+        gap = self.ema_gap[span][-length]
+        last = self.ema_full[span] - decay ** (length - 1) * gap
+        prev = self.ema_prev[span] - decay ** (length - 2) * gap if length > 1 else np.nan
+        return last, prev
+
+
+class IndicatorEngine:
+    """Реестр IndicatorState по (тикер, интервал), общий для live и бэктеста"""
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def sync(self, ticker, interval, df):
+        """Состояние серии, доведенное до последней свечи окна df"""
+        key = (ticker, interval)
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                state = self._states[key] = IndicatorState()
+        with state.lock:
+            return state.sync(df)
+
+    def clear(self):
+        with self._lock:
+            self._states.clear()
@@ -0,0 +1,305 @@
+import bisect
+import json
+import os
+import threading
+from collections import deque
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+def pivot_flags(highs, lows, window=7):
+    """
+    Флаги фракталов по всему массиву за один проход NumPy.
+    Сопротивление: high >= window свечей слева и строго > window свечей справа.
+    Поддержка: low <= слева и строго < справа. Крайние window свечей — False.
+    """
+    highs = np.asarray(highs)
+    lows = np.asarray(lows)
+    n = len(highs)
+    res = np.zeros(n, dtype=bool)
+    sup = np.zeros(n, dtype=bool)
+    if n < window * 2 + 1:
+        return res, sup
+
+    h_win = sliding_window_view(highs, window)
+    l_win = sliding_window_view(lows, window)
+    mid = slice(window, n - window)
+    # h_win[k] = highs[k:k+window]: слева от i это k = i-window, справа k = i+1
+    res[mid] = (highs[mid] >= h_win[:n-2*window].max(axis=1)) & (highs[mid] > h_win[window+1:].max(axis=1))
+    sup[mid] = (lows[mid] <= l_win[:n-2*window].min(axis=1)) & (lows[mid] < l_win[window+1:].min(axis=1))
+    return res, sup
+
+
+def find_pivots(highs, lows, window=7):
+    """Уровни фракталов (res_levels, sup_levels) в хронологическом порядке"""
+    highs = np.asarray(highs)
+    lows = np.asarray(lows)
+    res, sup = pivot_flags(highs, lows, window)
+    return list(highs[res]), list(lows[sup])
+
+
+class PivotTracker:
+    """
+    Инкрементальный поиск фракталов: с каждой новой закрытой свечей решается
+    судьба одного кандидата — свечи, у которой только что набралось window
+    соседей справа. Результат тот же, что у pivot_flags по всей истории.
+    """
+    def __init__(self, window=7):
+        self.window = window
+        self.times = deque(maxlen=window * 2 + 1)
+        self.highs = deque(maxlen=window * 2 + 1)
+        self.lows = deque(maxlen=window * 2 + 1)
+
+    def reset(self):
+        self.times.clear()
+        self.highs.clear()
+        self.lows.clear()
+
+    def update(self, time_ms, high, low):
+        """
+        Добавляет свечу. Возвращает (res, sup): (time_ms, цена) подтвержденного
+        фрактала кандидата или None.
+        """
+        self.times.append(time_ms)
+        self.highs.append(high)
+        self.lows.append(low)
+        if len(self.times) < self.window * 2 + 1:
+            return None, None
+
+        w = self.window
+        highs, lows = np.asarray(self.highs), np.asarray(self.lows)
+        res = sup = None
+        if highs[w] >= highs[:w].max() and highs[w] > highs[w+1:].max():
+            res = (self.times[w], highs[w])
+        if lows[w] <= lows[:w].min() and lows[w] < lows[w+1:].min():
+            sup = (self.times[w], lows[w])
+        return res, sup
+
+
+class RunningMean:
+    """
+    Среднее, пополняемое по одному значению за O(1). Сумма накапливается в
+    том же порядке, что у попарного суммирования NumPy (восемь частичных сумм
+    по блокам), поэтому mean() побитно равен np.mean(values) до 128 значений.
+    """
+    __slots__ = ('count', 'partial', 'tail')
+
+    def __init__(self):
+        self.count = 0
+        self.partial = None # 8 частичных сумм по полным блокам
+        self.tail = []      # Значения после последнего полного блока
+
+    def add(self, value):
+        self.count += 1
+        self.tail.append(value)
+        if len(self.tail) == 8:
+            if self.partial is None:
+                self.partial = self.tail
+            else:
+                self.partial = [p + v for p, v in zip(self.partial, self.tail)]
+            self.tail = []
+
+    def mean(self):
+        if self.partial is None:
+            total = 0.
+        else:
+            r = self.partial
+            total = ((r[0] + r[1]) + (r[2] + r[3])) + ((r[4] + r[5]) + (r[6] + r[7]))
+        for value in self.tail:
+            total += value
+        return np.float64(total) / self.count
+
+
+def cluster_levels(levels, atr_pct):
+    """Объединение близких уровней за один проход с бегущим средним кластера"""
+    if not levels: return []
+    threshold = (atr_pct / 100) * 0.7
+    clusters = []
+    current = RunningMean()
+    for level in sorted(levels):
+        if current.count:
+            avg = current.mean()
+            if (level - avg) / avg < threshold:
+                current.add(level)
+                continue
+            clusters.append(avg)
+            current = RunningMean()
+        current.add(level)
+    clusters.append(current.mean())
+    return clusters
+
+
+def level_quality(opens, highs, lows, closes, levels, level_type, atr_pct):
+    """
+    Касания и пробои телом для всех уровней сразу (уровни x свечи, broadcasting).
+    Возвращает массивы touches и violations той же длины, что levels.
+    """
+    levels = np.asarray(levels, dtype=np.float64)[:, None]
+    zone = levels * (atr_pct / 100) * 0.4
+    if level_type == 'resistance':
+        extreme = np.asarray(highs)[None, :]
+        touches = ((extreme >= levels - zone) & (extreme <= levels + zone)).sum(axis=1)
+        violations = (np.maximum(opens, closes)[None, :] > levels + zone).sum(axis=1)
+    else:
+        extreme = np.asarray(lows)[None, :]
+        touches = ((extreme >= levels - zone) & (extreme <= levels + zone)).sum(axis=1)
+        violations = (np.minimum(opens, closes)[None, :] < levels - zone).sum(axis=1)
+    return touches, violations
+
+
+def valid_levels(opens, highs, lows, closes, levels, level_type, atr_pct):
+    """Уровни, у которых есть касание и пробоев не больше, чем касаний"""
+    if not len(levels):
+        return []
+    touches, violations = level_quality(opens, highs, lows, closes, levels, level_type, atr_pct)
+    keep = (touches >= 1) & (violations <= touches)
+    return [level for level, ok in zip(levels, keep) if ok]
+
+
+class SeriesLevels:
+    """
+    Фракталы одной серии. Подтвержденные пивоты добавляются по одному
+    (PivotTracker) и хранятся по времени, а окно фильтрует их при чтении:
+    короткое окно не стирает пивоты, нужные длинному. Удаляются только те,
+    что старше самого широкого окна, которое синхронизировалось.
+    """
+    def __init__(self, window=7):
+        self.window = window
+        self.tracker = PivotTracker(window)
+        self.span = 0 # Самое широкое окно (мс от первой до последней свечи)
+        self.reset()
+
+    def reset(self):
+        self.tracker.reset()
+        self.first_time = self.last_time = None
+        self.cutoff = None                              # Начало фракталов последнего окна
+        self.pivots = {'res': deque(), 'sup': deque()}  # (time_ms, цена) по времени
+        self.prices = {'res': [], 'sup': []}            # цены по возрастанию
+
+    def _add(self, kind, pivot):
+        self.pivots[kind].append(pivot)
+        bisect.insort(self.prices[kind], pivot[1])
+
+    def _expire(self, cutoff_time):
+        for kind, pivots in self.pivots.items():
+            while pivots and pivots[0][0] < cutoff_time:
+                _, price = pivots.popleft()
+                prices = self.prices[kind]
+                del prices[bisect.bisect_left(prices, price)]
+
+    def sync(self, df):
+        """Догоняет окно df (KlineWindow); levels() после него — фракталы этого окна"""
+        times = np.asarray(df['time_ms'])
+        if len(times) < self.window * 2 + 1:
+            self.reset()
+            return self
+
+        start = 0
+        if self.last_time is not None and self.first_time <= times[0] and times[-1] >= self.last_time:
+            pos = int(np.searchsorted(times, self.last_time))
+            if pos < len(times) and times[pos] == self.last_time:
+                start = pos + 1
+        if start == 0:
+            self.reset()
+            self.first_time = int(times[0])
+
+        highs, lows = df['high'], df['low']
+        for i in range(start, len(times)):
+            res, sup = self.tracker.update(int(times[i]), highs[i], lows[i])
+            if res: self._add('res', res)
+            if sup: self._add('sup', sup)
+        self.last_time = int(times[-1])
+
+        # Фрактал входит в окно, только если его левые соседи тоже в окне
+        self.cutoff = int(times[self.window])
+        # Окно не шире уже виденных начинается не раньше last_time - span: старше — не понадобится
+        self.span = max(self.span, int(times[-1] - times[0]))
+        keep_from = self.last_time - self.span
+        if keep_from > self.first_time:
+            self._expire(keep_from)
+            self.first_time = keep_from
+        return self
+
+    def levels(self):
+        """(res_levels, sup_levels) последнего окна по возрастанию цены"""
+        out = []
+        for kind in ('res', 'sup'):
+            pivots = self.pivots[kind]
+            if not pivots or pivots[0][0] >= self.cutoff:
+                out.append(list(self.prices[kind])) # Все пивоты в окне — без фильтра
+            else:
+                out.append(sorted(p for t, p in pivots if t >= self.cutoff))
+        return tuple(out)
+
+    def to_dict(self):
+        return {
+            'window': self.window, 'first_time': self.first_time, 'last_time': self.last_time,
+            'span': self.span, 'cutoff': self.cutoff,
+            'bars': [[int(t), float(h), float(l)] for t, h, l in zip(self.tracker.times, self.tracker.highs, self.tracker.lows)],
+            'res': [[int(t), float(p)] for t, p in self.pivots['res']],
+            'sup': [[int(t), float(p)] for t, p in self.pivots['sup']],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        series = cls(data['window'])
+        if 'span' not in data:
+            return series # Старый формат: пивоты обрезаны по окну — пересчет с первой синхронизации
+        series.first_time, series.last_time = data['first_time'], data['last_time']
+        series.span, series.cutoff = data['span'], data['cutoff']
+        for t, h, l in data['bars']:
+            series.tracker.times.append(t)
+            series.tracker.highs.append(h)
+            series.tracker.lows.append(l)
+        for kind in ('res', 'sup'):
+            for t, p in data[kind]:
+                series._add(kind, (t, p))
+        return series
+
+
+def nearest_above(levels, price):
+    """Ближайший уровень строго выше price (levels по возрастанию) или None"""
+    i = bisect.bisect_right(levels, price)
+    return levels[i] if i < len(levels) else None
+
+
+def nearest_below(levels, price):
+    """Ближайший уровень строго ниже price (levels по возрастанию) или None"""
+    i = bisect.bisect_left(levels, price)
+    return levels[i-1] if i > 0 else None
+
+
+class LevelRegistry:
+    """
+    Долгоживущий реестр фракталов по (тикер, интервал, window). Переживает
+    сканы, а через save/load — и перезапуск бота.
+    """
+    def __init__(self):
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def sync(self, ticker, interval, window, df):
+        key = (ticker, interval, window)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = SeriesLevels(window)
+            series.sync(df)
+            return series.levels()
+
+    def save(self, path):
+        with self._lock:
+            data = [{'ticker': k[0], 'interval': k[1], **s.to_dict()} for k, s in self._series.items()]
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        if not os.path.exists(path):
+            return False
+        with open(path) as f:
+            data = json.load(f)
+        with self._lock:
+            for item in data:
+                self._series[(item['ticker'], item['interval'], item['window'])] = SeriesLevels.from_dict(item)
+        return True
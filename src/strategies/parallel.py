@@ -0,0 +1,34 @@
+from .base import BaseStrategy
+from .window import COLUMNS, KlineWindow
+
+class ArrayKlines:
+    """
+    Источник свечей воркера: готовые колонки окон {интервал: (time_ms, open, ...)},
+    присланные главным процессом. Тот же интерфейс, что у KlineBook.get_window.
+    """
+    def __init__(self, windows):
+        self.windows = {interval: KlineWindow(*cols) for interval, cols in windows.items()}
+
+    def get_window(self, symbol, interval, limit):
+        window = self.windows.get(str(interval))
+        if window is None:
+            return KlineWindow.from_klines([])
+        return window if limit >= len(window) else window[-int(limit):]
+
+
+def pack_window(window):
+    """KlineWindow -> компактный кортеж колонок NumPy для передачи в процесс"""
+    return tuple(window[name] for name in COLUMNS)
+
+
+def evaluate_signals(ticker, tf, strategies, windows, params):
+    """
+    Расчет в процессе-воркере: check_signal стратегий [(имя, класс)] по окнам
+    windows. Возвращает {имя: сигнал или None}; база и ордера — в главном процессе.
+    """
+    BaseStrategy._klines = ArrayKlines(windows)
+    signals = {}
+    for name, StratClass in strategies:
+        obj = StratClass(None, ticker, tf, None, is_backtest=False, params=params)
+        signals[name] = obj.check_signal()
+    return signals
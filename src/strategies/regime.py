@@ -0,0 +1,117 @@
+import threading
+import numpy as np
+
+from .cache import TTLCache
+from .window import KlineWindow
+from .features import FeatureFrame, FEATURE_LOOKBACK
+
+# Из какого интервала собирать старший ТФ, если своей серии нет (бэктест грузит 15м и 60м)
+RESAMPLE_BASE = {'240': '60'}
+
+def resample_window(df, interval, base_interval):
+    """
+    Свечи interval из свечей base_interval (KlineWindow), выровненные по UTC,
+    как у Bybit. Берутся только полные корзины: неполная первая/текущая и
+    корзины с пропусками отбрасываются.
+    """
+    factor = int(interval) // int(base_interval)
+    step = int(interval) * 60_000
+    times = np.asarray(df['time_ms'])
+    if not len(times):
+        return KlineWindow.from_klines([])
+
+    bucket = times // step
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    counts = np.diff(np.r_[starts, len(times)])
+    full = counts == factor
+    ends = starts + counts - 1
+    return KlineWindow(
+        (bucket[starts] * step)[full],
+        np.asarray(df['open'])[starts][full],
+        np.maximum.reduceat(np.asarray(df['high']), starts)[full],
+        np.minimum.reduceat(np.asarray(df['low']), starts)[full],
+        np.asarray(df['close'])[ends][full],
+        np.add.reduceat(np.asarray(df['volume']), starts)[full],
+    )
+
+
+def available_lag(interval, base_interval):
+    """
+    Через сколько мс после открытия собранная свеча становится доступной:
+    когда откроется последняя из ее базовых свечей (так же серия видна в бэктесте).
+    """
+    return (int(interval) - int(base_interval)) * 60_000
+
+
+class HTFRegime:
+    """
+    Тренд старшего ТФ (EMA200 по 250 свечам) по (тикер, интервал). Считается
+    заново только когда закрылась новая свеча старшего ТФ; без своей серии
+    свечи собираются из RESAMPLE_BASE. Работает одинаково в Live и бэктесте.
+    """
+    def __init__(self, features, lookback=FEATURE_LOOKBACK):
+        self.features = features
+        self.lookback = lookback
+        self.cache = TTLCache('htf_trend', max_entries=2000) # (тикер, интервал, метка свечи) -> тренд
+        self._resampled = set() # (тикер, интервал), которые в прошлый раз пришлось собирать
+        self._lock = threading.Lock()
+
+    def trend(self, ticker, interval, bar_mark, loader):
+        """
+        bar_mark(interval) -> время открытия (мс) последней доступной свечи интервала.
+        loader(interval, limit) -> KlineWindow закрытых свечей.
+        """
+        with self._lock:
+            resampled = (ticker, interval) in self._resampled
+        mark = self._mark(interval, bar_mark, resampled)
+        res = self.cache.get((ticker, interval, mark))
+        if res is not None:
+            return res
+
+        window = loader(interval, self.lookback)
+        resampled = window.empty and interval in RESAMPLE_BASE
+        with self._lock:
+            if resampled: self._resampled.add((ticker, interval))
+            else: self._resampled.discard((ticker, interval))
+        if resampled:
+            window = self.window(ticker, interval, loader)
+            mark = self._mark(interval, bar_mark, resampled)
+        if window.empty:
+            return 0
+
+        res = FeatureFrame(self.features, ticker, interval, window).trend
+        # Биржа еще не отдала ожидаемую свечу (или в истории разрыв) — не запоминаем
+        if int(window['time_ms'][-1]) == mark:
+            self.cache.set((ticker, interval, mark), res)
+        return res
+
+    def _mark(self, interval, bar_mark, resampled):
+        if not resampled:
+            return bar_mark(interval)
+        # Собранная свеча полна, когда открылась последняя из ее базовых
+        base = RESAMPLE_BASE[interval]
+        step = int(interval) * 60_000
+        return (bar_mark(base) - available_lag(interval, base)) // step * step
+
+    def window(self, ticker, interval, loader):
+        """Последние lookback собранных свечей старшего ТФ"""
+        base = RESAMPLE_BASE[interval]
+        factor = int(interval) // int(base)
+        df = resample_window(loader(base, factor * (self.lookback + 2)), interval, base)
+        return df[-self.lookback:] if len(df) > self.lookback else df
+
+    def history(self, session, ticker, interval):
+        """
+        Вся история старшего ТФ для пакетного расчета и задержка ее доступности
+        в мс (0 для своей серии, у собранной — до открытия последней базовой свечи).
+        """
+        df = session.get_history(ticker, interval)
+        base = RESAMPLE_BASE.get(interval)
+        if not df.empty or base is None:
+            return df, 0
+        return resample_window(session.get_history(ticker, base), interval, base), available_lag(interval, base)
+
+    def clear(self):
+        self.cache.clear()
+        with self._lock:
+            self._resampled.clear()
@@ -1,5 +1,6 @@
 import pandas as pd
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from .base import BaseStrategy
 
 class TrendStrategy(BaseStrategy):
@@ -10,7 +11,8 @@ class TrendStrategy(BaseStrategy):
             return None
 
         # 2. Получение данных
-        df = self.get_data(limit=250)
+        features = self.features()
+        df = features.view(250)
         if df.empty or len(df) < 100: 
             return None
 
@@ -19,18 +21,52 @@ class TrendStrategy(BaseStrategy):
         sl_mult = self.params.get('trend_sl', 1.5)
         tp_mult = self.params.get('trend_tp', 6.0)
 
-        # 4. Расчет индикаторов (EMA 9, 21, 50)
-        df['ema9'] = df['close'].ewm(span=9, adjust=False).mean()
-        df['ema21'] = df['close'].ewm(span=21, adjust=False).mean()
-        df['ema50'] = df['close'].ewm(span=50, adjust=False).mean()
+        # 4. Индикаторы (EMA 9, 21, 50 по окну, ATR, ADX) из инкрементального движка
+        ind = self.indicators(df)
+        ema9, prev_ema9 = ind.ema(9, len(df))
+        ema21, prev_ema21 = ind.ema(21, len(df))
+        ema50, _ = ind.ema(50, len(df))
         
-        atr, _ = self.calculate_atr(df)
+        atr = features.atr
         if atr <= 0: return None
         
-        adx = self.calculate_adx(df)
+        adx = ind.adx
         
-        last = df.iloc[-1]
-        prev = df.iloc[-2]
+        last = {'close': df['close'][-1], 'ema9': ema9, 'ema21': ema21, 'ema50': ema50}
+        prev = {'high': df['high'][-2], 'low': df['low'][-2], 'ema9': prev_ema9, 'ema21': prev_ema21}
+        return self._decide(htf_trend, atr, adx, last, prev, adx_min, sl_mult, tp_mult)
+
+    def generate_signals(self, df, htf_trend):
+        """Пакетный check_signal по всей истории (окно 250 свечей, минимум 100)"""
+        n = len(df)
+        out = self.new_signal_arrays(n)
+        adx_min = self.params.get('trend_adx', 35)
+        sl_mult = self.params.get('trend_sl', 1.5)
+        tp_mult = self.params.get('trend_tp', 6.0)
+
+        # EMA в check_signal считаются заново по окну из 250 свечей — повторяем это
+        closes = np.asarray(df['close'])
+        ema9, prev_ema9 = self.window_ema(closes, 9, 250)
+        ema21, prev_ema21 = self.window_ema(closes, 21, 250)
+        ema50, _ = self.window_ema(closes, 50, 250)
+        atr, _ = self.batch_atr(df)
+        highs, lows = np.asarray(df['high']), np.asarray(df['low'])
+        starts = self.window_starts(n, 250)
+
+        # ADX по всей серии отличается от оконного лишь ошибкой округления,
+        # поэтому у самого порога adx_min пересчитываем его честно по окну
+        adx_all = self.batch_adx(df)
+        stacked = ((ema9 > ema21) & (ema21 > ema50)) | ((ema9 < ema21) & (ema21 < ema50))
+        for i in np.flatnonzero((htf_trend != 0) & (np.arange(n) >= 99) & (atr > 0) & stacked):
+            last = {'close': closes[i], 'ema9': ema9[i], 'ema21': ema21[i], 'ema50': ema50[i]}
+            prev = {'high': highs[i-1], 'low': lows[i-1], 'ema9': prev_ema9[i], 'ema21': prev_ema21[i]}
+            adx = adx_all[i]
+            if not abs(adx - adx_min) > 1e-6:
+                adx = self.calculate_adx(df[starts[i]:i+1])
+            self.store_signal(out, i, self._decide(htf_trend[i], atr[i], adx, last, prev, adx_min, sl_mult, tp_mult))
+        return out
+
+    def _decide(self, htf_trend, atr, adx, last, prev, adx_min, sl_mult, tp_mult):
         entry_price = last['close']
 
         # --- ЛОГИКА LONG (Бычий тренд) ---
@@ -76,10 +112,37 @@ class TrendStrategy(BaseStrategy):
 
         return None
 
+    def batch_adx(self, df, period=14):
+        """calculate_adx для каждого бара серии (NaN там, где не хватает истории)"""
+        high, low = np.asarray(df['high']), np.asarray(df['low'])
+        close = np.asarray(df['close'])
+        nan = np.array([np.nan])
+        up = np.concatenate((nan, np.diff(high))).clip(min=0)
+        down = np.concatenate((nan, -np.diff(low))).clip(min=0)
+        plus_dm = np.where((up > down) & (up > 0), up, 0)
+        # Как в calculate_adx: minus_dm сравнивается с уже отфильтрованным plus_dm
+        minus_dm = np.where((down > plus_dm) & (down > 0), down, 0)
+
+        prev_close = np.concatenate((nan, close[:-1]))
+        tr = np.maximum(high - low, np.maximum(abs(high - prev_close), abs(low - prev_close)))
+
+        def rolling_mean(values):
+            out = np.full(len(values), np.nan)
+            if len(values) >= period:
+                out[period-1:] = sliding_window_view(values, period).mean(axis=1)
+            return out
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            atr_s = rolling_mean(tr)
+            plus_di = 100 * (rolling_mean(plus_dm) / atr_s)
+            minus_di = 100 * (rolling_mean(minus_dm) / atr_s)
+            dx = 100 * abs(plus_di - minus_di) / (plus_di + minus_di)
+        return rolling_mean(dx)
+
     def calculate_adx(self, df, period=14):
         """Устойчивый расчет ADX"""
         try:
-            df = df.copy()
+            df = pd.DataFrame({col: np.asarray(df[col]) for col in ('high', 'low', 'close')})
             plus_dm = df['high'].diff().clip(lower=0)
             minus_dm = (-df['low'].diff()).clip(lower=0)
             
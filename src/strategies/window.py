@@ -0,0 +1,36 @@
+import numpy as np
+
+COLUMNS = ('time_ms', 'open', 'high', 'low', 'close', 'volume')
+
+class KlineWindow:
+    """
+    Окно свечей в хронологическом порядке (от старых к новым).
+    Колонки — read-only массивы NumPy одинаковой длины; в бэктесте это срезы
+    предзагруженной истории без копирования. Доступ как у DataFrame: w['close'].
+    """
+    __slots__ = COLUMNS
+
+    def __init__(self, time_ms, open, high, low, close, volume):
+        for name, values in zip(COLUMNS, (time_ms, open, high, low, close, volume)):
+            values.flags.writeable = False
+            setattr(self, name, values)
+
+    @classmethod
+    def from_klines(cls, klines):
+        """Ответ get_kline в формате Bybit (от новых к старым) -> окно"""
+        if not klines:
+            return cls(np.empty(0, dtype=np.int64), *(np.empty(0) for _ in range(5)))
+        raw = np.asarray([k[:6] for k in klines], dtype=np.float64)[::-1]
+        return cls(raw[:, 0].astype(np.int64), *(np.ascontiguousarray(raw[:, i]) for i in range(1, 6)))
+
+    def __len__(self):
+        return len(self.close)
+
+    @property
+    def empty(self):
+        return len(self.close) == 0
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return KlineWindow(*(getattr(self, name)[key] for name in COLUMNS))
+        return getattr(self, key)
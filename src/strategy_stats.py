@@ -0,0 +1,77 @@
+import threading
+from datetime import datetime, timedelta
+
+EPOCH = datetime(1970, 1, 1) # closed_at в базе — наивное UTC
+
+class RollingStats:
+    """
+    Итоги закрытых сделок по стратегиям в часовых корзинах за последние
+    retention_hours: число, выигрыши, суммы прибыли и убытка. Окно "с момента
+    since" — сумма целых корзин плюс поштучный проход по одной граничной,
+    то есть O(корзин), а не O(сделок). Пополняется на каждом close_trade.
+    """
+    def __init__(self, retention_hours=72, bucket_minutes=60):
+        self.retention = timedelta(hours=retention_hours)
+        self.bucket_sec = bucket_minutes * 60
+        self._buckets = {} # стратегия -> {номер корзины: [count, wins, win_sum, loss_sum, pnl_sum, [(closed_at, pnl)]]}
+        self._latest = None
+        self._floor = None # С этого момента история в корзинах полная
+        self._lock = threading.Lock()
+
+    def _bucket(self, dt):
+        return int((dt - EPOCH).total_seconds()) // self.bucket_sec
+
+    def load(self, trades, since):
+        """trades: [(стратегия, closed_at, pnl)] — все закрытия базы с closed_at >= since"""
+        with self._lock:
+            self._buckets, self._latest, self._floor = {}, None, since
+            for name, closed_at, pnl in trades:
+                self._add(name, closed_at, pnl)
+            if self._latest is not None: self._expire()
+
+    def add(self, name, closed_at, pnl):
+        with self._lock:
+            self._add(name, closed_at, pnl)
+            if self._latest is not None: self._expire()
+
+    def _add(self, name, closed_at, pnl):
+        if closed_at is None: return
+        pnl = float(pnl or 0.0)
+        b = self._buckets.setdefault(name, {}).setdefault(self._bucket(closed_at), [0, 0, 0.0, 0.0, 0.0, []])
+        b[0] += 1
+        if pnl > 0: b[1] += 1; b[2] += pnl
+        elif pnl < 0: b[3] += -pnl
+        b[4] += pnl
+        b[5].append((closed_at, pnl))
+        if self._latest is None or closed_at > self._latest: self._latest = closed_at
+
+    def _expire(self):
+        oldest = self._bucket(self._latest - self.retention)
+        for buckets in self._buckets.values():
+            for key in [k for k in buckets if k < oldest]: del buckets[key]
+        start = EPOCH + timedelta(seconds=oldest * self.bucket_sec)
+        self._floor = start if self._floor is None else max(self._floor, start)
+
+    def covers(self, since):
+        """Окно укладывается в хранимую историю (иначе отвечает база)"""
+        with self._lock:
+            return self._floor is not None and since >= self._floor
+
+    def summary(self, name, since):
+        """Тот же ответ, что TradeLedger.summarize по сделкам с closed_at >= since"""
+        first = self._bucket(since)
+        count = wins = 0
+        win_sum = loss_sum = pnl_sum = 0.0
+        with self._lock:
+            for key, b in self._buckets.get(name, {}).items():
+                if key > first:
+                    count += b[0]; wins += b[1]; win_sum += b[2]; loss_sum += b[3]; pnl_sum += b[4]
+                elif key == first:
+                    for closed_at, pnl in b[5]:
+                        if closed_at < since: continue
+                        count += 1; pnl_sum += pnl
+                        if pnl > 0: wins += 1; win_sum += pnl
+                        elif pnl < 0: loss_sum += -pnl
+        if not count: return {'pnl': 0, 'pf': 0, 'wr': 0, 'count': 0}
+        pf = (win_sum / loss_sum) if loss_sum > 0 else (10.0 if win_sum > 0 else 0.0)
+        return {'pnl': round(pnl_sum, 2), 'pf': round(pf, 2), 'wr': round((wins / count) * 100, 1), 'count': count}
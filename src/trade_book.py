@@ -0,0 +1,130 @@
+import bisect
+import threading
+
+class TriggerIndex:
+    """
+    Уровни срабатывания открытых сделок по символу, отсортированные по цене.
+    up — срабатывают при цене >= уровня (TP и безубыток лонга, SL шорта),
+    down — при цене <= уровня (SL лонга, TP и безубыток шорта). Тик проверяет
+    только уровни, которые пересек, бинарным поиском.
+    """
+    def __init__(self):
+        self.up = {}     # символ -> [(уровень, id)]
+        self.down = {}
+        self._keys = {}  # id -> [(символ, направление, (уровень, id))]
+
+    @staticmethod
+    def levels(trade):
+        """[(направление, уровень)] сделки по тем же правилам, что проверяет монитор"""
+        up, down = [], []
+        if trade.take_profit is not None: (up if trade.side == 'long' else down).append(trade.take_profit)
+        if trade.stop_loss is not None: (down if trade.side == 'long' else up).append(trade.stop_loss)
+        if not trade.is_breakeven and trade.atr_at_entry and trade.atr_at_entry > 0:
+            trigger = trade.atr_at_entry * 2.0
+            if trade.side == 'long': up.append(trade.entry_price + trigger)
+            else: down.append(trade.entry_price - trigger)
+        return [('up', level) for level in up] + [('down', level) for level in down]
+
+    def add(self, trade):
+        keys = []
+        for direction, level in self.levels(trade):
+            key = (float(level), trade.id)
+            bisect.insort(getattr(self, direction).setdefault(trade.ticker, []), key)
+            keys.append((trade.ticker, direction, key))
+        self._keys[trade.id] = keys
+
+    def remove(self, trade_id):
+        for ticker, direction, key in self._keys.pop(trade_id, ()):
+            levels = getattr(self, direction)[ticker]
+            pos = bisect.bisect_left(levels, key)
+            if pos < len(levels) and levels[pos] == key: del levels[pos]
+            if not levels: del getattr(self, direction)[ticker]
+
+    def crossed(self, ticker, price):
+        """id сделок, чей хотя бы один уровень пересечен ценой"""
+        up = self.up.get(ticker, ())
+        down = self.down.get(ticker, ())
+        ids = {i for _, i in up[:bisect.bisect_right(up, (price, float('inf')))]}
+        ids.update(i for _, i in down[bisect.bisect_left(down, (price, float('-inf'))):])
+        return ids
+
+    def clear(self):
+        self.up, self.down, self._keys = {}, {}, {}
+
+
+class OpenTradeBook:
+    """
+    Открытые сделки живого бота в памяти: загружаются из базы при старте,
+    дальше SqlLedger меняет книгу первой, а SQL дописывает SqlWriter в
+    фоне. Книга — источник правды для открытых сделок; отвечает
+    на вопросы скана и монитора (открытые сделки, слоты по типу и стратегии,
+    уровни для тика) без запросов к SQLite.
+    """
+    def __init__(self):
+        self.triggers = TriggerIndex()
+        self._lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self._lock: self._reset()
+
+    def _reset(self):
+        self._open = {}          # id -> сделка (в порядке id)
+        self._by_ticker = {}     # тикер -> [открытые сделки]
+        self._count = {}         # тип / (стратегия, тип) -> число открытых
+        self.triggers.clear()
+
+    def load(self, trades):
+        with self._lock:
+            self._reset()
+            for trade in sorted(trades, key=lambda t: t.id):
+                self.add(trade)
+
+    def _bump(self, trade, delta):
+        for key in (trade.trade_type, (trade.strategy_name, trade.trade_type)):
+            self._count[key] = self._count.get(key, 0) + delta
+
+    def add(self, trade):
+        with self._lock:
+            self._open[trade.id] = trade
+            self._by_ticker.setdefault(trade.ticker, []).append(trade)
+            self._bump(trade, 1)
+            self.triggers.add(trade)
+
+    def remove(self, trade_id):
+        with self._lock:
+            trade = self._open.pop(trade_id, None)
+            if trade is None: return None
+            trade.status = 'closed'
+            self._by_ticker[trade.ticker].remove(trade)
+            if not self._by_ticker[trade.ticker]: del self._by_ticker[trade.ticker]
+            self._bump(trade, -1)
+            self.triggers.remove(trade_id)
+            return trade
+
+    def set_breakeven(self, trade_id, stop_loss):
+        with self._lock:
+            trade = self._open.get(trade_id)
+            if trade is None: return
+            trade.stop_loss, trade.is_breakeven = stop_loss, True
+            self.triggers.remove(trade_id)
+            self.triggers.add(trade)
+
+    def open_trades(self):
+        with self._lock:
+            return list(self._open.values())
+
+    def triggered(self, ticker, price):
+        """Открытые сделки тикера, чьи уровни пересекла цена (по id)"""
+        with self._lock:
+            return [self._open[i] for i in sorted(self.triggers.crossed(ticker, price))]
+
+    def has_open(self, ticker, strategy_name=None, trade_type='paper'):
+        """trade_type=None — любого типа"""
+        with self._lock:
+            return any((trade_type is None or t.trade_type == trade_type) and (not strategy_name or t.strategy_name == strategy_name)
+                       for t in self._by_ticker.get(ticker, ()))
+
+    def count(self, trade_type, strategy_name=None):
+        key = (strategy_name, trade_type) if strategy_name else trade_type
+        return self._count.get(key, 0)
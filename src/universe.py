@@ -0,0 +1,86 @@
+import threading
+import time
+from loguru import logger
+
+BLACKLIST = ['DOLOUSDT', 'DEGENUSDT', 'DEFIUSDT', 'BUSDT', 'ARBUSDT', 'FILUSDT']
+
+class TickerUniverse:
+    """
+    Торгуемые символы (USDT-перпетуалы с оборотом 24ч выше порога) по потоку
+    тикеров WebSocket. Гистерезис: символ входит при обороте >= min_turnover,
+    а выходит только ниже min_turnover * exit_ratio, поэтому монеты у порога
+    не мигают. Поток слушает "наблюдаемые" символы (оборот от watch_ratio
+    порога); новые листинги находит редкий полный REST get_tickers.
+    """
+    def __init__(self, min_turnover=20_000_000, exit_ratio=0.85, watch_ratio=0.5, blacklist=BLACKLIST, refresh_sec=3600):
+        self.min_turnover = min_turnover
+        self.exit_turnover = min_turnover * exit_ratio
+        self.watch_turnover = min_turnover * watch_ratio
+        self.blacklist = set(blacklist)
+        self.refresh_sec = refresh_sec
+        self.turnover = {}     # символ -> оборот 24ч, USDT
+        self.prices = {}       # символ -> последняя цена
+        self.members = set()
+        self.version = 0       # Растет при каждом изменении состава (торгуемых или наблюдаемых)
+        self.updated = 0       # Последний полный снимок REST
+        self._watched = set()
+        self._lock = threading.Lock()
+
+    def seed(self, tickers):
+        """Полный снимок get_tickers(category="linear")['result']['list']"""
+        with self._lock:
+            seen = set()
+            for item in tickers:
+                if item.get('symbol', '').endswith('USDT'):
+                    self._apply(item)
+                    seen.add(item['symbol'])
+            # Символы, которых нет в снимке (делистинг), забываем
+            for symbol in set(self.turnover) - seen:
+                self.turnover.pop(symbol, None)
+                self.prices.pop(symbol, None)
+                if symbol in self.members:
+                    self.members.discard(symbol)
+                    self.version += 1
+            # Наблюдаемые пересобираются по текущему обороту: список и сужается
+            watched = {s for s, t in self.turnover.items() if t >= self.watch_turnover and s not in self.blacklist}
+            if watched != self._watched: self.version += 1
+            self._watched = watched
+            self.updated = time.time()
+        return len(self.members)
+
+    def refresh(self, session):
+        """Полный снимок через REST, если прошлый старше refresh_sec"""
+        if time.time() - self.updated < self.refresh_sec: return False
+        try:
+            res = session.get_tickers(category="linear")
+            self.seed(res['result']['list'])
+            logger.info(f"🌐 Вселенная тикеров обновлена: {len(self.members)} торгуемых, {len(self._watched)} в наблюдении")
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка обновления списка тикеров: {e}")
+            return False
+
+    def on_ticker(self, item):
+        """Сообщение тикера WebSocket (снимок или дельта)"""
+        if not item.get('symbol', '').endswith('USDT'): return
+        with self._lock: self._apply(item)
+
+    def _apply(self, item):
+        symbol = item['symbol']
+        if item.get('lastPrice'): self.prices[symbol] = float(item['lastPrice'])
+        if not item.get('turnover24h'): return # В дельте оборота может не быть
+        turnover = self.turnover[symbol] = float(item['turnover24h'])
+        if symbol in self.members:
+            if turnover < self.exit_turnover:
+                self.members.discard(symbol)
+                self.version += 1
+        elif turnover >= self.min_turnover and symbol not in self.blacklist:
+            self.members.add(symbol)
+            self.version += 1
+
+    def symbols(self):
+        with self._lock: return sorted(self.members)
+
+    def watch(self):
+        """Символы для подписки на тикеры: торгуемые и кандидаты у порога"""
+        with self._lock: return sorted(self._watched | self.members)
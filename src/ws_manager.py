@@ -2,18 +2,34 @@ import time
 from pybit.unified_trading import WebSocket
 from loguru import logger
 
+from .klines import KlineBook
+from .positions import PositionBook
+from .api_client import wallet_snapshot
+
 class WSManager:
-    def __init__(self, api_key, api_secret, testnet=False):
+    def __init__(self, api_key, api_secret, testnet=False, ws=None, private_ws=None, universe=None):
         self.prices = {}
         self.last_update_time = 0 
         self.message_count = 0    
         self.subscribed_topics = set() # Храним текущие подписки, чтобы не спамить в API
+        self.kline_topics = set()      # (тикер, интервал) подписок на свечи
+        self.klines = KlineBook()      # Закрытые свечи из потока kline для стратегий
+        self.wallet = None             # Последний снимок баланса {'equity', 'available'}
+        self.wallet_time = 0           # Когда снимок пришел (WS или REST)
+        self.positions = PositionBook() # Позиции и закрытия из приватных топиков
+        self.on_price = None           # Обработчик тика on_price(тикер, цена): проверка уровней сделок
+        self.universe = universe       # TickerUniverse: оборот 24ч из того же потока тикеров
         
         self.api_key = api_key
         self.api_secret = api_secret
         self.testnet = testnet
         
-        self._connect()
+        # ws можно подменить (например, локальным фейковым потоком в тестах)
+        if ws is not None: self.ws = ws
+        else: self._connect()
+        self.private_ws = private_ws if private_ws is not None else self._connect_private()
+        self.subscribe_wallet()
+        self.subscribe_positions()
 
     def _connect(self):
         """Внутренний метод для (пере)подключения"""
@@ -28,6 +44,96 @@ class WSManager:
         except Exception as e:
             logger.error(f"❌ WebSocket: Критическая ошибка подключения: {e}")
 
+    def _connect_private(self):
+        """Приватный канал (кошелек): только при наличии ключей"""
+        if not (self.api_key and self.api_secret):
+            return None
+        try:
+            ws = WebSocket(testnet=self.testnet, channel_type="private", api_key=self.api_key, api_secret=self.api_secret)
+            logger.info("🔐 WebSocket: Приватный канал подключен.")
+            return ws
+        except Exception as e:
+            logger.error(f"❌ WebSocket: Ошибка подключения приватного канала: {e}")
+            return None
+
+    def close(self):
+        """Отключение обработчиков и сокетов (выход бота): новые тики и закрытия не приходят"""
+        self.on_price = None
+        self.positions.on_close = None
+        for ws in (self.ws, self.private_ws):
+            try:
+                if ws is not None and hasattr(ws, 'exit'): ws.exit()
+            except Exception as e: logger.error(f"❌ WebSocket: ошибка отключения: {e}")
+
+    def subscribe_wallet(self):
+        if self.private_ws is None:
+            return
+        try:
+            self.private_ws.wallet_stream(callback=self.handle_wallet)
+        except Exception as e:
+            logger.error(f"❌ WebSocket: Ошибка подписки на кошелек: {e}")
+
+    def subscribe_positions(self):
+        """Приватные топики position, execution и order -> книга позиций"""
+        if self.private_ws is None:
+            return
+        try:
+            self.private_ws.position_stream(callback=self.handle_position)
+            self.private_ws.execution_stream(callback=self.handle_execution)
+            self.private_ws.order_stream(callback=self.handle_order)
+        except Exception as e:
+            logger.error(f"❌ WebSocket: Ошибка подписки на позиции: {e}")
+
+    @property
+    def private_ready(self):
+        """Есть ли приватный канал: без него закрытия на бирже не видны"""
+        return self.private_ws is not None
+
+    def handle_position(self, msg):
+        try:
+            for item in msg.get("data", []):
+                if item.get("category", "linear") == "linear":
+                    self.positions.on_position(item)
+        except Exception as e:
+            logger.error(f"❌ WebSocket: Ошибка парсинга позиции: {e}")
+
+    def handle_execution(self, msg):
+        try:
+            for item in msg.get("data", []):
+                if item.get("category", "linear") == "linear":
+                    self.positions.on_execution(item)
+        except Exception as e:
+            logger.error(f"❌ WebSocket: Ошибка парсинга исполнения: {e}")
+
+    def handle_order(self, msg):
+        try:
+            for item in msg.get("data", []):
+                if item.get("category", "linear") == "linear":
+                    self.positions.on_order(item)
+        except Exception as e:
+            logger.error(f"❌ WebSocket: Ошибка парсинга ордера: {e}")
+
+    def handle_wallet(self, msg):
+        """Снимок баланса из топика wallet (приходит при каждом изменении счета)"""
+        try:
+            for account in msg.get("data", []):
+                if account.get("accountType", "UNIFIED") == "UNIFIED":
+                    self.update_wallet(wallet_snapshot(account))
+        except Exception as e:
+            logger.error(f"❌ WebSocket: Ошибка парсинга кошелька: {e}")
+
+    def update_wallet(self, snapshot):
+        self.wallet, self.wallet_time = snapshot, time.time()
+
+    def get_wallet(self, max_age=300):
+        """
+        Снимок баланса, если он свежий. Топик wallet молчит, пока счет не меняется,
+        поэтому раз в max_age секунд снимок подтверждается через REST (update_wallet).
+        """
+        if self.wallet is None or time.time() - self.wallet_time > max_age:
+            return None
+        return self.wallet
+
     def handle_message(self, msg):
         """Обработка тикеров: вытаскиваем только актуальную цену"""
         try:
@@ -41,12 +147,14 @@ class WSManager:
                 for item in items:
                     symbol = item.get("symbol")
                     price = item.get("lastPrice")
+                    if symbol and self.universe is not None: self.universe.on_ticker(item)
                     
                     if symbol and price:
                         # Обновляем локальный кэш цен
                         self.prices[symbol] = float(price)
                         self.last_update_time = time.time()
                         self.message_count += 1
+                        if self.on_price is not None: self.on_price(symbol, self.prices[symbol])
                         
         except Exception as e:
             logger.error(f"❌ WebSocket: Ошибка парсинга сообщения: {e}")
@@ -75,6 +183,37 @@ class WSManager:
             else:
                 logger.error(f"❌ WebSocket: Ошибка подписки: {e}")
 
+    def handle_kline(self, msg):
+        """Обработка свечей: в буферы попадают только подтвержденные (confirm)"""
+        try:
+            topic = msg.get("topic", "")
+            if not topic.startswith("kline."):
+                return
+            _, interval, symbol = topic.split(".", 2)
+            for item in msg.get("data", []):
+                self.klines.on_kline(symbol, interval, item)
+            self.last_update_time = time.time()
+            self.message_count += 1
+        except Exception as e:
+            logger.error(f"❌ WebSocket: Ошибка парсинга свечи: {e}")
+
+    def subscribe_klines(self, tickers, intervals):
+        """Подписка на закрытые свечи: только новые пары (тикер, интервал)"""
+        new_topics = [(t, i) for t in tickers for i in intervals if (t, i) not in self.kline_topics]
+        if not new_topics:
+            return
+
+        try:
+            for ticker, interval in new_topics:
+                self.ws.kline_stream(interval=int(interval), symbol=ticker, callback=self.handle_kline)
+                self.kline_topics.add((ticker, interval))
+            logger.info(f"📡 WebSocket: Подписка на свечи {len(new_topics)} новых потоков. Всего: {len(self.kline_topics)}")
+        except Exception as e:
+            if "already subscribed" in str(e).lower():
+                pass
+            else:
+                logger.error(f"❌ WebSocket: Ошибка подписки на свечи: {e}")
+
     def get_last_price(self, ticker):
         price = self.prices.get(ticker)
         if price is None:
@@ -0,0 +1,92 @@
+import sqlite3
+
+import pytest
+
+import src.orchestrator as orchestrator_module
+from src.orchestrator import Orchestrator
+from src.positions import PositionBook
+
+
+class FakeSession:
+    """Синхронный REST (как pybit HTTP / SyncRestSession): ответы и вызовы под рукой теста"""
+    def __init__(self, positions=()):
+        self.positions = list(positions)
+        self.calls = []
+        self.fail_orders = False
+
+    def get_positions(self, **params):
+        self.calls.append(('get_positions', params))
+        return {'retCode': 0, 'result': {'list': self.positions, 'nextPageCursor': ''}}
+
+    def place_order(self, **params):
+        self.calls.append(('place_order', params))
+        if self.fail_orders:
+            raise ConnectionError("timeout")
+        return {'retCode': 0, 'result': {'orderId': 'o1'}}
+
+    def set_trading_stop(self, **params):
+        self.calls.append(('set_trading_stop', params))
+        return {'retCode': 0}
+
+    def get_instruments_info(self, **params):
+        item = {'symbol': params.get('symbol', 'BTCUSDT'), 'lotSizeFilter': {'qtyStep': '0.001', 'minOrderQty': '0.001'}, 'priceFilter': {'tickSize': '0.01'}}
+        return {'retCode': 0, 'result': {'list': [item]}}
+
+    def get_tickers(self, **params):
+        return {'retCode': 0, 'result': {'list': []}}
+
+    def get_kline(self, **params):
+        return {'retCode': 0, 'result': {'list': []}}
+
+    def orders(self):
+        return [params for name, params in self.calls if name == 'place_order']
+
+
+class PrivateFeed:
+    """То, что Orchestrator берет у WSManager: книга позиций и цены, без pybit"""
+    def __init__(self):
+        self.positions = PositionBook()
+        self.private_ready = True
+        self.on_price = None
+        self.prices = {}
+
+    def get_last_price(self, ticker):
+        return self.prices.get(ticker)
+
+    def get_wallet(self, max_age=300):
+        return None
+
+
+@pytest.fixture
+def messages(monkeypatch):
+    """Сообщения Telegram вместо отправки"""
+    sent = []
+    monkeypatch.setattr(orchestrator_module, 'send_telegram_message', sent.append)
+    return sent
+
+
+@pytest.fixture
+def make_bot(tmp_path, messages):
+    bots = []
+
+    def make(session=None, ws=None, **kwargs):
+        bot = Orchestrator(session or FakeSession(), ['BTCUSDT', 'ETHUSDT'], db_path=str(tmp_path / "trade_bot.db"), **kwargs)
+        if ws is not None:
+            bot.attach_ws(ws)
+        bots.append(bot)
+        return bot
+
+    yield make
+    for bot in bots:
+        bot.shutdown()
+
+
+def trade_rows(bot):
+    """Сделки из SQLite после записи фоновым писателем"""
+    bot.db.flush()
+    conn = sqlite3.connect(bot.db.engine.url.database)
+    try:
+        conn.row_factory = sqlite3.Row
+        return {row['id']: dict(row) for row in conn.execute("SELECT * FROM trades")}
+    finally:
+        conn.close()
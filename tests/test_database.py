@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.database import DatabaseManager
+
+
+@pytest.fixture(params=[False, True], ids=['sql', 'memory'])
+def db(request, tmp_path):
+    db = DatabaseManager(str(tmp_path / "trade_bot.db"), in_memory=request.param)
+    yield db
+    db.close()
+
+
+def test_close_during_scan_updates_the_active_gate(db):
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    trade_id = db.add_trade('ETHUSDT', 'trend_15', 'paper', 'long', 2000.0, 1900.0, 2200.0, 10.0, 40.0, current_time=now - timedelta(hours=1))
+    gate = db.scan_gate(now)
+    assert not gate.in_cooldown('ETHUSDT', current_time=now)
+
+    db.close_trade(trade_id, 1900.0, -2.0, current_time=now)
+    # Тот же снимок: убыточное закрытие ставит тикер на паузу, стратегия — "недавняя"
+    assert gate.in_cooldown('ETHUSDT', current_time=now + timedelta(hours=3))
+    assert gate.has_recent_trade('ETHUSDT', 'trend_15', 1)
+    assert not gate.in_cooldown('BTCUSDT', current_time=now)
+    assert gate.in_cooldown('ETHUSDT', current_time=now) == db.is_ticker_in_cooldown('ETHUSDT', current_time=now)
+
+
+def test_gate_keeps_newer_close_over_older_rows(db):
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    old = db.add_trade('ETHUSDT', 'trend_15', 'paper', 'long', 2000.0, 1900.0, 2200.0, 10.0, 40.0, current_time=now - timedelta(hours=3))
+    db.close_trade(old, 2100.0, 2.0, current_time=now - timedelta(hours=2))
+    gate = db.scan_gate(now)
+    assert not gate.in_cooldown('ETHUSDT', current_time=now)
+
+    fresh = db.add_trade('ETHUSDT', 'bounce_15', 'paper', 'long', 2000.0, 1900.0, 2200.0, 10.0, 40.0, current_time=now)
+    db.close_trade(fresh, 1900.0, -2.0, current_time=now)
+    assert gate.in_cooldown('ETHUSDT', current_time=now + timedelta(hours=3))
+    # Следующий снимок видит то же закрытие уже из базы
+    assert db.scan_gate(now).in_cooldown('ETHUSDT', current_time=now + timedelta(hours=3))
+
+
+def test_close_after_writer_stopped_is_written_synchronously(tmp_path):
+    db = DatabaseManager(str(tmp_path / "trade_bot.db"))
+    trade_id = db.add_trade('ETHUSDT', 'trend_15', 'live', 'long', 2000.0, 1900.0, 2200.0, 10.0, 40.0)
+    db.close()
+    # Позднее закрытие из потока WebSocket во время выхода
+    assert db.close_trade(trade_id, 2100.0, 2.0)
+    session = db.Session()
+    try:
+        row = session.query(db.Trade).filter(db.Trade.id == trade_id).one()
+        assert row.status == 'closed' and row.exit_price == 2100.0
+    finally: session.close()
@@ -0,0 +1,149 @@
+import pytest
+
+from src.klines import KlineBook, KlineRing
+
+STEP = 15 * 60_000
+NOW = 1_700_000_000 // 900 * 900 + 60 # Минута после закрытия 15м свечи, секунды
+
+
+def bar(i, close=None):
+    close = 100.0 + i if close is None else close
+    return (i * STEP, close - 0.5, close + 1.0, close - 1.0, close, 10.0 + i)
+
+
+def ws_item(i, confirm=True):
+    t, o, h, l, c, v = bar(i)
+    return {'start': t, 'open': str(o), 'high': str(h), 'low': str(l), 'close': str(c), 'volume': str(v), 'confirm': confirm}
+
+
+def last_closed():
+    """Номер последней закрытой 15м свечи на момент NOW"""
+    return NOW // 900 - 1
+
+
+class FakeSession:
+    """get_kline как у Bybit: от новых к старым, первая — текущая незакрытая"""
+    def __init__(self, last):
+        self.last = last
+        self.calls = []
+
+    def get_kline(self, **params):
+        self.calls.append(params)
+        first = self.last + 1 - params['limit'] + 1
+        rows = [[str(x) for x in bar(i)] for i in range(self.last + 1, first - 1, -1)]
+        return {'retCode': 0, 'result': {'list': rows}}
+
+
+def test_unconfirmed_bars_are_ignored():
+    book = KlineBook(capacity=10)
+    for i in range(5):
+        book.on_kline("BTCUSDT", "15", ws_item(i))
+    book.on_kline("BTCUSDT", "15", ws_item(5, confirm=False))
+    ring = book._rings[("BTCUSDT", "15")]
+    assert ring.count == 5 and ring.last_time == 4 * STEP
+
+
+def test_ring_wraparound_keeps_last_bars_in_order():
+    ring = KlineRing("15", capacity=5)
+    ring.reset([bar(i) for i in range(3)])
+    for i in range(3, 12):
+        ring.append(bar(i))
+    assert not ring.gap and ring.count == 5
+    window = ring.window(5)
+    assert list(window['time_ms']) == [i * STEP for i in range(7, 12)]
+    assert list(ring.window(3)['close']) == [109.0, 110.0, 111.0]
+    # Запрос длиннее буфера отдает все, что есть
+    assert len(ring.window(50)) == 5
+
+
+def test_repeated_bar_overwrites_and_old_bar_is_dropped():
+    ring = KlineRing("15", capacity=5)
+    ring.reset([bar(i) for i in range(4)])
+    ring.append(bar(3, close=555.0))
+    ring.append(bar(1))
+    assert ring.count == 4 and ring.window(1)['close'][-1] == 555.0
+
+
+def test_gap_marks_series_stale_and_hides_window():
+    book = KlineBook(capacity=50, grace=0)
+    last = last_closed()
+    book.store("BTCUSDT", "15", FakeSession(last).get_kline(limit=30)['result']['list'])
+    assert book.is_ready("BTCUSDT", "15", now=NOW)
+    book.on_kline("BTCUSDT", "15", ws_item(last + 2)) # Свеча last + 1 пропущена
+    assert book.stale(["BTCUSDT"], ["15"], now=NOW) == [("BTCUSDT", "15")]
+    assert book.get_window("BTCUSDT", "15", 10).empty
+
+
+def test_backfill_restores_stale_series_with_closed_bars_only():
+    book = KlineBook(capacity=50, grace=0)
+    last = last_closed()
+    session = FakeSession(last)
+    assert book.backfill(session, ["BTCUSDT", "ETHUSDT"], ["15"], now=NOW) == 2
+    assert len(session.calls) == 2
+    window = book.get_window("BTCUSDT", "15", 20)
+    assert len(window) == 20
+    # Незакрытая свеча из ответа REST в окно не попадает
+    assert window['time_ms'][-1] == last * STEP
+    assert book.stale(["BTCUSDT", "ETHUSDT"], ["15"], now=NOW) == []
+    # Готовые серии повторно не грузятся
+    assert book.backfill(session, ["BTCUSDT"], ["15"], now=NOW) == 0 and len(session.calls) == 2
+
+
+def test_lagging_series_fetches_only_missing_bars():
+    book = KlineBook(capacity=500, grace=0, lookback=250)
+    last = last_closed()
+    book.store("BTCUSDT", "15", FakeSession(last - 3).get_kline(limit=300)['result']['list'])
+    session = FakeSession(last)
+    assert book.backfill(session, ["BTCUSDT"], ["15"], now=NOW) == 1
+    # 3 пропущенные свечи, последняя сохраненная для стыковки и текущая незакрытая
+    assert session.calls[0]['limit'] == 5
+    ring = book._rings[("BTCUSDT", "15")]
+    assert ring.count == 302 and not ring.gap and ring.last_time == last * STEP
+    window = book.get_window("BTCUSDT", "15", 302)
+    assert list(window['time_ms']) == [i * STEP for i in range(last - 301, last + 1)]
+
+
+def test_empty_or_broken_series_fetches_strategy_lookback():
+    book = KlineBook(capacity=1000, grace=0, lookback=250)
+    last = last_closed()
+    session = FakeSession(last)
+    book.backfill(session, ["BTCUSDT"], ["15"], now=NOW)
+    assert session.calls[-1]['limit'] == 251
+    # Долгий простой без WS: запрос не глубже lookback
+    assert book.fetch_limit("BTCUSDT", "15", now=NOW + 2000 * 900) == 251
+    book.on_kline("BTCUSDT", "15", ws_item(last + 2)) # Разрыв
+    assert book.fetch_limit("BTCUSDT", "15", now=NOW + 1800) == 251
+
+
+def test_series_behind_the_clock_is_stale():
+    book = KlineBook(capacity=50, grace=0)
+    last = last_closed()
+    book.store("BTCUSDT", "15", FakeSession(last - 1).get_kline(limit=30)['result']['list'])
+    assert not book.is_ready("BTCUSDT", "15", now=NOW)
+    book.on_kline("BTCUSDT", "15", ws_item(last))
+    assert book.is_ready("BTCUSDT", "15", now=NOW)
+
+
+def test_store_keeps_newer_ws_bars_received_during_request():
+    book = KlineBook(capacity=50, grace=0)
+    last = last_closed()
+    for i in range(last - 3, last + 1):
+        book.on_kline("BTCUSDT", "15", ws_item(i))
+    book.store("BTCUSDT", "15", FakeSession(last - 2).get_kline(limit=30)['result']['list'])
+    assert book._rings[("BTCUSDT", "15")].last_time == last * STEP
+    assert book.is_ready("BTCUSDT", "15", now=NOW)
+
+
+def test_ws_manager_feeds_kline_topic_into_book():
+    pytest.importorskip("pybit")
+    from src.ws_manager import WSManager
+
+    class Feed:
+        def kline_stream(self, interval, symbol, callback): self.callback = callback
+
+    ws = WSManager(None, None, ws=Feed())
+    ws.subscribe_klines(["BTCUSDT"], ["15"])
+    for i in range(3):
+        ws.ws.callback({'topic': 'kline.15.BTCUSDT', 'data': [ws_item(i, confirm=False), ws_item(i)]})
+    window = ws.klines._rings[("BTCUSDT", "15")].window(10)
+    assert list(window['time_ms']) == [0, STEP, 2 * STEP]
@@ -0,0 +1,126 @@
+import asyncio
+import threading
+import time
+
+from tests.conftest import FakeSession, PrivateFeed, trade_rows
+
+
+class SlowSession(FakeSession):
+    """REST, который отвечает с задержкой: поток тиков не должен его ждать"""
+    def place_order(self, **params):
+        time.sleep(0.5)
+        return super().place_order(**params)
+
+
+class RejectingStops(FakeSession):
+    def set_trading_stop(self, **params):
+        self.calls.append(('set_trading_stop', params))
+        raise ConnectionError("timeout")
+
+
+def open_long(bot, ticker='ETHUSDT', entry=2000.0, atr=10.0):
+    # Безубыток при entry + 2 ATR = 2020, SL 1900, TP 2200
+    return bot.db.add_trade(ticker, 'trend_15', 'live', 'long', entry, 1900.0, 2200.0, atr, 40.0)
+
+
+def test_tick_only_queues_crossed_trades(make_bot):
+    session = SlowSession()
+    bot = make_bot(session, PrivateFeed())
+    trade_id = open_long(bot)
+
+    start = time.monotonic()
+    bot.on_tick('ETHUSDT', 2010.0) # Ничего не пересекла
+    bot.on_tick('ETHUSDT', 1890.0) # SL
+    assert time.monotonic() - start < 0.2
+    assert session.orders() == [] and len(bot.tick_queue) == 1
+    assert trade_rows(bot)[trade_id]['status'] == 'open'
+
+    bot.process_ticks()
+    assert not bot.tick_queue
+    assert trade_rows(bot)[trade_id]['status'] == 'closed'
+    assert len(session.orders()) == 0 # Позиции в книге нет: выход по REST-снимку (size 0)
+
+
+def test_ticks_are_processed_in_order(make_bot):
+    bot = make_bot(FakeSession(), PrivateFeed())
+    trade_id = open_long(bot)
+    bot.on_tick('ETHUSDT', 2021.0) # Безубыток: стоп переносится на вход
+    bot.on_tick('ETHUSDT', 1999.0) # Пересечен уже новый стоп
+    bot.process_ticks()
+    row = trade_rows(bot)[trade_id]
+    assert row['status'] == 'closed' and row['is_breakeven'] and row['exit_price'] == 1999.0
+    assert bot.tick_waiting == {} and bot.tick_counts == {}
+
+
+def test_monitor_wakes_on_tick_from_socket_thread(make_bot):
+    bot = make_bot(FakeSession(), PrivateFeed())
+    trade_id = open_long(bot)
+
+    async def monitor():
+        await bot.wait_ticks(timeout=0.01) # Первый вызов привязывает цикл событий
+        threading.Timer(0.1, bot.on_tick, ('ETHUSDT', 1890.0)).start()
+        start = time.monotonic()
+        await bot.wait_ticks(timeout=5)
+        woke = time.monotonic() - start
+        await asyncio.to_thread(bot.process_ticks)
+        return woke
+
+    assert asyncio.run(monitor()) < 1
+    assert trade_rows(bot)[trade_id]['status'] == 'closed'
+
+
+def test_reselect_after_close_runs_under_scan_lock(make_bot):
+    bot = make_bot(FakeSession(), PrivateFeed(), params={'reselect_on_close': True})
+    open_long(bot)
+    seen = []
+    bot.select_best_strategy_extended = lambda: seen.append(bot.lock.locked())
+    bot.on_tick('ETHUSDT', 1890.0)
+    bot.process_ticks()
+    assert bot.reselect_pending and seen == []
+
+    asyncio.run(bot.apply_reselect())
+    assert seen == [True] and not bot.reselect_pending
+
+
+def test_confirmed_breakeven_defers_to_exchange_stop(make_bot):
+    feed = PrivateFeed()
+    session = FakeSession()
+    bot = make_bot(session, feed)
+    trade_id = open_long(bot)
+    feed.positions.on_position({'symbol': 'ETHUSDT', 'side': 'Buy', 'size': '0.02', 'entryPrice': '2000', 'seq': 1})
+
+    bot.on_tick('ETHUSDT', 2021.0)
+    bot.on_tick('ETHUSDT', 1999.0)
+    bot.process_ticks()
+    assert [name for name, _ in session.calls].count('set_trading_stop') == 1
+    # Стоп на бирже перенесен: закрытие придет исполнением, своего ордера нет
+    assert session.orders() == [] and trade_rows(bot)[trade_id]['status'] == 'open'
+
+
+def test_unconfirmed_breakeven_is_closed_by_monitor(make_bot, messages):
+    feed = PrivateFeed()
+    session = RejectingStops()
+    bot = make_bot(session, feed)
+    trade_id = open_long(bot)
+    feed.positions.on_position({'symbol': 'ETHUSDT', 'side': 'Buy', 'size': '0.02', 'entryPrice': '2000', 'seq': 1})
+
+    bot.on_tick('ETHUSDT', 2021.0)
+    bot.on_tick('ETHUSDT', 1999.0)
+    bot.process_ticks()
+    assert trade_id not in bot.sl_unconfirmed
+    assert session.orders() == [{'category': 'linear', 'symbol': 'ETHUSDT', 'side': 'Sell', 'orderType': 'Market', 'qty': '0.02', 'reduceOnly': True}]
+    assert trade_rows(bot)[trade_id]['status'] == 'closed'
+    assert "LIVE ЗАКРЫТ" in messages[-1]
+
+
+def test_shutdown_stops_socket_before_writer(make_bot):
+    class ClosingFeed(PrivateFeed):
+        def close(self):
+            self.writer_open = not bot.db.writer._closed
+            self.on_price = None
+
+    feed = ClosingFeed()
+    bot = make_bot(FakeSession(), feed)
+    assert feed.on_price is not None
+    bot.shutdown()
+    assert feed.writer_open and feed.on_price is None and bot.db.writer._closed
@@ -0,0 +1,168 @@
+import pytest
+
+from src.positions import PositionBook
+from tests.conftest import FakeSession, PrivateFeed, trade_rows
+
+
+def position(symbol, side, size, seq, entry='2000'):
+    return {'category': 'linear', 'symbol': symbol, 'side': side, 'size': str(size), 'entryPrice': entry, 'seq': seq}
+
+
+def execution(symbol, exec_id, side, price, qty, stop_type='', exec_type='Trade'):
+    return {'category': 'linear', 'symbol': symbol, 'execId': exec_id, 'execType': exec_type, 'side': side,
+            'execPrice': str(price), 'execQty': str(qty), 'closedSize': str(qty), 'stopOrderType': stop_type, 'execTime': '1700000000000'}
+
+
+def order(symbol, order_id, status, reduce_only=True):
+    return {'category': 'linear', 'symbol': symbol, 'orderId': order_id, 'orderStatus': status, 'reduceOnly': reduce_only}
+
+
+# --- PositionBook ---
+
+@pytest.mark.parametrize("position_first", [False, True])
+def test_book_emits_one_close_at_fill_vwap_in_any_order(position_first):
+    events = []
+    book = PositionBook(on_close=events.append)
+    book.on_position(position('ETHUSDT', 'Buy', 0.5, 1))
+    fills = [execution('ETHUSDT', 'e1', 'Sell', 2100, 0.2, 'TakeProfit'), execution('ETHUSDT', 'e2', 'Sell', 2110, 0.3, 'TakeProfit')]
+    flat = position('ETHUSDT', '', 0, 2)
+    for msg in ([flat] + fills if position_first else fills + [flat]):
+        (book.on_position if msg is flat else book.on_execution)(msg)
+    assert len(events) == 1
+    event = events[0]
+    assert event['symbol'] == 'ETHUSDT' and event['side'] == 'long' and event['qty'] == pytest.approx(0.5)
+    assert event['price'] == pytest.approx((2100 * 0.2 + 2110 * 0.3) / 0.5)
+    assert event['reason'] == "Take Profit (биржа)"
+
+
+def test_book_waits_for_fills_covering_the_whole_position():
+    events = []
+    book = PositionBook(on_close=events.append)
+    book.on_position(position('ETHUSDT', 'Buy', 0.5, 1))
+    book.on_execution(execution('ETHUSDT', 'e1', 'Sell', 2100, 0.2))
+    book.on_position(position('ETHUSDT', '', 0, 2))
+    assert events == []
+    book.on_execution(execution('ETHUSDT', 'e2', 'Sell', 2100, 0.3))
+    assert len(events) == 1
+
+
+def test_book_ignores_duplicate_fills_stale_positions_and_funding():
+    events = []
+    book = PositionBook(on_close=events.append)
+    book.on_position(position('ETHUSDT', 'Buy', 0.5, 5))
+    book.on_position(position('ETHUSDT', 'Buy', 0.1, 4)) # Устаревший seq
+    assert book.size('ETHUSDT') == 0.5
+    book.on_execution(execution('ETHUSDT', 'f1', 'Sell', 2100, 0.5, exec_type='Funding'))
+    book.on_execution(execution('ETHUSDT', 'e1', 'Sell', 2100, 0.25))
+    book.on_execution(execution('ETHUSDT', 'e1', 'Sell', 2100, 0.25)) # Повтор execId
+    book.on_position(position('ETHUSDT', '', 0, 6))
+    assert events == []
+    book.on_execution(execution('ETHUSDT', 'e2', 'Sell', 2100, 0.25))
+    assert len(events) == 1 and events[0]['qty'] == pytest.approx(0.5)
+
+
+def test_book_tracks_active_reduce_only_orders():
+    book = PositionBook()
+    book.on_order(order('BTCUSDT', 'o1', 'New'))
+    book.on_order(order('ETHUSDT', 'o2', 'New', reduce_only=False))
+    assert book.has_closing_order('BTCUSDT') and not book.has_closing_order('ETHUSDT')
+    book.on_order(order('BTCUSDT', 'o1', 'Filled'))
+    assert not book.has_closing_order('BTCUSDT')
+
+
+# --- Orchestrator.on_exchange_close ---
+
+def open_live(bot, ticker, side, entry=2000.0):
+    sl, tp = (entry * 0.95, entry * 1.1) if side == 'long' else (entry * 1.05, entry * 0.9)
+    return bot.db.add_trade(ticker, 'trend_15', 'live', side, entry, sl, tp, 10.0, 40.0)
+
+
+def test_exchange_close_closes_exactly_one_matching_trade(make_bot, messages):
+    feed = PrivateFeed()
+    session = FakeSession(positions=[position('ETHUSDT', 'Buy', 0.5, 1)])
+    bot = make_bot(session, feed)
+    eth_live = open_live(bot, 'ETHUSDT', 'long')
+    eth_paper = bot.db.add_trade('ETHUSDT', 'trend_15', 'paper', 'long', 2000.0, 1900.0, 2200.0, 10.0, 40.0)
+    eth_short = open_live(bot, 'ETHUSDT', 'short')
+    btc_live = open_live(bot, 'BTCUSDT', 'long', entry=90000.0)
+
+    feed.positions.on_execution(execution('ETHUSDT', 'e1', 'Sell', 2100, 0.5, 'TakeProfit'))
+    feed.positions.on_position(position('ETHUSDT', '', 0, 2))
+    # Повторная доставка того же исполнения и позиции
+    feed.positions.on_execution(execution('ETHUSDT', 'e1', 'Sell', 2100, 0.5, 'TakeProfit'))
+    feed.positions.on_position(position('ETHUSDT', '', 0, 2))
+
+    rows = trade_rows(bot)
+    assert rows[eth_live]['status'] == 'closed' and rows[eth_live]['exit_price'] == 2100
+    assert [rows[i]['status'] for i in (eth_paper, eth_short, btc_live)] == ['open'] * 3
+    assert len([m for m in messages if "LIVE ЗАКРЫТ" in m]) == 1
+    # Позиция закрыта биржей: своего ордера нет
+    assert session.orders() == []
+
+
+def test_repeated_close_event_is_ignored(make_bot, messages):
+    feed = PrivateFeed()
+    bot = make_bot(FakeSession(), feed)
+    trade_id = open_live(bot, 'ETHUSDT', 'long')
+    event = {'symbol': 'ETHUSDT', 'side': 'long', 'qty': 0.5, 'price': 1900.0, 'reason': "Stop Loss (биржа)", 'time': 0}
+    bot.on_exchange_close(event)
+    bot.on_exchange_close(event)
+    rows = trade_rows(bot)
+    assert rows[trade_id]['status'] == 'closed' and rows[trade_id]['exit_price'] == 1900.0
+    assert len(messages) == 1
+
+
+def test_failed_exit_order_keeps_trade_open_and_alerts_once(make_bot, messages):
+    feed = PrivateFeed()
+    session = FakeSession()
+    bot = make_bot(session, feed)
+    trade_id = open_live(bot, 'BTCUSDT', 'long', entry=90000.0)
+    feed.positions.on_position(position('BTCUSDT', 'Buy', 0.004, 1, entry='90000'))
+    trade = bot.db.get_open_trades()[0]
+
+    session.fail_orders = True
+    assert not bot.close_and_notify(trade, 90500.0, "TTL Exit")
+    assert not bot.close_and_notify(trade, 90500.0, "TTL Exit")
+    assert trade_rows(bot)[trade_id]['status'] == 'open'
+    assert len(messages) == 1 and "ОШИБКА ВЫХОДА" in messages[0]
+
+    session.fail_orders = False
+    assert bot.close_and_notify(trade, 90500.0, "TTL Exit")
+    assert trade_rows(bot)[trade_id]['status'] == 'closed'
+    assert session.orders()[-1]['reduceOnly'] is True and session.orders()[-1]['qty'] == '0.004'
+    assert "LIVE ЗАКРЫТ" in messages[-1]
+
+
+def test_ws_manager_private_feed_drives_wallet_and_closes():
+    pytest.importorskip("pybit")
+    from src.ws_manager import WSManager
+
+    class Public:
+        def ticker_stream(self, symbol, callback): pass
+
+    class Private:
+        def __init__(self): self.callbacks = {}
+        def wallet_stream(self, callback): self.callbacks['wallet'] = callback
+        def position_stream(self, callback): self.callbacks['position'] = callback
+        def execution_stream(self, callback): self.callbacks['execution'] = callback
+        def order_stream(self, callback): self.callbacks['order'] = callback
+        def push(self, topic, *items): self.callbacks[topic]({'topic': topic, 'data': list(items)})
+
+    private = Private()
+    ws = WSManager('key', 'secret', ws=Public(), private_ws=private)
+    closes = []
+    ws.positions.on_close = closes.append
+
+    private.push('wallet', {'accountType': 'UNIFIED', 'totalEquity': '125.5', 'coin': [{'coin': 'USDT', 'availableToWithdraw': '80'}]})
+    assert ws.get_wallet() == {'equity': 125.5, 'available': 80.0}
+
+    private.push('position', position('ETHUSDT', 'Sell', 0.3, 1))
+    private.push('order', order('ETHUSDT', 'sl1', 'New'))
+    assert ws.positions.has_closing_order('ETHUSDT')
+    private.push('execution', execution('ETHUSDT', 'x1', 'Buy', 2050, 0.3, 'StopLoss'))
+    private.push('execution', execution('ETHUSDT', 'x1', 'Buy', 2050, 0.3, 'StopLoss'))
+    private.push('order', order('ETHUSDT', 'sl1', 'Filled'))
+    private.push('position', position('ETHUSDT', '', 0, 2))
+    assert len(closes) == 1
+    assert closes[0]['side'] == 'short' and closes[0]['price'] == 2050 and closes[0]['reason'] == "Stop Loss (биржа)"
+    assert not ws.positions.has_closing_order('ETHUSDT')
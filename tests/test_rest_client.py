@@ -0,0 +1,138 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from aiohttp import web
+
+from src.rest_client import BybitRestClient, InvalidRequestError, RATE_LIMIT_CODE
+
+
+class Stub:
+    """Локальный HTTP вместо Bybit: ответы по очереди из script, дальше — успех"""
+    def __init__(self, script=()):
+        self.script = list(script)
+        self.hits = []
+
+    async def handle(self, request):
+        self.hits.append((request.method, request.path))
+        step = self.script.pop(0) if self.script else None
+        if step == 'slow':
+            await asyncio.sleep(1.0)
+        elif step == 429:
+            return web.Response(status=429, text="Too Many Requests")
+        elif isinstance(step, dict):
+            return web.json_response(step.get('body'), headers=step.get('headers', {}))
+        return web.json_response({'retCode': 0, 'retMsg': 'OK', 'result': {'list': []}})
+
+
+async def serve(stub):
+    app = web.Application()
+    app.router.add_route('*', '/{tail:.*}', stub.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def run(script, scenario, **client_kw):
+    """Запускает stub и клиент, scenario(client) -> результат"""
+    stub = Stub(script)
+
+    async def main():
+        runner, url = await serve(stub)
+        client = BybitRestClient('key', 'secret', base_url=url, **{'timeout': 0.3, **client_kw})
+        try:
+            return await scenario(client)
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    return asyncio.run(main()), stub
+
+
+def test_rate_limit_code_waits_for_reset_and_retries():
+    reset_ms = int((time.time() + 0.4) * 1000)
+    limited = {'body': {'retCode': RATE_LIMIT_CODE, 'retMsg': 'Too many visits'},
+               'headers': {'X-Bapi-Limit-Reset-Timestamp': str(reset_ms)}}
+
+    async def scenario(client):
+        start = time.monotonic()
+        res = await client.get_tickers(category="linear")
+        return res, time.monotonic() - start
+
+    (res, elapsed), stub = run([limited], scenario)
+    assert res['retCode'] == 0
+    assert len(stub.hits) == 2
+    assert elapsed >= 0.3
+
+
+def test_http_429_backs_off_and_retries():
+    async def scenario(client):
+        return await client.get_kline(category="linear", symbol="BTCUSDT", interval="15", limit=10)
+
+    res, stub = run([429], scenario)
+    assert res['retCode'] == 0 and len(stub.hits) == 2
+
+
+def test_rate_limit_exhausted_returns_payload():
+    limited = {'body': {'retCode': RATE_LIMIT_CODE, 'retMsg': 'Too many visits'}}
+
+    async def scenario(client):
+        return await client.get_tickers(category="linear")
+
+    res, stub = run([limited] * 3, scenario, max_retries=2)
+    assert res['retCode'] == RATE_LIMIT_CODE and len(stub.hits) == 3
+
+
+def test_get_is_retried_on_timeout():
+    async def scenario(client):
+        return await client.get_positions(category="linear", symbol="BTCUSDT")
+
+    res, stub = run(['slow'], scenario)
+    assert res['retCode'] == 0
+    assert stub.hits == [('GET', '/v5/position/list')] * 2
+
+
+def test_post_is_not_retried_on_timeout():
+    async def scenario(client):
+        with pytest.raises(asyncio.TimeoutError):
+            await client.place_order(category="linear", symbol="BTCUSDT", side="Buy", orderType="Market", qty="0.001")
+
+    _, stub = run(['slow'], scenario)
+    assert stub.hits == [('POST', '/v5/order/create')]
+
+
+def test_error_code_raises_like_pybit():
+    rejected = {'body': {'retCode': 110043, 'retMsg': 'leverage not modified'}}
+
+    async def scenario(client):
+        with pytest.raises(InvalidRequestError) as err:
+            await client.set_leverage(category="linear", symbol="BTCUSDT", buyLeverage="3", sellLeverage="3")
+        return err.value
+
+    err, stub = run([rejected], scenario)
+    assert err.status_code == 110043 and "110043" in str(err)
+    assert len(stub.hits) == 1
+
+
+def test_sync_facade_times_out_when_loop_is_stalled():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    client = BybitRestClient('key', 'secret', base_url="http://127.0.0.1:9")
+    asyncio.run_coroutine_threadsafe(client.start(), loop).result(5)
+    try:
+        # Цикл занят синхронной работой: запрос не может даже начаться
+        loop.call_soon_threadsafe(time.sleep, 1.0)
+        start = time.monotonic()
+        with pytest.raises(TimeoutError):
+            client.sync(timeout=0.2).get_tickers(category="linear")
+        assert time.monotonic() - start < 0.9
+    finally:
+        asyncio.run_coroutine_threadsafe(client.close(), loop).result(5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()